@@ -0,0 +1,158 @@
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+from django.utils.deprecation import MiddlewareMixin
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+# The stats of the request being handled, if any
+_current_stats = ContextVar('request_stats', default=None)
+
+# Atomic blocks are savepoints inside tests but plain transactions in production, so they aren't counted
+SAVEPOINT_SQL = re.compile(r'^\s*(SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT)\b', re.I)
+
+# `IN (%s, %s, ...)` lists vary in length with the data, not the code that ran them
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+def fingerprint(sql: str) -> str:
+    """
+    Gets the shape of a query, so the same query run with different parameters (e.g. an N+1) can be spotted.
+
+    :param sql - the query's SQL, with its parameters as placeholders
+    :return the SQL with whitespace collapsed and IN lists shortened
+    """
+    return IN_LIST.sub('IN (...)', ' '.join(sql.split()))
+
+class RequestStats:
+    """The queries and template rendering done while handling one request."""
+    def __init__(self):
+        self.query_count = 0
+        self.query_time = 0.0
+        self.template_time = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        """Times a query - installed on every database connection with `execute_wrapper`."""
+        if SAVEPOINT_SQL.match(sql):
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_time += time.perf_counter() - start
+            self.query_count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    @property
+    def duplicates(self) -> dict[str, int]:
+        """The queries that were run more than once, by fingerprint, with how many times they were run."""
+        return {sql: count for sql, count in self.fingerprints.items() if count > 1}
+
+    @property
+    def duplicate_count(self) -> int:
+        """The number of queries that repeated one already run."""
+        return sum(count - 1 for count in self.duplicates.values())
+
+def query_budget(url_name: str | None) -> int | None:
+    """
+    Gets the most queries a view may run, from `QUERY_BUDGETS`.
+
+    :param url_name - the name of the view's URL
+    :return the budget, or None if the view doesn't have one
+    """
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(url_name)
+
+class QueryInstrumentationMiddleware(MiddlewareMixin):
+    """
+    Middleware that records each request's query count, SQL time, template render time and repeated queries.
+
+    The stats are logged (with a warning if a view goes over its `QUERY_BUDGETS` entry), added to the
+    response as `X-Query-*` headers when `INSTRUMENTATION_HEADERS` is on, and kept on the response as
+    `request_stats` for the test helpers in hackoverflow.testing.
+
+    Supports async views as well, so it doesn't force them onto a worker thread. Both hooks run on the
+    thread the request's queries run on, so the wrappers see them.
+    """
+    def process_request(self, request):
+        stats = RequestStats()
+        wrappers = ExitStack()
+        for connection in connections.all():
+            wrappers.enter_context(connection.execute_wrapper(stats))
+
+        request._instrumentation = (stats, wrappers, time.perf_counter())
+        _current_stats.set(stats)
+
+    def process_response(self, request, response):
+        instrumentation = getattr(request, '_instrumentation', None)
+        if instrumentation is None:
+            return response
+
+        stats, wrappers, start = instrumentation
+        wrappers.close()
+        _current_stats.set(None)
+
+        total_time = time.perf_counter() - start
+        url_name = request.resolver_match.url_name if request.resolver_match else None
+        budget = query_budget(url_name)
+
+        response.request_stats = stats
+        if getattr(settings, 'INSTRUMENTATION_HEADERS', settings.DEBUG):
+            response['X-Query-Count'] = str(stats.query_count)
+            response['X-Query-Time'] = f'{stats.query_time * 1000:.1f}ms'
+            response['X-Template-Time'] = f'{stats.template_time * 1000:.1f}ms'
+            response['X-Duplicate-Queries'] = str(stats.duplicate_count)
+
+        over_budget = budget is not None and stats.query_count > budget
+        logger.log(
+            logging.WARNING if over_budget else logging.INFO,
+            "%s %s (%s): %d queries in %.1fms, templates %.1fms, %d duplicate queries, %.1fms total",
+            request.method, request.path, url_name, stats.query_count, stats.query_time * 1000,
+            stats.template_time * 1000, stats.duplicate_count, total_time * 1000,
+            extra={
+                'url_name': url_name,
+                'query_count': stats.query_count,
+                'query_budget': budget,
+                'query_time': stats.query_time,
+                'template_time': stats.template_time,
+                'duplicate_queries': stats.duplicates,
+                'total_time': total_time,
+            },
+        )
+        return response
+
+class _TimedTemplate:
+    """A template from `InstrumentedTemplates`, which adds its render time to the current request's stats."""
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            stats = _current_stats.get()
+            if stats is not None:
+                stats.template_time += time.perf_counter() - start
+
+class InstrumentedTemplates(DjangoTemplates):
+    """
+    The Django template backend, timing each template it renders for QueryInstrumentationMiddleware.
+
+    Includes and parent templates are rendered as part of the template that uses them, so they're
+    counted once, in its time. Queries run lazily while rendering count towards both.
+    """
+    def from_string(self, template_code):
+        return _TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TimedTemplate(super().get_template(template_name))
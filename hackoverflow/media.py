@@ -0,0 +1,136 @@
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from django.views.decorators.http import require_safe
+from stat import S_ISREG
+from urllib.parse import quote
+import mimetypes
+import os
+import re
+
+RANGE_HEADER = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+def _parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    Parses a single-range `Range` header.
+
+    :param header - the header's value
+    :param size - the file's size in bytes
+    :return the (first, last) byte positions, or None if the range isn't one this view serves
+    :raises ValueError if the range is valid but starts past the end of the file
+    """
+    match = RANGE_HEADER.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        # Malformed or multi-range requests get the whole file, which is always allowed
+        return None
+
+    start, end = match.groups()
+    if start and end and int(end) < int(start):
+        # Not a valid range at all (rather than one outside of the file), so it's ignored like a malformed one
+        return None
+
+    if not start:
+        # A suffix range: the last N bytes
+        first, last = max(size - int(end), 0), size - 1
+    else:
+        first, last = int(start), min(int(end), size - 1) if end else size - 1
+
+    if first >= size:
+        raise ValueError(f"Range {header} not satisfiable for {size} bytes")
+
+    return first, last
+
+def _if_range_matches(request, etag: str, last_modified: int) -> bool:
+    """Checks if a range request's `If-Range` (if any) still matches the file, so a partial response is safe."""
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+
+    return parse_http_date_safe(if_range) == last_modified
+
+def _read_range(path: str, first: int, length: int):
+    """Streams part of a file in chunks."""
+    with open(path, 'rb') as file:
+        file.seek(first)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
+
+def _file_response(request, full_path: str, path: str, size: int, etag: str, last_modified: int) -> HttpResponse:
+    """Builds the response that sends the file's bytes (or has the front-end server send them)."""
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+
+    # The front-end server sends the file, and handles ranges itself
+    if settings.MEDIA_SENDFILE == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = quote(settings.MEDIA_ACCEL_REDIRECT_PREFIX + path)
+        return response
+
+    if settings.MEDIA_SENDFILE == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = full_path
+        return response
+
+    byte_range = None
+    if 'Range' in request.headers and _if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = _parse_range(request.headers['Range'], size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if byte_range is None:
+        response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+    else:
+        first, last = byte_range
+        response = StreamingHttpResponse(_read_range(full_path, first, last - first + 1), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {first}-{last}/{size}'
+        response['Content-Length'] = str(last - first + 1)
+
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+@require_safe
+def serve_media(request, path: str):
+    """
+    View that serves an uploaded file from MEDIA_ROOT, for when there's no front-end server doing it directly.
+
+    Answers conditional requests with a 304 from the file's size and modified time alone, and supports
+    single byte ranges. With `MEDIA_SENDFILE` set, the file itself is handed to the front-end server
+    (`X-Accel-Redirect` for nginx, `X-Sendfile` for Apache/lighttpd) so no worker streams it.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("Media not found")
+
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        raise Http404("Media not found")
+    if not S_ISREG(stat.st_mode):
+        raise Http404("Media not found")
+
+    last_modified = int(stat.st_mtime)
+    etag = quote_etag(f'{stat.st_size:x}-{stat.st_mtime_ns:x}')
+
+    # 304 (or 412) without opening the file
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = _file_response(request, full_path, path, stat.st_size, etag, last_modified)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, public=True, max_age=settings.MEDIA_CACHE_SECONDS)
+    return response
@@ -36,6 +36,9 @@ ALLOWED_HOSTS = []
 # Application definition
 
 INSTALLED_APPS = [
+    # Has to come first, so runserver serves the ASGI app (WebSockets included)
+    'daphne',
+
     'messaging.apps.MessagingConfig',
     'store.apps.StoreConfig',
 
@@ -45,11 +48,14 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'channels',
     'emoji',
     'tinymce'
 ]
 
 MIDDLEWARE = [
+    # First, so every query the other middleware runs is counted too
+    'hackoverflow.instrumentation.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,7 +80,8 @@ ROOT_URLCONF = 'hackoverflow.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Django's backend, with render times recorded for hackoverflow.instrumentation
+        'BACKEND': 'hackoverflow.instrumentation.InstrumentedTemplates',
         'DIRS': [
             BASE_DIR / 'templates'
         ],
@@ -90,7 +97,56 @@ TEMPLATES = [
     },
 ]
 
+# Send each request's query count, SQL time, template time and repeated queries back as X-Query-* headers
+INSTRUMENTATION_HEADERS = DEBUG
+
+# The most queries each view (by URL name) may run for a signed in user, counting session and user lookups - requests over
+# budget are logged as warnings, and fail tests that use hackoverflow.testing.QueryBudgetMixin
+QUERY_BUDGETS = {
+    'inbox': 4,
+    'leaderboard': 3,
+    'leaderboardAroundMe': 7,
+    'conversation': 13,
+    'olderMessages': 4,
+    # A recheck every 5 seconds the long poll waits without being woken, up to its 25 second timeout
+    'messagesSince': 11,
+    'createConvo': 15,
+    'profile': 5,
+    'index': 3,
+    'catalog': 1,
+    'buy': 4,
+    'buy_page': 7,
+    'media': 0,
+}
+
 WSGI_APPLICATION = 'hackoverflow.wsgi.application'
+ASGI_APPLICATION = 'hackoverflow.asgi.application'
+
+# Pushes new messages to open conversation pages - the in-memory layer only works within one process,
+# so use a shared layer (e.g. channels_redis) when running more than one
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    },
+}
+
+# The leaderboard, catalog, rendered messages and profile summaries are cached and invalidated across
+# requests, so every worker process has to share one cache - set REDIS_URL when running more than one.
+# The per-process fallback is only right for a single process (e.g. runserver and tests)
+REDIS_URL = env('REDIS_URL', default=None)
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
 
 
 # Database
@@ -154,6 +210,13 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
 
+# How hackoverflow.media sends uploaded files: unset streams them from Django, 'x-accel-redirect' hands them
+# to nginx (which must serve MEDIA_ACCEL_REDIRECT_PREFIX from MEDIA_ROOT as an internal location) and
+# 'x-sendfile' hands them to Apache/lighttpd
+MEDIA_SENDFILE = env('MEDIA_SENDFILE', default=None)
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+MEDIA_CACHE_SECONDS = 60 * 60 * 24
+
 # Email settings
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = env('EMAIL_HOST')
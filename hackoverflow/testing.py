@@ -0,0 +1,42 @@
+from django.test import Client
+
+from .instrumentation import query_budget
+
+class QueryBudgetClient(Client):
+    """Test client that fails the test when a view runs more queries than its `QUERY_BUDGETS` entry allows."""
+    def request(self, **request):
+        response = super().request(**request)
+        check_query_budget(response)
+        return response
+
+def check_query_budget(response, budget: int | None=None) -> None:
+    """
+    Checks that a view stayed within its query budget.
+
+    :param response - a test client response, from a request QueryInstrumentationMiddleware handled
+    :param budget - (optional) the most queries allowed, instead of the view's `QUERY_BUDGETS` entry
+    :raises AssertionError if the view ran more queries than its budget
+    """
+    stats = getattr(response, 'request_stats', None)
+    if stats is None or response.resolver_match is None:
+        return
+
+    url_name = response.resolver_match.url_name
+    if budget is None:
+        budget = query_budget(url_name)
+    if budget is None or stats.query_count <= budget:
+        return
+
+    repeated = '\n'.join(f'{count}x {sql}' for sql, count in stats.duplicates.items()) or 'none'
+    raise AssertionError(
+        f"{response.request['REQUEST_METHOD']} {response.request['PATH_INFO']} ({url_name}) ran {stats.query_count} queries, "
+        f"over its budget of {budget}. Repeated queries:\n{repeated}"
+    )
+
+class QueryBudgetMixin:
+    """Test case mixin that makes `self.client` enforce every view's query budget."""
+    client_class = QueryBudgetClient
+
+    def assertWithinQueryBudget(self, response, budget: int | None=None):
+        """Asserts that a view stayed within its query budget (or `budget`, if given)."""
+        check_query_budget(response, budget)
@@ -1,9 +1,10 @@
 from django.contrib import admin
 
-from .models import Conversation, Message, Profile, UserGroup
+from .models import Conversation, EmojiWeight, Message, Profile, UserGroup
 
 # Register different models for admin use
 admin.site.register(Conversation)
+admin.site.register(EmojiWeight)
 admin.site.register(Message)
 admin.site.register(Profile)
 admin.site.register(UserGroup)
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
 
 # Identifies 'messaging' as a django app
 class MessagingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'messaging'
+
+    def ready(self):
+        # Connect signal handlers, and register system checks
+        from . import checks, signals
+
+        # Register every app's background job tasks
+        autodiscover_modules('tasks')
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Warns when deploying with a per-process cache, which each worker would fill and invalidate on its own."""
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if backend.endswith(('LocMemCache', 'DummyCache')):
+        return [Warning(
+            "The default cache is per-process, so cached leaderboards, catalogs and messages will differ between workers.",
+            hint="Set REDIS_URL (or configure another shared cache) when running more than one worker process.",
+            id='messaging.W001',
+        )]
+
+    return []
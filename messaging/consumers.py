@@ -0,0 +1,50 @@
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from datetime import datetime
+from django.template.loader import render_to_string
+
+from .models import Conversation
+from .read_markers import mark_read_through
+from .realtime import conversation_group
+
+class ConversationConsumer(AsyncJsonWebsocketConsumer):
+    """
+    WebSocket consumer that pushes a conversation's new messages, and the points they send, to its open pages.
+
+    Only members of the conversation can connect. Each socket renders the message bubble itself, since
+    how a message looks depends on who's reading it.
+    """
+    async def connect(self):
+        self.user = self.scope['user']
+        self.convo_id = self.scope['url_route']['kwargs']['pk']
+
+        if not self.user.is_authenticated or not await self.is_member():
+            await self.close()
+            return
+
+        self.group = conversation_group(self.convo_id)
+        await self.channel_layer.group_add(self.group, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if hasattr(self, 'group'):
+            await self.channel_layer.group_discard(self.group, self.channel_name)
+
+    @database_sync_to_async
+    def is_member(self) -> bool:
+        """Checks if the socket's user is a member of the conversation."""
+        return Conversation.objects.filter(id=self.convo_id, userGroup__members=self.user).exists()
+
+    async def message_new(self, event):
+        """Sends a new message to the page, rendered the same way as the messages already on it."""
+        message = dict(event['message'], created=datetime.fromisoformat(event['message']['created']))
+        html = render_to_string('messaging/message_bubble.html', {'message': message, 'viewer_id': self.user.id})
+        await self.send_json({'type': 'message', 'id': message['id'], 'html': html})
+
+        # The member has the conversation open, so they've now seen it
+        await database_sync_to_async(mark_read_through)(self.user.id, self.convo_id, message['id'])
+
+    async def points_received(self, event):
+        """Lets a recipient know they were just sent points."""
+        if self.user.id in event['recipient_ids']:
+            await self.send_json({'type': 'points', 'sender': event['sender'], 'points': event['points']})
@@ -0,0 +1,34 @@
+from django.core.cache import cache
+import time
+
+def _version_key(convo_id: int) -> str:
+    """Gets the cache key of a conversation's rendered messages' version."""
+    return f'conversation:{convo_id}:render_version'
+
+def conversation_version(convo_id: int) -> int:
+    """
+    Gets the version of a conversation's rendered messages, which is part of their template fragment cache keys.
+
+    New messages don't change it - the list is keyed by the latest message as well - so only changes to
+    messages already sent (or to their senders) have to move it on.
+
+    :param convo_id - the id of the conversation
+    :return the version number
+    """
+    key = _version_key(convo_id)
+    version = cache.get(key)
+    if version is None:
+        # Started from the time rather than 1, so it never goes back to a version that may still have stale fragments
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+
+    return version
+
+def invalidate_conversations(convo_ids) -> None:
+    """Moves conversations' rendered messages on to a new version, after messages in them are edited, re-rendered or re-scored, or a sender is renamed."""
+    for convo_id in set(convo_ids):
+        try:
+            cache.incr(_version_key(convo_id))
+        except ValueError:
+            # Not cached, so the next view starts a new version anyway
+            pass
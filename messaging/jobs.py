@@ -0,0 +1,192 @@
+from contextlib import contextmanager
+from datetime import timedelta
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+import logging
+import threading
+import traceback
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Every function that can be run as a job, by task name
+_tasks = {}
+
+# How often a running job's `locked_at` is refreshed, and how long it can go without one before it's
+# considered abandoned by its worker
+HEARTBEAT_INTERVAL = timedelta(minutes=1)
+STALE_TIMEOUT = timedelta(minutes=10)
+
+def task(name: str):
+    """
+    Decorator that registers a function so it can be run as a background job.
+
+    Tasks live in each app's `tasks` module, which is loaded when the app is ready. Their
+    arguments are stored as JSON, so they should take ids rather than model instances.
+
+    :param name - the name to enqueue the task under
+    """
+    def _register(func):
+        _tasks[name] = func
+        return func
+
+    return _register
+
+def enqueue(task_name: str, run_at=None, max_attempts: int=5, **payload) -> Job:
+    """
+    Queues a task to run in the background.
+
+    The job is written in the current transaction (if any), so workers only see it once that commits.
+
+    :param task_name - the registered name of the task
+    :param run_at - (optional) the earliest time to run the task (defaults to now)
+    :param max_attempts - (optional) the number of tries before the job is marked as failed
+    :param payload - the keyword arguments to call the task with
+    :return the new Job
+    """
+    if task_name not in _tasks:
+        raise ValueError(f"Unknown task: {task_name}")
+
+    return Job.objects.create(task=task_name, payload=payload, run_at=run_at or timezone.now(), max_attempts=max_attempts)
+
+def retry_delay(attempts: int) -> timedelta:
+    """
+    Gets how long to wait before retrying a failed job - doubling each time, up to an hour.
+
+    :param attempts - the number of times the job has been tried
+    :return the time to wait
+    """
+    BASE_DELAY_SECONDS = 10
+    MAX_DELAY_SECONDS = 60 * 60
+    return timedelta(seconds=min(BASE_DELAY_SECONDS * 2 ** (attempts - 1), MAX_DELAY_SECONDS))
+
+def claim_jobs(limit: int=1) -> list[Job]:
+    """
+    Claims due jobs for this worker with `SELECT ... FOR UPDATE SKIP LOCKED`.
+
+    Rows another worker is claiming are skipped instead of waited on, so any number of workers
+    can poll the same table without handing out a job twice.
+
+    :param limit - (optional) the max. number of jobs to claim
+    :return the claimed jobs, now marked as running
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status=Job.PENDING, run_at__lte=now)
+            .order_by('run_at', 'id')[:limit]
+        )
+        Job.objects.filter(id__in=[job.id for job in jobs]).update(status=Job.RUNNING, locked_at=now, attempts=F('attempts') + 1)
+
+    for job in jobs:
+        job.status = Job.RUNNING
+        job.locked_at = now
+        job.attempts += 1
+
+    return jobs
+
+@contextmanager
+def _heartbeat(job: Job):
+    """
+    Context manager that keeps refreshing a running job's `locked_at`, so `requeue_stale_jobs` can tell
+    a job that's taking a while from one whose worker has died.
+
+    :param job - the running job
+    """
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(HEARTBEAT_INTERVAL.total_seconds()):
+                # Only while this claim holds - not if the job's been requeued and claimed again
+                Job.objects.filter(id=job.id, status=Job.RUNNING, attempts=job.attempts).update(locked_at=timezone.now())
+        except Exception:
+            logger.exception("Heartbeat for job %s (%s) stopped", job.id, job.task)
+        finally:
+            # The thread has its own connection, which nothing else will close
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f'job-{job.id}-heartbeat', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+def run_job(job: Job) -> bool:
+    """
+    Runs a claimed job, scheduling a retry (or marking it failed) if it raises.
+
+    :param job - a job from `claim_jobs`
+    :return True if the job succeeded, False if not
+    """
+    try:
+        with _heartbeat(job):
+            _tasks[job.task](**job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status = Job.FAILED
+            logger.error("Job %s (%s) failed for good after %s attempts", job.id, job.task, job.attempts)
+        else:
+            job.status = Job.PENDING
+            job.run_at = timezone.now() + retry_delay(job.attempts)
+            logger.warning("Job %s (%s) failed, retrying at %s", job.id, job.task, job.run_at)
+
+        job.save(update_fields=['status', 'run_at', 'last_error', 'updated'])
+        return False
+
+    job.status = Job.DONE
+    job.save(update_fields=['status', 'updated'])
+    return True
+
+def run_pending(limit: int | None=None) -> int:
+    """
+    Claims and runs due jobs one at a time until there are none left.
+
+    :param limit - (optional) the max. number of jobs to run
+    :return the number of jobs run
+    """
+    ran = 0
+    while limit is None or ran < limit:
+        jobs = claim_jobs()
+        if not jobs:
+            break
+
+        run_job(jobs[0])
+        ran += 1
+
+    return ran
+
+def requeue_stale_jobs(timeout: timedelta=STALE_TIMEOUT) -> int:
+    """
+    Puts jobs back in the queue if the worker running them seems to have died.
+
+    Running jobs' `locked_at` is refreshed every `HEARTBEAT_INTERVAL`, so this is safe to call while
+    other workers are busy - however long their jobs take. An abandoned job counts as a failed attempt,
+    with the same backoff as one that raised, so a job that kills its worker (e.g. running out of
+    memory) ends up failed instead of being retried forever.
+
+    :param timeout - (optional) how long a running job can go without a heartbeat before it's considered abandoned
+    :return the number of jobs requeued or marked as failed
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(Job.objects.select_for_update(skip_locked=True).filter(status=Job.RUNNING, locked_at__lt=now - timeout))
+        for job in jobs:
+            job.last_error = f"The worker running this job stopped (no heartbeat since {job.locked_at.isoformat()})."
+            if job.attempts >= job.max_attempts:
+                job.status = Job.FAILED
+                logger.error("Job %s (%s) failed for good after its worker stopped %s times", job.id, job.task, job.attempts)
+            else:
+                job.status = Job.PENDING
+                job.run_at = now + retry_delay(job.attempts)
+                logger.warning("Job %s (%s) was abandoned by its worker, retrying at %s", job.id, job.task, job.run_at)
+
+        Job.objects.bulk_update(jobs, ['status', 'run_at', 'last_error'])
+
+    return len(jobs)
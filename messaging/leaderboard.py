@@ -0,0 +1,164 @@
+from bisect import insort
+from contextlib import contextmanager
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Count, Q
+import time
+import uuid
+
+from .models import Profile
+
+LEADERBOARD_SIZE = 10
+TOP_CACHE_KEY = 'leaderboard:top'
+HISTOGRAM_CACHE_KEY = 'leaderboard:histogram'
+LOCK_CACHE_KEY = 'leaderboard:lock'
+
+# Cached boards are also rebuilt every so often, in case an update was lost (e.g. a worker dying mid-update)
+LEADERBOARD_TIMEOUT = 10 * 60
+
+# How long an update holds the lock at most (so a dead worker can't keep it), and how long others wait for it
+LOCK_TIMEOUT = 5
+LOCK_WAIT = 1.0
+
+def _sort_key(entry: tuple[int, str, int]) -> tuple[int, str]:
+    """Sorts (user id, username, points) entries by points descending, then username - the same as the database."""
+    return -entry[2], entry[1]
+
+def _public_profiles():
+    """Gets the profiles that have their points public."""
+    return Profile.objects.filter(displayPoints=True)
+
+def top_entries() -> list[tuple[int, str, int]]:
+    """
+    Gets the leaderboard's top users, from the cache when it's warm (no queries) or one query when it's not.
+
+    :return a list of (user id, username, all time points) tuples, best first
+    """
+    entries = cache.get(TOP_CACHE_KEY)
+    if entries is None:
+        entries = list(
+            _public_profiles().order_by('-allTimePoints', 'user__username')
+            .values_list('user', 'user__username', 'allTimePoints')[:LEADERBOARD_SIZE]
+        )
+        cache.set(TOP_CACHE_KEY, entries, LEADERBOARD_TIMEOUT)
+
+    return entries
+
+def top_users() -> list[tuple[User, int]]:
+    """
+    Gets the leaderboard's top users, ready for the leaderboard template.
+
+    :return a list of (user, all time points) tuples, best first - the users only have their id and username
+    """
+    return [(User(id=user_id, username=username), points) for user_id, username, points in top_entries()]
+
+def _points_histogram() -> dict[int, int]:
+    """
+    Gets how many public profiles have each all time points total, with one GROUP BY over the points index on a cache miss.
+
+    :return a dict of points -> number of public profiles with that many points
+    """
+    histogram = cache.get(HISTOGRAM_CACHE_KEY)
+    if histogram is None:
+        rows = _public_profiles().order_by().values('allTimePoints').annotate(count=Count('user'))
+        histogram = {row['allTimePoints']: row['count'] for row in rows}
+        cache.set(HISTOGRAM_CACHE_KEY, histogram, LEADERBOARD_TIMEOUT)
+
+    return histogram
+
+@contextmanager
+def _update_lock():
+    """
+    Context manager that takes the lock on updating the cached top users, waiting up to `LOCK_WAIT` seconds for it.
+
+    :return whether the lock was taken
+    """
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + LOCK_WAIT
+    while not cache.add(LOCK_CACHE_KEY, token, LOCK_TIMEOUT):
+        if time.monotonic() > deadline:
+            yield False
+            return
+
+        time.sleep(0.01)
+
+    try:
+        yield True
+    finally:
+        # Only release it if it hasn't expired and been taken by someone else
+        if cache.get(LOCK_CACHE_KEY) == token:
+            cache.delete(LOCK_CACHE_KEY)
+
+def record_points(recipient_ids: list[int], points: int) -> None:
+    """
+    Updates the cached leaderboard after users were sent points.
+
+    The top users are updated in place, under a lock so concurrent updates can't overwrite each other,
+    and only cost a query if they're cached. All time points only go up, so a user can only move into
+    (or up) the top of the board, never out of it. The points histogram is dropped instead - moving a
+    user between buckets means knowing their points before this transfer, which another transfer
+    committed in between would make wrong.
+
+    :param recipient_ids - the ids of the users who were sent points
+    :param points - the number of points each of them got
+    """
+    cache.delete(HISTOGRAM_CACHE_KEY)
+    if cache.get(TOP_CACHE_KEY) is None:
+        return
+
+    with _update_lock() as locked:
+        if not locked:
+            cache.delete(TOP_CACHE_KEY)
+            return
+
+        # Read again under the lock, so an update made while this one waited isn't overwritten
+        entries = cache.get(TOP_CACHE_KEY)
+        if entries is None:
+            return
+
+        recipients = _public_profiles().filter(user__in=recipient_ids).values_list('user', 'user__username', 'allTimePoints')
+        updated_ids = set(recipient_ids)
+        entries = [entry for entry in entries if entry[0] not in updated_ids]
+        for recipient in recipients:
+            insort(entries, recipient, key=_sort_key)
+
+        cache.set(TOP_CACHE_KEY, entries[:LEADERBOARD_SIZE], LEADERBOARD_TIMEOUT)
+
+def invalidate() -> None:
+    """Drops the cached leaderboard, for changes that can't be applied incrementally (e.g. a profile going private)."""
+    cache.delete_many([TOP_CACHE_KEY, HISTOGRAM_CACHE_KEY])
+
+def rank_around(profile: Profile, radius: int=5) -> tuple[int | None, list[tuple[int, User, int]]]:
+    """
+    Gets a user's leaderboard rank and the users ranked just above and below them.
+
+    The rank comes from the cached points histogram rather than counting the profiles ahead, and the
+    neighbors are two small index scans starting from the user's points.
+
+    :param profile - the profile to rank
+    :param radius - (optional) the number of users to get on each side
+    :return a tuple with the user's rank (None if their points are private) and a list of (rank, user, points) tuples, best first
+    """
+    if not profile.displayPoints:
+        return None, []
+
+    points = profile.allTimePoints
+    username = profile.user.username
+
+    # Everyone with more points is ahead, and so is anyone tied with an earlier username
+    ahead = sum(count for bucket, count in _points_histogram().items() if bucket > points)
+    ahead += _public_profiles().filter(allTimePoints=points, user__username__lt=username).count()
+    rank = ahead + 1
+
+    above = Q(allTimePoints__gt=points) | Q(allTimePoints=points, user__username__lt=username)
+    below = Q(allTimePoints__lt=points) | Q(allTimePoints=points, user__username__gt=username)
+    users_above = list(
+        _public_profiles().filter(above).select_related('user').order_by('allTimePoints', '-user__username')[:radius]
+    )
+    users_below = list(
+        _public_profiles().filter(below).select_related('user').order_by('-allTimePoints', 'user__username')[:radius]
+    )
+
+    nearby = list(reversed(users_above)) + [profile] + users_below
+    first_rank = rank - len(users_above)
+    return rank, [(first_rank + i, nearby_profile.user, nearby_profile.allTimePoints) for i, nearby_profile in enumerate(nearby)]
@@ -0,0 +1,158 @@
+from collections import defaultdict
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.db.models import Max, Q, Sum
+from django.utils import timezone
+from typing import Iterator
+
+from .models import BalanceSnapshot, LedgerEntry, Message, Profile
+
+# The Profile balances the ledger can rebuild - `points` is a daily allowance that gets reset, so
+# sends are recorded for auditing but aren't checked
+BALANCE_FIELDS = ['wallet', 'allTimePoints']
+
+def record_transfer(message: Message, sender: User, recipient_ids: list[int], points_per_recipient: int) -> None:
+    """
+    Records points sent from one user to the other members of a conversation, in one INSERT.
+
+    :param message - the message that sent the points
+    :param sender - the user who sent the points
+    :param recipient_ids - the ids of the users who got the points
+    :param points_per_recipient - the number of points each recipient got
+    """
+    entries = [LedgerEntry(
+        profile_id=sender.id,
+        kind=LedgerEntry.SEND,
+        points=-points_per_recipient * len(recipient_ids),
+        message=message,
+    )]
+    for recipient_id in recipient_ids:
+        entries.append(LedgerEntry(
+            profile_id=recipient_id,
+            kind=LedgerEntry.RECEIVE,
+            wallet=points_per_recipient,
+            allTimePoints=points_per_recipient,
+            message=message,
+        ))
+
+    LedgerEntry.objects.bulk_create(entries)
+
+def record_purchase(purchase) -> None:
+    """
+    Records points spent on a store purchase.
+
+    :param purchase - the store Purchase that was made
+    """
+    LedgerEntry.objects.create(
+        profile_id=purchase.buyer_id,
+        kind=LedgerEntry.PURCHASE,
+        wallet=-purchase.product.point_cost,
+        purchase=purchase,
+    )
+
+def ledger_balances(profile_ids: list[int], through_entry: int | None=None) -> dict[int, dict[str, int]]:
+    """
+    Gets profiles' balances from their latest snapshots plus the ledger entries written after them.
+
+    Takes two queries however many profiles are given.
+
+    :param profile_ids - the ids of the profiles to get balances for
+    :param through_entry - (optional) ignore ledger entries with a higher id than this
+    :return a dict of profile id -> {balance field -> balance}
+    """
+    balances = {profile_id: {field: 0 for field in BALANCE_FIELDS} for profile_id in profile_ids}
+
+    # Start from each profile's latest snapshot
+    latest_ids = BalanceSnapshot.objects.filter(profile_id__in=profile_ids) \
+        .values('profile').annotate(latest=Max('id')).values('latest')
+    through_by_profile = {}
+    for snapshot in BalanceSnapshot.objects.filter(id__in=latest_ids):
+        through_by_profile[snapshot.profile_id] = snapshot.through_entry
+        for field in BALANCE_FIELDS:
+            balances[snapshot.profile_id][field] = getattr(snapshot, field)
+
+    # Snapshots are taken in bulk, so grouping profiles by snapshot keeps the tail query small
+    profiles_by_through = defaultdict(list)
+    for profile_id in profile_ids:
+        profiles_by_through[through_by_profile.get(profile_id, 0)].append(profile_id)
+
+    tail_filter = Q()
+    for through, ids in profiles_by_through.items():
+        tail_filter |= Q(profile_id__in=ids, id__gt=through)
+
+    # Add the entries written since each snapshot
+    tail = LedgerEntry.objects.filter(tail_filter)
+    if through_entry is not None:
+        tail = tail.filter(id__lte=through_entry)
+
+    totals = {f'{field}_total': Sum(field) for field in BALANCE_FIELDS}
+    for row in tail.order_by().values('profile').annotate(**totals):
+        for field in BALANCE_FIELDS:
+            balances[row['profile']][field] += row[f'{field}_total']
+
+    return balances
+
+def snapshot_cutoff(grace: timedelta=timedelta(minutes=5)) -> int:
+    """
+    Gets the id of the newest ledger entry that's safe to include in a snapshot.
+
+    Ids are handed out before transactions commit, so very recent entries are skipped in case an
+    older id is still in flight - they'll be part of the next snapshot instead.
+
+    :param grace - (optional) how old an entry must be to be included
+    :return the id of the newest entry to include (0 if there are none)
+    """
+    latest = LedgerEntry.objects.filter(created__lt=timezone.now() - grace).aggregate(latest=Max('id'))['latest']
+    return latest or 0
+
+def take_snapshots(profile_ids: list[int], through_entry: int) -> int:
+    """
+    Saves new balance snapshots for profiles, in one INSERT.
+
+    :param profile_ids - the ids of the profiles to snapshot
+    :param through_entry - the id of the newest ledger entry to include (see `snapshot_cutoff`)
+    :return the number of snapshots saved
+    """
+    balances = ledger_balances(profile_ids, through_entry=through_entry)
+    snapshots = BalanceSnapshot.objects.bulk_create([
+        BalanceSnapshot(profile_id=profile_id, through_entry=through_entry, **balances[profile_id])
+        for profile_id in profile_ids
+    ])
+
+    return len(snapshots)
+
+def iter_profile_chunks(chunk_size: int) -> Iterator[list[dict]]:
+    """
+    Streams every profile's balances in chunks, walking the primary key so each chunk is one index seek.
+
+    :param chunk_size - the number of profiles in each chunk
+    :return an iterator of lists of {'user', *BALANCE_FIELDS} dicts
+    """
+    last_id = 0
+    while True:
+        chunk = list(
+            Profile.objects.filter(user_id__gt=last_id).order_by('user_id').values('user', *BALANCE_FIELDS)[:chunk_size]
+        )
+        if not chunk:
+            return
+
+        yield chunk
+        last_id = chunk[-1]['user']
+
+def find_mismatches(profiles: list[dict]) -> list[tuple[int, str, int, int]]:
+    """
+    Compares profiles' stored balances with the ledger.
+
+    :param profiles - a chunk from `iter_profile_chunks`
+    :return a list of (profile id, field, ledger balance, stored balance) for every balance that doesn't match
+    """
+    balances = ledger_balances([profile['user'] for profile in profiles])
+
+    mismatches = []
+    for profile in profiles:
+        for field in BALANCE_FIELDS:
+            expected = balances[profile['user']][field]
+            if profile[field] != expected:
+                mismatches.append((profile['user'], field, expected, profile[field]))
+
+    return mismatches
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from messaging.ledger import find_mismatches, iter_profile_chunks
+
+class Command(BaseCommand):
+    """Checks every profile's stored balances against the points ledger."""
+    help = "Checks every profile's wallet and all time points against the points ledger."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Number of profiles to check per batch of queries.")
+
+    def handle(self, *args, **options):
+        checked = 0
+        mismatched = 0
+        for chunk in iter_profile_chunks(options['chunk_size']):
+            checked += len(chunk)
+            for profile_id, field, expected, actual in find_mismatches(chunk):
+                mismatched += 1
+                self.stderr.write(f"Profile {profile_id}: {field} is {actual}, but the ledger says {expected}")
+
+        if mismatched:
+            raise CommandError(f"Found {mismatched} mismatched balance(s) across {checked} profiles.")
+
+        self.stdout.write(self.style.SUCCESS(f"All {checked} profiles match the ledger."))
@@ -0,0 +1,365 @@
+from bisect import bisect
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from functools import partial
+from itertools import accumulate
+import random
+
+from messaging import leaderboard
+from messaging.models import DAILY_POINTS, Conversation, DailyPoints, EmojiWeight, LedgerEntry, Message, Profile, UserGroup, get_member_key
+from messaging.rendering import render_message
+from messaging.scoring import score
+from store.catalog import invalidate_catalog, invalidate_recent_purchasers
+from store.models import Product, Purchase
+
+FIRST_NAMES = ['Michael', 'Dwight', 'Jim', 'Pam', 'Ryan', 'Andy', 'Angela', 'Kevin', 'Oscar', 'Stanley', 'Phyllis', 'Meredith', 'Creed', 'Kelly', 'Toby', 'Erin']
+LAST_NAMES = ['Scott', 'Schrute', 'Halpert', 'Beesly', 'Howard', 'Bernard', 'Martin', 'Malone', 'Martinez', 'Hudson', 'Vance', 'Palmer', 'Bratton', 'Kapoor', 'Flenderson', 'Hannon']
+WORDS = ['thanks', 'great', 'job', 'on', 'the', 'report', 'you', 'are', 'awesome', 'see', 'you', 'at', 'lunch', 'happy', 'friday', 'nice', 'work', 'team', 'so', 'proud', 'of', 'everyone', 'welcome', 'back', 'congrats']
+PRODUCT_COSTS = [10, 25, 50, 100, 250]
+
+def _generated(instance: models.Model) -> models.Model:
+    """Marks a model instance as generated, so `_explicit_timestamps` keeps the timestamps it was given."""
+    instance._explicit_timestamps = True
+    return instance
+
+def _keep_explicit_timestamp(field: models.DateField, pre_save, model_instance: models.Model, add: bool):
+    """A `pre_save` that leaves generated instances' timestamps alone, and stamps everything else as usual."""
+    if getattr(model_instance, '_explicit_timestamps', False):
+        return getattr(model_instance, field.attname)
+
+    return pre_save(model_instance, add)
+
+@contextmanager
+def _explicit_timestamps(*models_to_load):
+    """
+    Lets generated rows keep their own `auto_now`/`auto_now_add` timestamps, which bulk_create would
+    otherwise overwrite with the current time.
+
+    Only instances marked with `_generated` keep theirs, so anything else saved meanwhile (e.g. by
+    another thread) is still stamped with the current time.
+    """
+    fields = [
+        field for model in models_to_load for field in model._meta.concrete_fields
+        if isinstance(field, models.DateField) and (field.auto_now or field.auto_now_add)
+    ]
+    for field in fields:
+        field.pre_save = partial(_keep_explicit_timestamp, field, field.pre_save)
+
+    try:
+        yield
+    finally:
+        for field in fields:
+            # Uncovers the field class' own pre_save again
+            del field.pre_save
+
+def _chunks(items: list, size: int):
+    """Splits a list into lists of at most `size` items."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+class Command(BaseCommand):
+    """
+    Generates a large, reproducible dataset of users, conversations, messages and purchases for scale testing.
+
+    Everything is written with bulk_create in chunks, inside one transaction. Bulk writes skip `save()`
+    and signals, so the denormalized fields are filled in here: conversations' `last_message` and
+    `message_count`, groups' `memberKey`, messages' `body_html`/`preview`, the points ledger (with
+    balances rebuilt from it) and the daily points rollups.
+    """
+    help = "Generates seeded users, power-law sized conversations, emoji messages and purchases, in bulk."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help="Number of users to create.")
+        parser.add_argument('--conversations', type=int, default=None, help="Number of conversations to create (defaults to twice the users).")
+        parser.add_argument('--messages', type=int, default=20000, help="Number of messages to create.")
+        parser.add_argument('--products', type=int, default=20, help="Number of store products to create.")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed - the same seed and options make the same data.")
+        parser.add_argument('--prefix', default='user', help="Prefix of the generated usernames and product names.")
+        parser.add_argument('--password', default='password', help="Password for every generated user.")
+        parser.add_argument('--days', type=int, default=30, help="Number of days, up to --end, the messages are spread over.")
+        parser.add_argument('--end', type=date.fromisoformat, default=None, help="Last day (YYYY-MM-DD) of the data - defaults to now. Give it with --seed to make the same timestamps every run.")
+        parser.add_argument('--max-group-size', type=int, default=50, help="Largest number of members in a conversation.")
+        parser.add_argument('--group-exponent', type=float, default=2.0, help="Power-law exponent of group sizes - higher means more 1:1 conversations.")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Number of rows to insert per query.")
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith=options['prefix']).exists():
+            raise CommandError(f"Users starting with {options['prefix']!r} already exist - pick another --prefix.")
+        if options['users'] < 2:
+            raise CommandError("At least 2 users are needed to make conversations.")
+        if options['group_exponent'] <= 1:
+            raise CommandError("--group-exponent must be more than 1.")
+
+        self.rng = random.Random(options['seed'])
+        self.chunk_size = options['chunk_size']
+        if options['end']:
+            self.end = timezone.make_aware(datetime.combine(options['end'], time(23, 59, 59)))
+        else:
+            self.end = timezone.now()
+        self.start = self.end - timedelta(days=options['days'])
+
+        with transaction.atomic(), _explicit_timestamps(Message, Conversation, LedgerEntry, Purchase):
+            user_ids = self._create_users(options['users'], options['prefix'], options['password'])
+            groups = self._create_conversations(user_ids, options)
+            wallets = self._create_messages(groups, options['messages'])
+            products = self._create_products(options['products'], options['prefix'])
+            purchases = self._create_purchases(user_ids, products, wallets)
+            self._rebuild_balances(user_ids)
+
+        # Bulk writes don't send the signals that keep these caches fresh
+        leaderboard.invalidate()
+        invalidate_catalog()
+        for product in products:
+            invalidate_recent_purchasers(product.id)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {len(user_ids)} users, {len(groups)} conversations, {options['messages']} messages "
+            f"and {purchases} purchases."
+        ))
+
+    def _create_users(self, count: int, prefix: str, password: str) -> list[int]:
+        """Creates users and their profiles, and returns the users' ids in order."""
+        # Hashing is slow on purpose, so every user shares one hash
+        password_hash = make_password(password)
+        stale_day = timezone.localdate() - timedelta(days=1)
+
+        user_ids = []
+        for chunk in _chunks(range(count), self.chunk_size):
+            users = User.objects.bulk_create([
+                User(
+                    username=f'{prefix}{i}',
+                    first_name=self.rng.choice(FIRST_NAMES),
+                    last_name=self.rng.choice(LAST_NAMES),
+                    email=f'{prefix}{i}@example.com',
+                    password=password_hash,
+                    date_joined=self.start,
+                )
+                for i in chunk
+            ])
+            Profile.objects.bulk_create([
+                Profile(
+                    user_id=user.id,
+                    points=DAILY_POINTS,
+                    allowanceDay=stale_day,
+                    displayPoints=self.rng.random() < 0.7,
+                    displayPurchases=self.rng.random() < 0.5,
+                )
+                for user in users
+            ])
+            user_ids.extend(user.id for user in users)
+
+        self.stdout.write(f"Created {len(user_ids)} users.")
+        return user_ids
+
+    def _group_size(self, options, num_users: int) -> int:
+        """Picks a conversation's number of members, from a power law starting at 2 (a 1:1 conversation)."""
+        size = int(2 * self.rng.paretovariate(options['group_exponent'] - 1))
+        return min(size, options['max_group_size'], num_users)
+
+    def _create_conversations(self, user_ids: list[int], options) -> list[tuple[Conversation, list[int]]]:
+        """Creates conversations between distinct groups of users, and returns each with its members' ids."""
+        count = options['conversations'] if options['conversations'] is not None else 2 * len(user_ids)
+        usernames = dict(User.objects.filter(id__in=user_ids).values_list('id', 'username'))
+
+        # Pick each group's members, skipping groups that already exist (mostly repeated 1:1 pairs)
+        member_lists = {}
+        attempts = 0
+        while len(member_lists) < count and attempts < 10 * count:
+            attempts += 1
+            members = self.rng.sample(user_ids, self._group_size(options, len(user_ids)))
+            member_lists.setdefault(get_member_key(members), members)
+
+        groups = []
+        for chunk in _chunks(list(member_lists.items()), self.chunk_size):
+            names = ['-'.join(usernames[member] for member in members) for _, members in chunk]
+            user_groups = UserGroup.objects.bulk_create([
+                UserGroup(name=name, memberKey=key) for name, (key, _) in zip(names, chunk)
+            ])
+            UserGroup.members.through.objects.bulk_create([
+                UserGroup.members.through(usergroup_id=user_group.id, user_id=member)
+                for user_group, (_, members) in zip(user_groups, chunk) for member in members
+            ])
+            conversations = Conversation.objects.bulk_create([
+                _generated(Conversation(name=name, userGroup=user_group, created=self.start, updated=self.start))
+                for name, user_group in zip(names, user_groups)
+            ])
+            groups.extend((conversation, members) for conversation, (_, members) in zip(conversations, chunk))
+
+        self.stdout.write(f"Created {len(groups)} conversations.")
+        return groups
+
+    def _message_body(self, emojis: list[str]) -> str:
+        """Makes a short message, as the editor would send it, with a few emojis in most of them."""
+        words = self.rng.choices(WORDS, k=self.rng.randint(2, 12))
+        if emojis and self.rng.random() < 0.6:
+            words += self.rng.choices(emojis, k=self.rng.randint(1, 3))
+            self.rng.shuffle(words)
+
+        return f"<p>{' '.join(words).capitalize()}</p>"
+
+    def _create_messages(self, groups: list[tuple[Conversation, list[int]]], count: int) -> dict[int, int]:
+        """
+        Creates messages (and their points transfers) spread over the conversations, most of them in a few busy
+        ones, and fills in each conversation's `last_message` and `message_count`, the senders' daily allowances
+        and the daily points rollups.
+
+        :return each user's wallet after the transfers, by user id
+        """
+        emojis = list(EmojiWeight.objects.values_list('emoji', flat=True))
+        wallets = Counter()
+        counts = Counter()
+        # Points sent and received, by (user id, day)
+        sent = Counter()
+        received = Counter()
+        last_messages = {}
+
+        # Like group sizes, how busy a conversation is follows a power law
+        cum_weights = list(accumulate(self.rng.paretovariate(1.2) for _ in groups))
+        span = self.end - self.start
+
+        for chunk in _chunks(range(count), self.chunk_size):
+            new_messages = []
+            senders = []
+            for i in chunk:
+                conversation, members = groups[bisect(cum_weights, self.rng.random() * cum_weights[-1])]
+                sender = self.rng.choice(members)
+                body = self._message_body(emojis)
+                rendered = render_message(body)
+
+                # Every message is a bit newer than the one before, so ids and times agree
+                created = self.start + span * (i + 1) / (count + 1)
+                new_messages.append(_generated(Message(
+                    sender_id=sender,
+                    conversation=conversation,
+                    body=body,
+                    body_html=rendered.html,
+                    preview=rendered.preview,
+                    points=score(rendered.text),
+                    created=created,
+                    updated=created,
+                )))
+                senders.append((sender, members))
+
+            new_messages = Message.objects.bulk_create(new_messages)
+
+            entries = []
+            for message, (sender, members) in zip(new_messages, senders):
+                counts[message.conversation_id] += 1
+                last_messages[message.conversation_id] = message
+
+                # The same rule as sending points for real: all of the recipients or none of them, out of
+                # what's left of the sender's allowance for the day
+                recipients = [member for member in members if member != sender]
+                cost = message.points * len(recipients)
+                day = timezone.localdate(message.created)
+                if not message.points or sent[sender, day] + cost > DAILY_POINTS:
+                    continue
+
+                sent[sender, day] += cost
+                entries.append(_generated(LedgerEntry(
+                    profile_id=sender, kind=LedgerEntry.SEND, points=-cost,
+                    message=message, created=message.created,
+                )))
+                for recipient in recipients:
+                    wallets[recipient] += message.points
+                    received[recipient, day] += message.points
+                    entries.append(_generated(LedgerEntry(
+                        profile_id=recipient, kind=LedgerEntry.RECEIVE, wallet=message.points, allTimePoints=message.points,
+                        message=message, created=message.created,
+                    )))
+
+            LedgerEntry.objects.bulk_create(entries, batch_size=self.chunk_size)
+
+        conversations = []
+        for conversation, _ in groups:
+            if conversation.id in last_messages:
+                conversation.last_message = last_messages[conversation.id]
+                conversation.message_count = counts[conversation.id]
+                conversation.updated = conversation.last_message.created
+                conversations.append(conversation)
+        Conversation.objects.bulk_update(conversations, ['last_message', 'message_count', 'updated'], batch_size=self.chunk_size)
+
+        # Whoever sent points today has only the rest of today's allowance left
+        today = timezone.localdate()
+        Profile.objects.bulk_update([
+            Profile(user_id=sender, points=DAILY_POINTS - points, allowanceDay=today)
+            for (sender, day), points in sent.items() if day == today
+        ], ['points', 'allowanceDay'], batch_size=self.chunk_size)
+
+        # Only the new users' rollups are written, from the transfers above, so everyone else's are left alone
+        DailyPoints.objects.bulk_create([
+            DailyPoints(profile_id=profile_id, day=day, received=received[profile_id, day], sent=sent[profile_id, day])
+            for profile_id, day in sorted(sent.keys() | received.keys())
+        ], batch_size=self.chunk_size)
+
+        self.stdout.write(f"Created {count} messages.")
+        return wallets
+
+    def _create_products(self, count: int, prefix: str) -> list[Product]:
+        """Creates store products, and returns every product (new or not) from most to least popular."""
+        Product.objects.bulk_create([
+            Product(name=f'{prefix} product {i}', point_cost=self.rng.choice(PRODUCT_COSTS), amount_sold=0)
+            for i in range(count)
+        ])
+
+        products = list(Product.objects.order_by('id'))
+        self.rng.shuffle(products)
+        return products
+
+    def _create_purchases(self, user_ids: list[int], products: list[Product], wallets: dict[int, int]) -> int:
+        """Has users buy the products they can afford, popular ones most often, and returns the number of purchases."""
+        if not products:
+            return 0
+
+        # A few products are bought far more than the rest
+        cum_weights = list(accumulate(1 / rank for rank in range(1, len(products) + 1)))
+        sold = Counter()
+        total = 0
+
+        for chunk in _chunks(user_ids, self.chunk_size):
+            purchases = []
+            for user_id in chunk:
+                wanted = {bisect(cum_weights, self.rng.random() * cum_weights[-1]) for _ in range(int(self.rng.paretovariate(1.5)) - 1)}
+                for index in sorted(wanted):
+                    product = products[index]
+                    if wallets[user_id] >= product.point_cost:
+                        wallets[user_id] -= product.point_cost
+                        purchases.append(_generated(Purchase(buyer_id=user_id, product=product, timestamp=self.end)))
+
+            purchases = Purchase.objects.bulk_create(purchases)
+            LedgerEntry.objects.bulk_create([
+                _generated(LedgerEntry(
+                    profile_id=purchase.buyer_id, kind=LedgerEntry.PURCHASE, wallet=-purchase.product.point_cost,
+                    purchase=purchase, created=self.end,
+                ))
+                for purchase in purchases
+            ], batch_size=self.chunk_size)
+
+            sold.update(purchase.product_id for purchase in purchases)
+            total += len(purchases)
+
+        for product_id, amount in sold.items():
+            Product.objects.filter(id=product_id).update(amount_sold=models.F('amount_sold') + amount)
+
+        self.stdout.write(f"Created {total} purchases.")
+        return total
+
+    def _rebuild_balances(self, user_ids: list[int]) -> None:
+        """Sets the new profiles' balances from the ledger, an UPDATE per chunk, so they always match it."""
+        def ledger_total(field: str):
+            totals = LedgerEntry.objects.filter(profile=OuterRef('pk')).order_by().values('profile').annotate(total=Sum(field))
+            return Coalesce(Subquery(totals.values('total')), 0)
+
+        for chunk in _chunks(user_ids, self.chunk_size):
+            Profile.objects.filter(user_id__in=chunk).update(
+                wallet=ledger_total('wallet'),
+                allTimePoints=ledger_total('allTimePoints'),
+            )
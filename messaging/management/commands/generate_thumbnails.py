@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from messaging.jobs import enqueue
+from messaging.models import Profile
+from messaging.thumbnails import generate_thumbnails, needs_thumbnails
+from store.models import Product
+
+class Command(BaseCommand):
+    """Makes the thumbnails of profile and product images uploaded before thumbnails existed."""
+    help = "Generates resized and WebP copies of every profile and product image that doesn't have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=100, help="Number of rows to load per query.")
+        parser.add_argument('--force', action='store_true', help="Regenerate thumbnails that already exist, e.g. after the sizes change.")
+        parser.add_argument('--background', action='store_true', help="Queue a job per image for run_worker instead of resizing here.")
+
+    def handle(self, *args, **options):
+        made = 0
+        for model in [Profile, Product]:
+            images = model.objects.exclude(image='').exclude(image__isnull=True).order_by('pk').only('pk', 'image', 'thumbnails')
+            for instance in images.iterator(chunk_size=options['chunk_size']):
+                if not options['force'] and not needs_thumbnails(instance):
+                    continue
+
+                if options['background']:
+                    enqueue('generate_thumbnails', model=model._meta.label, pk=instance.pk)
+                else:
+                    instance.thumbnails = generate_thumbnails(instance.image)
+                    instance.save(update_fields=['thumbnails'])
+                made += 1
+
+        verb = "Queued thumbnails for" if options['background'] else "Generated thumbnails for"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {made} images."))
@@ -0,0 +1,19 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from messaging.rollups import rebuild_daily_points
+
+class Command(BaseCommand):
+    """Rebuilds the recent daily points rollups from the ledger - meant to be run daily to catch up."""
+    help = "Rebuilds the daily points rollups behind the weekly/monthly leaderboards from the points ledger."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=1, help="Number of days before today to rebuild - today's are still being added to.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Number of rollups to insert per query.")
+
+    def handle(self, *args, **options):
+        since = timezone.localdate() - timedelta(days=options['days'])
+        written = rebuild_daily_points(since, batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} daily points rollups from {since} to yesterday."))
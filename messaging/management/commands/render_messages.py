@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from messaging.fragments import invalidate_conversations
+from messaging.models import Message
+
+class Command(BaseCommand):
+    """Renders the display HTML and preview of messages saved before they were rendered at write time."""
+    help = "Sanitizes and renders message bodies into body_html and preview, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Number of messages to render and update per batch.")
+        parser.add_argument('--all', action='store_true', help="Re-render every message, e.g. after the sanitizer's allowlist changes.")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        messages = Message.objects.all() if options['all'] else Message.objects.filter(body_html='')
+
+        # Walk the primary key so each chunk is one index seek
+        rendered = 0
+        last_id = 0
+        while True:
+            chunk = list(messages.filter(id__gt=last_id).order_by('id').only('id', 'conversation_id', 'body')[:chunk_size])
+            if not chunk:
+                break
+
+            for message in chunk:
+                message.render()
+            Message.objects.bulk_update(chunk, ['body_html', 'preview'])
+            invalidate_conversations(message.conversation_id for message in chunk)
+
+            rendered += len(chunk)
+            last_id = chunk[-1].id
+
+        self.stdout.write(self.style.SUCCESS(f"Rendered {rendered} messages."))
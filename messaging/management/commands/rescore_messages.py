@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from messaging.fragments import invalidate_conversations
+from messaging.models import Message
+from messaging.rendering import render_message
+from messaging.scoring import invalidate_scanner, score
+
+class Command(BaseCommand):
+    """Re-scores every message with the current emoji weights - meant to be run after the weights change."""
+    help = "Recomputes the points of every message from the current emoji weights, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Number of messages to read and update per batch.")
+        parser.add_argument('--dry-run', action='store_true', help="Count the messages that would change without saving them.")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        invalidate_scanner()
+
+        # Walk the primary key so each chunk is one index seek, and only write the messages that changed
+        checked = changed = 0
+        last_id = 0
+        while True:
+            chunk = list(Message.objects.filter(id__gt=last_id).order_by('id').only('id', 'conversation_id', 'body', 'points')[:chunk_size])
+            if not chunk:
+                break
+
+            rescored = []
+            for message in chunk:
+                points = score(render_message(message.body).text)
+                if points != message.points:
+                    message.points = points
+                    rescored.append(message)
+
+            if rescored and not options['dry_run']:
+                Message.objects.bulk_update(rescored, ['points'])
+                invalidate_conversations(message.conversation_id for message in rescored)
+
+            checked += len(chunk)
+            changed += len(rescored)
+            last_id = chunk[-1].id
+
+        verb = "Would re-score" if options['dry_run'] else "Re-scored"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {changed} of {checked} messages."))
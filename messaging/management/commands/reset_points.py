@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from messaging.models import DAILY_POINTS, set_user_points
+
+class Command(BaseCommand):
+    """Resets every user's sendable points in one UPDATE."""
+    help = "Resets every user's sendable points. Daily resets happen on their own - use this to change everyone's allowance at once."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--points', type=int, default=DAILY_POINTS, help="Number of points to give each user.")
+
+    def handle(self, *args, **options):
+        reset = set_user_points(options['points'])
+        self.stdout.write(self.style.SUCCESS(f"Reset {reset} profiles to {options['points']} points."))
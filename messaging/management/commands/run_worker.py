@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+import logging
+import multiprocessing
+import time
+
+from messaging.jobs import HEARTBEAT_INTERVAL, requeue_stale_jobs, run_pending
+
+logger = logging.getLogger(__name__)
+
+def work(sleep: float, burst: bool) -> None:
+    """
+    Runs due background jobs until stopped, regularly requeueing any that a dead worker left running.
+
+    :param sleep - the number of seconds to wait when there's nothing to do
+    :param burst - whether to stop once the queue is empty instead of waiting for more jobs
+    """
+    next_requeue = 0.0
+    try:
+        while True:
+            if time.monotonic() >= next_requeue:
+                requeued = requeue_stale_jobs()
+                if requeued:
+                    logger.warning("Requeued %s jobs from workers that stopped mid-run", requeued)
+                next_requeue = time.monotonic() + HEARTBEAT_INTERVAL.total_seconds()
+
+            if not run_pending() and burst:
+                return
+
+            time.sleep(sleep)
+    except KeyboardInterrupt:
+        pass
+
+class Command(BaseCommand):
+    """Runs background jobs from the database queue."""
+    help = "Runs background jobs from the database queue, in one or more worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help="Number of worker processes to run.")
+        parser.add_argument('--sleep', type=float, default=1.0, help="Seconds to wait between polls when the queue is empty.")
+        parser.add_argument('--burst', action='store_true', help="Exit once the queue is empty.")
+
+    def handle(self, *args, **options):
+        if options['processes'] == 1:
+            work(options['sleep'], options['burst'])
+            return
+
+        # Forked processes can't share the parent's database connections - each opens its own. They're
+        # forked explicitly (not spawned, the default on some platforms) so they start with Django set up
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(target=work, args=(options['sleep'], options['burst']), daemon=True)
+            for _ in range(options['processes'])
+        ]
+        for worker in workers:
+            worker.start()
+
+        self.stdout.write(f"Started {len(workers)} worker processes.")
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from messaging.models import REMINDER_DAYS
+from messaging.jobs import enqueue
+from messaging.reminders import chunked, inactive_users, send_reminders
+
+class Command(BaseCommand):
+    """Emails every user who hasn't sent a message recently."""
+    help = "Emails a reminder to every user who hasn't sent a message recently."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=REMINDER_DAYS, help="Number of days without a message before a user is reminded.")
+        parser.add_argument('--chunk-size', type=int, default=100, help="Number of emails to send at once over a connection.")
+        parser.add_argument('--workers', type=int, default=1, help="Number of mail connections to send over in parallel.")
+        parser.add_argument('--dry-run', action='store_true', help="Only report who would be reminded, without sending anything.")
+        parser.add_argument('--background', action='store_true', help="Queue each chunk as a background job instead of sending now.")
+
+    def handle(self, *args, **options):
+        users = inactive_users(options['days'])
+
+        if options['dry_run']:
+            count = 0
+            for user in users.values('username', 'email', 'last_sent').iterator():
+                count += 1
+                last_sent = user['last_sent'] or 'never'
+                self.stdout.write(f"Would remind {user['username']} <{user['email']}> (last sent a message: {last_sent})")
+
+            self.stdout.write(self.style.SUCCESS(f"{count} users would be reminded."))
+            return
+
+        if options['background']:
+            # Jobs take user ids, so a retried chunk can tell who it already reminded
+            now = timezone.now().isoformat()
+            queued = 0
+            for chunk in chunked(users.values_list('id', flat=True).iterator(), options['chunk_size']):
+                enqueue('send_reminders', user_ids=chunk, queued=now)
+                queued += 1
+
+            self.stdout.write(self.style.SUCCESS(f"Queued {queued} reminder jobs."))
+            return
+
+        recipients = users.values_list('first_name', 'email').iterator()
+        sent = send_reminders(recipients, chunk_size=options['chunk_size'], workers=options['workers'])
+        self.stdout.write(self.style.SUCCESS(f"Sent {sent} reminder emails."))
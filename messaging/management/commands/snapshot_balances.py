@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from messaging.ledger import iter_profile_chunks, snapshot_cutoff, take_snapshots
+
+class Command(BaseCommand):
+    """Saves a ledger balance snapshot for every profile - meant to be run periodically."""
+    help = "Saves a ledger balance snapshot for every profile, so balances only need to add up a short tail of entries."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Number of profiles to snapshot per batch of queries.")
+
+    def handle(self, *args, **options):
+        # Every chunk snapshots through the same entry, which keeps later balance lookups cheap
+        through_entry = snapshot_cutoff()
+
+        saved = 0
+        for chunk in iter_profile_chunks(options['chunk_size']):
+            saved += take_snapshots([profile['user'] for profile in chunk], through_entry)
+
+        self.stdout.write(self.style.SUCCESS(f"Saved {saved} balance snapshots through ledger entry {through_entry}."))
@@ -0,0 +1,22 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db.migrations import AddIndex
+
+class AddIndexConcurrentlyIfSupported(AddIndexConcurrently):
+    """
+    Migration operation that builds an index without locking writes to its table.
+
+    On PostgreSQL this runs `CREATE INDEX CONCURRENTLY`, so the migration using it must set
+    `atomic = False`. Other databases (e.g. SQLite for quick local runs) fall back to a plain
+    `CREATE INDEX`.
+    """
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+        return AddIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+        return AddIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
@@ -0,0 +1,87 @@
+# Generated by Django 4.0.2 on 2026-10-18 10:22
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_conversation_messages(apps, schema_editor):
+    """Fills in the new message counters, and marks existing conversations as read by their members."""
+    Conversation = apps.get_model('messaging', 'Conversation')
+    Message = apps.get_model('messaging', 'Message')
+    ReadMarker = apps.get_model('messaging', 'ReadMarker')
+
+    messages = Message.objects.filter(conversation=OuterRef('pk')).order_by()
+    Conversation.objects.update(
+        message_count=Coalesce(Subquery(messages.values('conversation').annotate(count=Count('id')).values('count')), 0),
+        last_message=Subquery(messages.order_by('-created', '-id').values('id')[:1]),
+    )
+
+    markers = []
+    for convo in Conversation.objects.exclude(userGroup=None).prefetch_related('userGroup__members'):
+        for member in convo.userGroup.members.all():
+            markers.append(ReadMarker(
+                conversation=convo,
+                user=member,
+                last_read_message_id=convo.last_message_id,
+                read_count=convo.message_count,
+            ))
+    ReadMarker.objects.bulk_create(markers, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('messaging', '0002_profile_lastinboxvisit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadMarker',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('read_count', models.IntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.DeleteModel(
+            name='Token',
+        ),
+        migrations.RemoveField(
+            model_name='message',
+            name='read',
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='messaging.message'),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='message_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='readmarker',
+            name='conversation',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='messaging.conversation'),
+        ),
+        migrations.AddField(
+            model_name='readmarker',
+            name='last_read_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='messaging.message'),
+        ),
+        migrations.AddField(
+            model_name='readmarker',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='readmarker',
+            constraint=models.UniqueConstraint(fields=('user', 'conversation'), name='unique_read_marker'),
+        ),
+        migrations.RunPython(backfill_conversation_messages, migrations.RunPython.noop),
+    ]
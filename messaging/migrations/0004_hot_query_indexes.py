@@ -0,0 +1,29 @@
+# Generated by Django 4.0.2 on 2026-10-18 10:25
+
+from django.db import migrations, models
+
+from messaging.migration_operations import AddIndexConcurrentlyIfSupported
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('messaging', '0003_conversation_last_message_readmarker'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyIfSupported(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'created', 'id'], name='message_convo_created_idx'),
+        ),
+        AddIndexConcurrentlyIfSupported(
+            model_name='message',
+            index=models.Index(fields=['sender', 'updated'], name='message_sender_updated_idx'),
+        ),
+        AddIndexConcurrentlyIfSupported(
+            model_name='profile',
+            index=models.Index(fields=['displayPoints', 'allTimePoints'], name='profile_public_points_idx'),
+        ),
+    ]
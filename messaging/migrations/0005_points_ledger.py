@@ -0,0 +1,61 @@
+# Generated by Django 4.0.2 on 2026-10-18 10:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def snapshot_existing_balances(apps, schema_editor):
+    """Starts the ledger from every profile's current balances, since nothing before it was recorded."""
+    Profile = apps.get_model('messaging', 'Profile')
+    BalanceSnapshot = apps.get_model('messaging', 'BalanceSnapshot')
+
+    snapshots = (
+        BalanceSnapshot(profile_id=profile['user'], wallet=profile['wallet'], allTimePoints=profile['allTimePoints'])
+        for profile in Profile.objects.values('user', 'wallet', 'allTimePoints').iterator()
+    )
+    BalanceSnapshot.objects.bulk_create(snapshots, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0003_purchase_indexes'),
+        ('messaging', '0004_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('send', 'Sent points'), ('receive', 'Received points'), ('purchase', 'Store purchase')], max_length=10)),
+                ('points', models.IntegerField(default=0)),
+                ('wallet', models.IntegerField(default=0)),
+                ('allTimePoints', models.IntegerField(default=0)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='messaging.message')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='messaging.profile')),
+                ('purchase', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='store.purchase')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('wallet', models.IntegerField(default=0)),
+                ('allTimePoints', models.IntegerField(default=0)),
+                ('through_entry', models.BigIntegerField(default=0)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to='messaging.profile')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='ledgerentry',
+            index=models.Index(fields=['profile', 'id'], name='ledger_profile_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='balancesnapshot',
+            index=models.Index(fields=['profile', 'id'], name='snapshot_profile_id_idx'),
+        ),
+        migrations.RunPython(snapshot_existing_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.0.2 on 2026-10-18 10:30
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0005_points_ledger'),
+    ]
+
+    operations = [
+        # Existing profiles start with no allowance day, so their allowance refreshes the next time it's spent
+        migrations.AddField(
+            model_name='profile',
+            name='allowanceDay',
+            field=models.DateField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='allowanceDay',
+            field=models.DateField(default=django.utils.timezone.localdate, null=True),
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='points',
+            field=models.IntegerField(default=100),
+        ),
+    ]
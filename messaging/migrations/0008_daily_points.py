@@ -0,0 +1,51 @@
+# Generated by Django 4.0.2 on 2026-10-18 10:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import F, Q, Sum
+from django.db.models.functions import TruncDate
+
+
+def rollup_existing_ledger(apps, schema_editor):
+    """Rolls up the transfers already in the ledger, so the windowed leaderboards start out complete."""
+    LedgerEntry = apps.get_model('messaging', 'LedgerEntry')
+    DailyPoints = apps.get_model('messaging', 'DailyPoints')
+
+    totals = LedgerEntry.objects.annotate(day=TruncDate('created')).values('profile', 'day').annotate(
+        received_total=Sum('allTimePoints', filter=Q(kind='receive')),
+        sent_total=Sum(-F('points'), filter=Q(kind='send')),
+    ).order_by()
+    rollups = (
+        DailyPoints(profile_id=row['profile'], day=row['day'], received=row['received_total'] or 0, sent=row['sent_total'] or 0)
+        for row in totals.iterator()
+    )
+    DailyPoints.objects.bulk_create(rollups, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0007_job_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyPoints',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('received', models.IntegerField(default=0)),
+                ('sent', models.IntegerField(default=0)),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_points', to='messaging.profile')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='dailypoints',
+            index=models.Index(fields=['day', 'profile'], name='daily_points_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailypoints',
+            constraint=models.UniqueConstraint(fields=('profile', 'day'), name='unique_daily_points'),
+        ),
+        migrations.RunPython(rollup_existing_ledger, migrations.RunPython.noop),
+    ]
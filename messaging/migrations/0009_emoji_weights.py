@@ -0,0 +1,29 @@
+# Generated by Django 4.0.2 on 2026-10-18 10:39
+
+from django.db import migrations, models
+
+
+def seed_emoji_weights(apps, schema_editor):
+    """Starts the weights off as the emojis that used to be hard-coded, all worth 10 points."""
+    EmojiWeight = apps.get_model('messaging', 'EmojiWeight')
+    emoji_list = ["🐶", "🐱", "🦋", "🐢", "🦄", "🐰", "🐾", "🦩", "🦈", "🦖"]
+    EmojiWeight.objects.bulk_create([EmojiWeight(emoji=emoji, points=10) for emoji in emoji_list])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0008_daily_points'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmojiWeight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('emoji', models.CharField(max_length=20, unique=True)),
+                ('points', models.IntegerField(default=10)),
+            ],
+        ),
+        migrations.RunPython(seed_emoji_weights, migrations.RunPython.noop),
+    ]
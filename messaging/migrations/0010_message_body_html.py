@@ -0,0 +1,23 @@
+# Generated by Django 4.0.2 on 2026-10-18 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0009_emoji_weights'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='body_html',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='preview',
+            field=models.CharField(blank=True, default='', max_length=53),
+        ),
+    ]
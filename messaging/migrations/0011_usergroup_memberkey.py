@@ -0,0 +1,42 @@
+# Generated by Django 4.0.2 on 2026-10-18 10:46
+
+from collections import defaultdict
+from django.db import migrations, models
+
+import messaging.models
+
+
+def backfill_member_keys(apps, schema_editor):
+    """Keys every existing group by its members - where several groups have the same members, only the oldest gets the key."""
+    UserGroup = apps.get_model('messaging', 'UserGroup')
+    Membership = UserGroup.members.through
+
+    member_ids = defaultdict(list)
+    for group_id, user_id in Membership.objects.values_list('usergroup_id', 'user_id').iterator():
+        member_ids[group_id].append(user_id)
+
+    keyed = []
+    seen_keys = set()
+    for group_id in sorted(member_ids):
+        key = messaging.models.get_member_key(member_ids[group_id])
+        if key not in seen_keys:
+            seen_keys.add(key)
+            keyed.append(UserGroup(id=group_id, memberKey=key))
+
+    UserGroup.objects.bulk_update(keyed, ['memberKey'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0010_message_body_html'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usergroup',
+            name='memberKey',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(backfill_member_keys, migrations.RunPython.noop),
+    ]
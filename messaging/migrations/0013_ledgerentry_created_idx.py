@@ -0,0 +1,21 @@
+# Generated by Django 4.0.2 on 2026-10-18 11:24
+
+from django.db import migrations, models
+
+from messaging.migration_operations import AddIndexConcurrentlyIfSupported
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('messaging', '0012_profile_thumbnails'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyIfSupported(
+            model_name='ledgerentry',
+            index=models.Index(fields=['created'], name='ledger_created_idx'),
+        ),
+    ]
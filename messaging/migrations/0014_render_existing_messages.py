@@ -0,0 +1,40 @@
+# Generated by Django 4.0.2 on 2026-10-18 14:02
+
+from django.db import migrations
+
+import messaging.rendering
+
+
+def render_existing_messages(apps, schema_editor):
+    """Renders the messages saved before 0010, which would otherwise show up blank until `render_messages` was run."""
+    CHUNK_SIZE = 1000
+    Message = apps.get_model('messaging', 'Message')
+    messages = Message.objects.filter(body_html='').order_by('id').only('id', 'body')
+
+    # Walk the primary key so each chunk is one index seek
+    last_id = 0
+    while True:
+        chunk = list(messages.filter(id__gt=last_id)[:CHUNK_SIZE])
+        if not chunk:
+            break
+
+        for message in chunk:
+            rendered = messaging.rendering.render_message(message.body)
+            message.body_html = rendered.html
+            message.preview = rendered.preview
+        Message.objects.bulk_update(chunk, ['body_html', 'preview'])
+
+        last_id = chunk[-1].id
+
+
+class Migration(migrations.Migration):
+    # Each chunk is committed as it's rendered, rather than holding every message's row lock at once
+    atomic = False
+
+    dependencies = [
+        ('messaging', '0013_ledgerentry_created_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(render_existing_messages, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.2 on 2026-10-18 11:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0014_render_existing_messages'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='lastReminded',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
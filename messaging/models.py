@@ -3,8 +3,11 @@ from django.contrib.auth.models import User
 from django.core.mail import send_mail
 from django.db import models
 from django.utils import timezone
+import hashlib
 import os
 
+from .rendering import MESSAGE_PREVIEW_LENGTH, render_message
+
 def get_image_path(profile, filename):
     """
     Gets the system path for an image to display.
@@ -13,30 +16,56 @@ def get_image_path(profile, filename):
     """
     return os.path.join('profile_images', str(profile.user.id), filename)
 
-def set_user_points(num_points):
+# Number of points each user can send per day
+DAILY_POINTS = 100
+
+# Users who haven't sent a message in this many days get a reminder email
+REMINDER_DAYS = 2
+REMINDER_SUBJECT = "Pawsitivity Reminder"
+REMINDER_MESSAGE = "Hi {first_name}! We noticed you haven't sent any messages of positivity lately. We would love to see you again on Pawsitivity!"
+
+def set_user_points(num_points: int=DAILY_POINTS) -> int:
     """
-    Function to be run once every 24 hours that resets points for all users.
+    Function that resets points for all users, as a single UPDATE.
 
-    :param num_points - number of points to give each user
+    Not needed for the daily reset (a stale allowance refreshes itself when it's next spent), but
+    useful to change everyone's allowance at once.
+
+    :param num_points - (optional) number of points to give each user
+    :return the number of profiles reset
     """
-    all_profiles = Profile.objects.all()
-    for profile in all_profiles:
-        profile.points = num_points
-        profile.save()
-    
+    return Profile.objects.update(points=num_points, allowanceDay=timezone.localdate())
+
 class Profile(models.Model):
     """Model controlling a user's profile data."""
     user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
     bio = models.TextField(max_length=200, null=True, blank=True)
     image = models.ImageField(upload_to=get_image_path, null=True)
+    thumbnails = models.JSONField(default=dict, blank=True) # Resized copies of `image` - see messaging.thumbnails
     wallet = models.IntegerField(default=0)
 
     # Note: lowerCamelCase is standard for django model field naming
     displayPoints = models.BooleanField(default=False)
-    points = models.IntegerField(default=0) # Represents points to send to users, specifically
+    points = models.IntegerField(default=DAILY_POINTS) # Represents points to send to users, specifically
+    allowanceDay = models.DateField(default=timezone.localdate, null=True) # The day `points` was last reset
     allTimePoints = models.IntegerField(default=0)
     displayPurchases = models.BooleanField(default=False)
     lastInboxVisit = models.DateField(null=True)
+    lastReminded = models.DateTimeField(null=True, blank=True) # When a reminder job last emailed the user - see messaging.reminders
+
+    class Meta:
+        indexes = [
+            # Leaderboard: public profiles by points
+            models.Index(fields=['displayPoints', 'allTimePoints'], name='profile_public_points_idx'),
+        ]
+
+    @property
+    def sendable_points(self) -> int:
+        """The number of points the user can send right now - an allowance from before today counts as reset."""
+        if self.allowanceDay != timezone.localdate():
+            return DAILY_POINTS
+
+        return self.points
 
     def _has_sent_message_recently(self, time_to_check: timedelta) -> bool:
         """
@@ -62,14 +91,13 @@ class Profile(models.Model):
 
         :return 0 if the message failed, or 1 if successful (1 message was sent)
         """
-        DAYS_TO_CHECK = 2
-        recent = self._has_sent_message_recently(timedelta(days=DAYS_TO_CHECK))
+        recent = self._has_sent_message_recently(timedelta(days=REMINDER_DAYS))
 
         status = 0
         if not recent:
             status = send_mail(
-                subject="Pawsitivity Reminder",
-                message=f"Hi {self.user.first_name}! We noticed you haven't sent any messages of positivity lately. We would love to see you again on Pawsitivity!",
+                subject=REMINDER_SUBJECT,
+                message=REMINDER_MESSAGE.format(first_name=self.user.first_name),
                 from_email=None,
                 recipient_list=[self.user.email],
                 fail_silently=False
@@ -81,11 +109,24 @@ class Profile(models.Model):
         name = self.user.username
         return name
     
+def get_member_key(user_ids) -> str:
+    """
+    Gets the canonical key for a set of users, the same whatever order they're given in.
+
+    :param user_ids - the ids of the users
+    :return a hex SHA-256 digest of the sorted, de-duplicated ids
+    """
+    canonical = ','.join(str(user_id) for user_id in sorted(set(user_ids)))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
 class UserGroup(models.Model):
     """A connection between users for a conversation."""
     name = models.TextField(max_length=400)
     members = models.ManyToManyField(User, related_name='members')
 
+    # `get_member_key` of the members, so a group can be found from its members with one indexed lookup
+    memberKey = models.CharField(max_length=64, unique=True, null=True, blank=True)
+
 class Conversation(models.Model):
     """Model controlling the entire set of messages sent back-and-forth between users."""
     name = models.TextField(max_length=400, default="Conversation")
@@ -93,6 +134,10 @@ class Conversation(models.Model):
     updated = models.DateTimeField(auto_now=True)
     created = models.DateTimeField(auto_now_add=True)
 
+    # Denormalized info about the conversation's messages, maintained by `Message.save`
+    last_message = models.ForeignKey('Message', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    message_count = models.IntegerField(default=0)
+
     class Meta:
         # Show the most recently updated conversations first
         ordering = ['-updated', '-created']
@@ -105,12 +150,195 @@ class Message(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     body = models.TextField()
 
+    # The body sanitized and rendered for display, and a plain text preview of it - see `render`
+    body_html = models.TextField(blank=True, default='')
+    preview = models.CharField(max_length=MESSAGE_PREVIEW_LENGTH + 3, blank=True, default='')
+
     # Track the number of token points in the message, if applicable
     points = models.IntegerField(default=0)
 
     class Meta:
         # Show the most recently updated messages last
         ordering = ['updated', 'created']
+        indexes = [
+            # Conversation pages: a conversation's messages by (created, id)
+            models.Index(fields=['conversation', 'created', 'id'], name='message_convo_created_idx'),
+            # A user's most recently sent message
+            models.Index(fields=['sender', 'updated'], name='message_sender_updated_idx'),
+        ]
+
+    def render(self) -> str:
+        """
+        Renders the body into `body_html` and `preview`, so views never have to.
+
+        :return the body's plain text
+        """
+        rendered = render_message(self.body)
+        self.body_html = rendered.html
+        self.preview = rendered.preview
+        return rendered.text
+
+    def save(self, *args, **kwargs):
+        """Saves the message, rendering it if it hasn't been, and points its conversation at it if it's a new message."""
+        if not self.body_html:
+            self.render()
+
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+
+        if adding:
+            # One UPDATE keeps the conversation's counters right, even with concurrent senders
+            Conversation.objects.filter(id=self.conversation_id).update(
+                last_message=self,
+                message_count=models.F('message_count') + 1,
+                updated=timezone.now(),
+            )
 
     def __str__(self):
         return self.body[:50] + '...'
+
+class ReadMarker(models.Model):
+    """
+    Model tracking how far a member has read into a conversation.
+
+    A member's unread count is the conversation's `message_count` minus `read_count`,
+    so it never needs to count `Message` rows.
+    """
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    last_read_message = models.ForeignKey(Message, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    read_count = models.IntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # Also serves as the index for looking up a user's markers
+            models.UniqueConstraint(fields=['user', 'conversation'], name='unique_read_marker'),
+        ]
+
+class LedgerEntry(models.Model):
+    """
+    Model recording one change to a profile's point balances.
+
+    The ledger is append-only: entries are never edited or deleted, so any balance can be rebuilt
+    (and checked) from them. Each balance column holds the change to the matching `Profile` column.
+    """
+    SEND = 'send'
+    RECEIVE = 'receive'
+    PURCHASE = 'purchase'
+    KIND_CHOICES = [
+        (SEND, 'Sent points'),
+        (RECEIVE, 'Received points'),
+        (PURCHASE, 'Store purchase'),
+    ]
+
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='ledger_entries')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    points = models.IntegerField(default=0)
+    wallet = models.IntegerField(default=0)
+    allTimePoints = models.IntegerField(default=0)
+
+    # What caused the change, if it still exists
+    message = models.ForeignKey(Message, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    purchase = models.ForeignKey('store.Purchase', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # A profile's entries after its latest snapshot
+            models.Index(fields=['profile', 'id'], name='ledger_profile_id_idx'),
+            # Rebuilding the daily rollups for a range of days
+            models.Index(fields=['created'], name='ledger_created_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        """Saves a new entry - existing entries can't be changed."""
+        if not self._state.adding:
+            raise ValueError("Ledger entries are append-only and can't be changed.")
+
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        """Ledger entries are append-only and can't be deleted."""
+        raise ValueError("Ledger entries are append-only and can't be deleted.")
+
+    def __str__(self):
+        return f"{self.profile}: {self.kind}"
+
+class BalanceSnapshot(models.Model):
+    """
+    Model saving a profile's ledger balances, counting every entry with an id up to `through_entry`.
+
+    A current balance is the latest snapshot plus the entries written after it.
+    """
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='balance_snapshots')
+    wallet = models.IntegerField(default=0)
+    allTimePoints = models.IntegerField(default=0)
+    through_entry = models.BigIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # A profile's latest snapshot
+            models.Index(fields=['profile', 'id'], name='snapshot_profile_id_idx'),
+        ]
+
+class Job(models.Model):
+    """Model for a unit of background work, claimed and run by `manage.py run_worker`."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Workers claim the oldest pending jobs that are due
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.task} ({self.status})"
+
+class DailyPoints(models.Model):
+    """Model rolling up the points a profile received and sent on one day, for time-windowed leaderboards."""
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='daily_points')
+    day = models.DateField()
+    received = models.IntegerField(default=0)
+    sent = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['profile', 'day'], name='unique_daily_points'),
+        ]
+        indexes = [
+            # Windowed leaderboards: every rollup since a given day
+            models.Index(fields=['day', 'profile'], name='daily_points_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.profile}: {self.day}"
+
+class EmojiWeight(models.Model):
+    """Model for how many points an emoji is worth when it's sent in a message."""
+    emoji = models.CharField(max_length=20, unique=True)
+    points = models.IntegerField(default=10)
+
+    def __str__(self):
+        return f"{self.emoji}: {self.points}"
@@ -0,0 +1,65 @@
+import base64
+from datetime import datetime
+from django.db.models import Q, QuerySet
+
+def encode_cursor(timestamp: datetime, pk: int) -> str:
+    """
+    Encodes a (timestamp, id) pair as an opaque, URL-safe cursor.
+
+    :param timestamp - the ordering timestamp of the last row on a page
+    :param pk - the id of the last row on a page, used to break ties
+    :return the cursor as a str
+    """
+    raw = f"{timestamp.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str | None) -> tuple[datetime, int] | None:
+    """
+    Decodes a cursor made by `encode_cursor`.
+
+    :param cursor - the cursor to decode (can be None or empty)
+    :return a (timestamp, id) tuple, or None if the cursor is missing or malformed
+    """
+    if not cursor:
+        return None
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        timestamp, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(timestamp), int(pk)
+    except ValueError:
+        return None
+
+def keyset_page(queryset: QuerySet, field: str, cursor: str | None, page_size: int, descending: bool=False) -> tuple[list, str | None]:
+    """
+    Gets one page of a queryset using keyset (cursor) pagination on `(field, id)`.
+
+    Unlike OFFSET pagination, the cost of a page only depends on `page_size`, since the
+    database can seek straight to the cursor through an index on `(field, id)`.
+
+    :param queryset - the rows to paginate
+    :param field - the timestamp field to order by
+    :param cursor - (optional) the cursor returned for the previous page
+    :param page_size - the max. number of rows to return
+    :param descending - (optional) whether to walk from the newest rows to the oldest
+    :return a tuple with the page's rows and the cursor for the next page (None if it's the last page)
+    """
+    position = decode_cursor(cursor)
+    if position:
+        timestamp, pk = position
+        if descending:
+            queryset = queryset.filter(Q(**{f'{field}__lt': timestamp}) | Q(**{field: timestamp, 'id__lt': pk}))
+        else:
+            queryset = queryset.filter(Q(**{f'{field}__gt': timestamp}) | Q(**{field: timestamp, 'id__gt': pk}))
+
+    prefix = '-' if descending else ''
+    # Grab one extra row to know if there's another page without a COUNT
+    rows = list(queryset.order_by(f'{prefix}{field}', f'{prefix}id')[:page_size + 1])
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, field), last.id)
+
+    return rows, next_cursor
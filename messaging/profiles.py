@@ -0,0 +1,51 @@
+from django.core.cache import cache
+
+from .models import Profile
+from store.catalog import catalog_products
+from store.models import Product, Purchase
+
+# Summaries are dropped whenever what's in them changes, so this only bounds how long unused ones linger
+PROFILE_SUMMARY_TIMEOUT = 60 * 60
+
+def _summary_key(profile_id: int) -> str:
+    """Gets the cache key of a profile's summary."""
+    return f'profile:summary:{profile_id}'
+
+def profile_summary(profile: Profile) -> dict:
+    """
+    Gets what a profile page shows besides the profile itself, from the cache when it's warm or one query when it's not.
+
+    Owned products are kept as ids and looked up in the cached catalog (see `owned_products`), so an edited
+    product shows up without dropping every summary that has it.
+
+    :param profile - the profile to summarize
+    :return a dict with the 'purchase_count', the owned 'product_ids' (oldest purchase first) and the
+    'allTimePoints' and 'wallet' totals
+    """
+    key = _summary_key(profile.user_id)
+    summary = cache.get(key)
+    if summary is None:
+        product_ids = list(Purchase.objects.filter(buyer_id=profile.user_id).order_by('id').values_list('product', flat=True))
+        summary = {
+            'purchase_count': len(product_ids),
+            'product_ids': product_ids,
+            'allTimePoints': profile.allTimePoints,
+            'wallet': profile.wallet,
+        }
+        cache.set(key, summary, PROFILE_SUMMARY_TIMEOUT)
+
+    return summary
+
+def owned_products(summary: dict) -> list[Product]:
+    """
+    Gets the products in a profile's summary from the cached catalog, instead of querying them one at a time.
+
+    :param summary - the profile's summary, from `profile_summary`
+    :return a list of products, in the summary's order
+    """
+    products_by_id = {product.id: product for product in catalog_products()}
+    return [products_by_id[product_id] for product_id in summary['product_ids'] if product_id in products_by_id]
+
+def invalidate_profile_summaries(profile_ids: list[int]) -> None:
+    """Drops profiles' cached summaries, after a purchase, a profile update or points being sent to them."""
+    cache.delete_many([_summary_key(profile_id) for profile_id in profile_ids])
@@ -0,0 +1,41 @@
+from django.utils import timezone
+
+from .models import Conversation, ReadMarker
+
+def mark_read(user_id: int, convo: Conversation) -> None:
+    """
+    Moves a member's read marker up to a conversation's latest message.
+
+    Viewing a conversation with nothing new in it is the common case, so the marker is only written
+    when it's behind, and only created the first time the member reads the conversation.
+
+    :param user_id - the id of the member who read the conversation
+    :param convo - the conversation, with its current `message_count` and `last_message_id`
+    """
+    if not convo.message_count:
+        # Nothing to read, and a missing marker already counts as nothing unread
+        return
+
+    behind = ReadMarker.objects.filter(user_id=user_id, conversation=convo, read_count__lt=convo.message_count)
+    if behind.update(last_read_message_id=convo.last_message_id, read_count=convo.message_count, updated=timezone.now()):
+        return
+
+    # Either it's already up to date or this is the member's first visit
+    ReadMarker.objects.get_or_create(
+        user_id=user_id,
+        conversation=convo,
+        defaults={'last_read_message_id': convo.last_message_id, 'read_count': convo.message_count},
+    )
+
+def mark_read_through(user_id: int, convo_id: int, message_id: int) -> None:
+    """
+    Marks a conversation as read for a member who was just shown its messages live, on an open page.
+
+    :param user_id - the id of the member
+    :param convo_id - the id of the conversation
+    :param message_id - the id of the newest message they were shown - if it isn't the conversation's
+    latest, the rest are still on their way and the marker is moved once they've arrived
+    """
+    convo = Conversation.objects.filter(id=convo_id).only('id', 'message_count', 'last_message_id').first()
+    if convo is not None and convo.last_message_id == message_id:
+        mark_read(user_id, convo)
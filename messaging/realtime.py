@@ -0,0 +1,57 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+from .models import Message
+
+def conversation_group(convo_id: int) -> str:
+    """Gets the name of the channel layer group every open socket on a conversation joins."""
+    return f'conversation-{convo_id}'
+
+def serialize_message(message: Message) -> dict:
+    """
+    Gets the fields the message bubble template needs, in a form that can go over the channel layer.
+
+    :param message - the message to send, with its sender
+    :return a dict shaped like the message for the template, with the timestamp as an ISO string
+    """
+    return {
+        'id': message.id,
+        'sender': {
+            'id': message.sender.id,
+            'username': message.sender.username,
+            'first_name': message.sender.first_name,
+        },
+        'body_html': message.body_html,
+        'points': message.points,
+        'created': message.created.isoformat(),
+    }
+
+def broadcast_message(message: Message, recipient_ids: list[int]) -> None:
+    """
+    Pushes a new message, and the points it sent, to everyone with the conversation open.
+
+    Sent once the transaction commits, so nobody is told about a message that got rolled back.
+
+    :param message - the new message
+    :param recipient_ids - the ids of the users who got its points (empty if none were sent)
+    """
+    event = {'type': 'message.new', 'message': serialize_message(message)}
+    points_event = {
+        'type': 'points.received',
+        'sender': message.sender.username,
+        'recipient_ids': recipient_ids,
+        'points': message.points,
+    }
+
+    def send():
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+
+        group = conversation_group(message.conversation_id)
+        async_to_sync(channel_layer.group_send)(group, event)
+        if recipient_ids:
+            async_to_sync(channel_layer.group_send)(group, points_event)
+
+    transaction.on_commit(send)
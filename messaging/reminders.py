@@ -0,0 +1,130 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Max, Q, QuerySet
+from django.utils import timezone
+from itertools import islice
+from queue import Full, Queue
+from typing import Iterable, Iterator
+
+from .models import REMINDER_DAYS, REMINDER_MESSAGE, REMINDER_SUBJECT, Profile
+
+def inactive_users(days: int=REMINDER_DAYS) -> QuerySet:
+    """
+    Gets every user with a profile who hasn't sent a message recently, in one aggregate query.
+
+    :param days - (optional) the number of days that counts as "recently"
+    :return a queryset of users, annotated with when they last sent a message (`last_sent`, None if never)
+    """
+    cutoff = timezone.now() - timedelta(days=days)
+    return User.objects.filter(profile__isnull=False) \
+        .exclude(email='') \
+        .annotate(last_sent=Max('message__updated')) \
+        .filter(Q(last_sent__lt=cutoff) | Q(last_sent__isnull=True)) \
+        .order_by('id')
+
+def build_reminder(first_name: str, email: str) -> EmailMessage:
+    """
+    Builds the reminder email for one user.
+
+    :param first_name - the user's first name
+    :param email - the user's email address
+    :return the email, ready to send
+    """
+    return EmailMessage(subject=REMINDER_SUBJECT, body=REMINDER_MESSAGE.format(first_name=first_name), to=[email])
+
+def chunked(items: Iterable, chunk_size: int) -> Iterator[list]:
+    """Splits an iterable into lists of up to `chunk_size` items, without loading it all at once."""
+    iterator = iter(items)
+    while chunk := list(islice(iterator, chunk_size)):
+        yield chunk
+
+def send_reminder_chunk(user_ids: list[int], since) -> int:
+    """
+    Sends reminder emails to a chunk of users over one connection, marking each one as reminded as soon as it's sent.
+
+    A retried or requeued chunk skips the users it already reached instead of emailing them again - only
+    an email sent right before its worker died can go out twice.
+
+    :param user_ids - the ids of the users to remind
+    :param since - when the reminders were queued - users reminded after this are skipped
+    :return the number of emails sent
+    """
+    users = User.objects.filter(id__in=user_ids).exclude(profile__lastReminded__gte=since).order_by('id') \
+        .values_list('id', 'first_name', 'email')
+
+    sent = 0
+    with get_connection() as connection:
+        for user_id, first_name, email in users:
+            sent += connection.send_messages([build_reminder(first_name, email)]) or 0
+            Profile.objects.filter(user_id=user_id).update(lastReminded=timezone.now())
+
+    return sent
+
+def send_reminders(recipients: Iterable[tuple[str, str]], chunk_size: int=100, workers: int=1) -> int:
+    """
+    Sends reminder emails in chunks, with each worker reusing a single connection for all of its chunks.
+
+    :param recipients - (first name, email) pairs to remind
+    :param chunk_size - (optional) the number of emails to hand to the mail backend at once
+    :param workers - (optional) the number of connections to send over in parallel
+    :return the number of emails sent
+    """
+    chunks = Queue(maxsize=workers * 2)
+
+    # Connect up front, so a mail server that's down fails here instead of leaving the queue with no one draining it
+    connections = []
+    try:
+        for _ in range(workers):
+            connection = get_connection()
+            connection.open()
+            connections.append(connection)
+    except Exception:
+        for connection in connections:
+            connection.close()
+        raise
+
+    def _send_chunks(connection) -> int:
+        """Sends chunks from the queue over one connection until told to stop."""
+        sent = 0
+        error = None
+        with connection:
+            while (chunk := chunks.get()) is not None:
+                # Keep draining after a failure, so the producer never blocks on a full queue
+                if error:
+                    continue
+
+                try:
+                    sent += connection.send_messages(chunk) or 0
+                except Exception as e:
+                    error = e
+
+        if error:
+            raise error
+
+        return sent
+
+    def _put(item) -> None:
+        """Queues an item for the workers, giving up if they've all stopped, since nothing would ever take it."""
+        while True:
+            try:
+                chunks.put(item, timeout=1)
+                return
+            except Full:
+                if all(future.done() for future in futures):
+                    for future in futures:
+                        future.result()
+                    raise RuntimeError("Every reminder worker stopped before the reminders were queued.")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_send_chunks, connection) for connection in connections]
+        try:
+            for chunk in chunked(recipients, chunk_size):
+                _put([build_reminder(first_name, email) for first_name, email in chunk])
+        finally:
+            # Tell each worker there's nothing left, even if building the reminders failed
+            for _ in futures:
+                _put(None)
+
+        return sum(future.result() for future in futures)
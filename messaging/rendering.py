@@ -0,0 +1,154 @@
+import re
+from emoji import Emoji
+from html import escape
+from html.parser import HTMLParser
+from typing import NamedTuple
+
+# Tags TinyMCE can produce that are kept, and the attributes kept on them
+ALLOWED_TAGS = {
+    'a': {'href', 'title'},
+    'b': set(),
+    'blockquote': set(),
+    'br': set(),
+    'code': set(),
+    'em': set(),
+    'i': set(),
+    'li': set(),
+    'ol': set(),
+    'p': set(),
+    'pre': set(),
+    's': set(),
+    'span': {'style'},
+    'strong': set(),
+    'u': set(),
+    'ul': set(),
+}
+VOID_TAGS = {'br'}
+
+# Tags whose content is dropped along with them, not just the tag
+DROPPED_CONTENT_TAGS = {'script', 'style', 'iframe', 'object', 'embed', 'template'}
+
+# Tags that start a new line of text, so words either side of them don't run together in the preview
+BLOCK_TAGS = {'blockquote', 'br', 'li', 'p', 'pre'}
+
+SAFE_URL_SCHEMES = ('http://', 'https://', 'mailto:')
+
+# Only the text colors from TinyMCE's textcolor plugin are kept from inline styles
+STYLE_PROPERTIES = {'color', 'background-color'}
+STYLE_VALUE = re.compile(r'^(#[0-9a-f]{3,8}|rgba?\([0-9.,\s%]+\)|[a-z]+)$', re.I)
+
+MESSAGE_PREVIEW_LENGTH = 50
+
+class RenderedMessage(NamedTuple):
+    """A message body rendered for display."""
+    html: str
+    text: str
+    preview: str
+
+class _MessageSanitizer(HTMLParser):
+    """
+    Parser that rebuilds a message body from an allowlist of tags and attributes.
+
+    Everything else is dropped, text is escaped, emoji short codes are swapped for their images
+    and tags left open are closed, so the output is always safe to print as-is.
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.html = []
+        self.text = []
+        self.open_tags = []
+        self.dropping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROPPED_CONTENT_TAGS:
+            self.dropping += 1
+            return
+
+        if self.dropping or tag not in ALLOWED_TAGS:
+            return
+
+        if tag in BLOCK_TAGS:
+            self.text.append(' ')
+
+        kept = ''.join(f' {name}="{escape(value)}"' for name, value in self._clean_attrs(tag, attrs))
+        self.html.append(f'<{tag}{kept}>')
+        if tag not in VOID_TAGS:
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag in ALLOWED_TAGS and tag not in VOID_TAGS and not self.dropping:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROPPED_CONTENT_TAGS:
+            self.dropping = max(self.dropping - 1, 0)
+            return
+
+        # Ignore end tags that were never opened, and close anything left open inside this one
+        if self.dropping or tag not in self.open_tags:
+            return
+
+        while self.open_tags:
+            open_tag = self.open_tags.pop()
+            self.html.append(f'</{open_tag}>')
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if self.dropping:
+            return
+
+        self.text.append(data)
+        self.html.append(Emoji.replace(escape(data)))
+
+    def close(self):
+        super().close()
+        while self.open_tags:
+            self.html.append(f'</{self.open_tags.pop()}>')
+
+    @staticmethod
+    def _clean_attrs(tag: str, attrs: list[tuple[str, str | None]]) -> list[tuple[str, str]]:
+        """Keeps the allowed attributes of a tag, as long as their values are safe."""
+        cleaned = []
+        for name, value in attrs:
+            if name not in ALLOWED_TAGS[tag] or value is None:
+                continue
+
+            if name == 'href' and not value.strip().lower().startswith(SAFE_URL_SCHEMES):
+                continue
+
+            if name == 'style':
+                value = _clean_style(value)
+                if not value:
+                    continue
+
+            cleaned.append((name, value))
+
+        return cleaned
+
+def _clean_style(style: str) -> str:
+    """Keeps the color declarations of an inline style."""
+    declarations = []
+    for declaration in style.split(';'):
+        name, _, value = declaration.partition(':')
+        name, value = name.strip().lower(), value.strip()
+        if name in STYLE_PROPERTIES and STYLE_VALUE.match(value):
+            declarations.append(f'{name}: {value}')
+
+    return '; '.join(declarations)
+
+def render_message(body: str) -> RenderedMessage:
+    """
+    Sanitizes a message body from the editor and renders it for display, in one pass over the HTML.
+
+    :param body - the message's HTML, as sent by the editor
+    :return the sanitized HTML (with emoji images), the plain text and a short plain text preview
+    """
+    parser = _MessageSanitizer()
+    parser.feed(body)
+    parser.close()
+
+    text = ' '.join(''.join(parser.text).split())
+    preview = text if len(text) <= MESSAGE_PREVIEW_LENGTH else text[:MESSAGE_PREVIEW_LENGTH] + '...'
+    return RenderedMessage(''.join(parser.html), text, preview)
@@ -0,0 +1,82 @@
+from datetime import date, datetime, time, timedelta
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyPoints, LedgerEntry
+
+# Time-windowed leaderboards, by name -> number of days
+LEADERBOARD_WINDOWS = {
+    'week': 7,
+    'month': 30,
+}
+
+def record_daily_points(sender_id: int, recipient_ids: list[int], points_per_recipient: int) -> None:
+    """
+    Adds a transfer to today's rollups, in three queries however many recipients there are.
+
+    :param sender_id - the id of the user who sent the points
+    :param recipient_ids - the ids of the users who got the points
+    :param points_per_recipient - the number of points each recipient got
+    """
+    today = timezone.localdate()
+
+    # Make sure everyone has a row for today, then add to them in place
+    DailyPoints.objects.bulk_create(
+        [DailyPoints(profile_id=profile_id, day=today) for profile_id in [sender_id, *recipient_ids]],
+        ignore_conflicts=True,
+    )
+    DailyPoints.objects.filter(profile_id__in=recipient_ids, day=today).update(received=F('received') + points_per_recipient)
+    DailyPoints.objects.filter(profile_id=sender_id, day=today).update(sent=F('sent') + points_per_recipient * len(recipient_ids))
+
+def _start_of_day(day: date) -> datetime:
+    """Gets the (aware) time a day starts, so ledger entries can be filtered by day on the `created` index."""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+def rebuild_daily_points(since: date, batch_size: int=1000) -> int:
+    """
+    Recomputes the rollups from a day up to yesterday from the points ledger.
+
+    Today's rollups are left alone, since transfers are still being added to them.
+
+    :param since - the first day to rebuild
+    :param batch_size - (optional) the number of rows to insert per query
+    :return the number of rollup rows written
+    """
+    today = timezone.localdate()
+    totals = LedgerEntry.objects.filter(created__gte=_start_of_day(since), created__lt=_start_of_day(today)) \
+        .annotate(day=TruncDate('created')) \
+        .values('profile', 'day') \
+        .annotate(
+            received_total=Sum('allTimePoints', filter=Q(kind=LedgerEntry.RECEIVE)),
+            sent_total=Sum(-F('points'), filter=Q(kind=LedgerEntry.SEND)),
+        ) \
+        .order_by()
+
+    rollups = (
+        DailyPoints(profile_id=row['profile'], day=row['day'], received=row['received_total'] or 0, sent=row['sent_total'] or 0)
+        for row in totals.iterator()
+    )
+
+    with transaction.atomic():
+        DailyPoints.objects.filter(day__gte=since, day__lt=today).delete()
+        return len(DailyPoints.objects.bulk_create(rollups, batch_size=batch_size))
+
+def windowed_top_users(days: int, size: int=10) -> list[tuple[User, int]]:
+    """
+    Gets the public users who received the most points in the last few days, summing their daily rollups.
+
+    :param days - the number of days to look back, including today
+    :param size - (optional) the number of users to get
+    :return a list of (user, points received) tuples, best first - the users only have their id and username
+    """
+    start = timezone.localdate() - timedelta(days=days - 1)
+    rows = DailyPoints.objects.filter(day__gte=start, profile__displayPoints=True) \
+        .values('profile', 'profile__user__username') \
+        .annotate(total=Sum('received')) \
+        .filter(total__gt=0) \
+        .order_by('-total', 'profile__user__username')[:size]
+
+    return [(User(id=row['profile'], username=row['profile__user__username']), row['total']) for row in rows]
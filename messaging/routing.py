@@ -0,0 +1,8 @@
+from django.urls import path
+
+from . import consumers
+
+# All of the possible WebSocket url patterns
+websocket_urlpatterns = [
+    path('ws/conversation/<int:pk>/', consumers.ConversationConsumer.as_asgi()),
+]
@@ -0,0 +1,65 @@
+import re
+import time
+
+from .models import EmojiWeight
+
+# Weights are cached per process, and other processes pick up changes after this many seconds
+SCANNER_TIMEOUT = 5 * 60
+
+_scanner = None
+_loaded_at = 0.0
+
+def _build_scanner() -> tuple[re.Pattern | None, dict[str, int]]:
+    """
+    Compiles every weighted emoji into one alternation regex, with a single query.
+
+    :return a tuple with the compiled pattern (None if there are no weights) and a dict of emoji -> points
+    """
+    weights = dict(EmojiWeight.objects.order_by('id').values_list('emoji', 'points'))
+    if not weights:
+        return None, weights
+
+    # Longest first, so an emoji made of several code points wins over any emoji inside it
+    alternatives = sorted(weights, key=len, reverse=True)
+    return re.compile('|'.join(re.escape(emoji) for emoji in alternatives)), weights
+
+def get_scanner() -> tuple[re.Pattern | None, dict[str, int]]:
+    """Gets the compiled emoji scanner, building it if it's missing or stale."""
+    global _scanner, _loaded_at
+
+    if _scanner is None or time.monotonic() - _loaded_at > SCANNER_TIMEOUT:
+        _scanner = _build_scanner()
+        _loaded_at = time.monotonic()
+
+    return _scanner
+
+def invalidate_scanner() -> None:
+    """Drops this process' compiled scanner, so the next score picks up the current weights."""
+    global _scanner
+    _scanner = None
+
+def emojis_by_points() -> list[tuple[int, list[str]]]:
+    """
+    Gets the weighted emojis grouped by what they're worth, from the cached scanner, for the tips next to the editor.
+
+    :return a list of (points, emojis) tuples, most points first
+    """
+    _, weights = get_scanner()
+    groups = {}
+    for emoji, points in weights.items():
+        groups.setdefault(points, []).append(emoji)
+
+    return sorted(groups.items(), reverse=True)
+
+def score(body: str) -> int:
+    """
+    Gets the number of points a message body is worth, in one pass over it.
+
+    :param body - the text of the message
+    :return the total points of every weighted emoji in the body
+    """
+    pattern, weights = get_scanner()
+    if pattern is None:
+        return 0
+
+    return sum(weights[emoji] for emoji in pattern.findall(body))
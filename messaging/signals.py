@@ -0,0 +1,50 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import leaderboard, scoring
+from .fragments import invalidate_conversations
+from .profiles import invalidate_profile_summaries
+from .thumbnails import schedule_thumbnails
+from .models import Conversation, EmojiWeight, Message, Profile
+
+@receiver([post_save, post_delete], sender=Profile)
+@receiver([post_save, post_delete], sender=User)
+def invalidate_leaderboard(sender, update_fields=None, **kwargs):
+    """Drops the cached leaderboard when a profile or user changes, since it may have gone private or been renamed."""
+    # Signing in saves `last_login` and nothing else, which the leaderboard doesn't show
+    if update_fields == frozenset({'last_login'}):
+        return
+
+    leaderboard.invalidate()
+
+@receiver(post_save, sender=Message)
+def invalidate_edited_message(sender, instance, created, **kwargs):
+    """Re-renders a conversation's cached messages when one of them is edited - new ones are picked up by the list's key."""
+    if not created:
+        transaction.on_commit(lambda: invalidate_conversations([instance.conversation_id]))
+
+@receiver(post_save, sender=User)
+def invalidate_renamed_sender(sender, instance, created, update_fields=None, **kwargs):
+    """Re-renders the cached messages of a user's conversations when they're saved, since their name is on their messages."""
+    if created or update_fields == frozenset({'last_login'}):
+        return
+
+    convo_ids = list(Conversation.objects.filter(userGroup__members=instance).values_list('id', flat=True))
+    transaction.on_commit(lambda: invalidate_conversations(convo_ids))
+
+@receiver([post_save, post_delete], sender=EmojiWeight)
+def invalidate_scanner(sender, **kwargs):
+    """Drops the compiled emoji scanner when a weight changes, so new messages are scored with it."""
+    scoring.invalidate_scanner()
+
+@receiver(post_save, sender=Profile)
+def schedule_profile_thumbnails(sender, instance, **kwargs):
+    """Queues thumbnails for a newly uploaded profile image."""
+    schedule_thumbnails(instance)
+
+@receiver(post_save, sender=Profile)
+def invalidate_profile_summary(sender, instance, **kwargs):
+    """Drops a profile's cached summary when it's updated, once the update is committed so it isn't re-cached stale."""
+    transaction.on_commit(lambda: invalidate_profile_summaries([instance.pk]))
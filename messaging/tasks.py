@@ -0,0 +1,33 @@
+from django.apps import apps
+from django.utils.dateparse import parse_datetime
+
+from .jobs import task
+from .reminders import send_reminder_chunk
+from .thumbnails import generate_thumbnails, needs_thumbnails
+
+@task('send_reminders')
+def send_reminders_task(user_ids: list[int], queued: str) -> None:
+    """
+    Background job that sends reminder emails to a chunk of users over one connection, skipping any it
+    already reached on an earlier try.
+
+    :param user_ids - the ids of the users to remind
+    :param queued - when the reminders were queued, as an ISO 8601 timestamp
+    """
+    send_reminder_chunk(user_ids, parse_datetime(queued))
+
+@task('generate_thumbnails')
+def generate_thumbnails_task(model: str, pk) -> None:
+    """
+    Background job that makes the thumbnails of a newly uploaded profile or product image.
+
+    :param model - the model's label, e.g. 'store.Product'
+    :param pk - the primary key of the profile or product
+    """
+    instance = apps.get_model(model).objects.filter(pk=pk).first()
+    if instance is None or not needs_thumbnails(instance):
+        # Deleted, or already done by an earlier job
+        return
+
+    instance.thumbnails = generate_thumbnails(instance.image)
+    instance.save(update_fields=['thumbnails'])
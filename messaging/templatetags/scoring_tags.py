@@ -0,0 +1,10 @@
+from django import template
+
+from messaging.scoring import emojis_by_points
+
+register = template.Library()
+
+@register.inclusion_tag('messaging/emoji_tips.html')
+def emoji_tips() -> dict:
+    """Lists the emojis that are worth points, grouped by how many, from the current weights rather than a hard-coded list."""
+    return {'groups': emojis_by_points()}
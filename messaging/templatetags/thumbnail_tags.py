@@ -0,0 +1,30 @@
+from django import template
+
+from messaging.thumbnails import srcset
+
+register = template.Library()
+
+@register.inclusion_tag('messaging/picture.html')
+def thumbnail_picture(instance, alt: str='', css_class: str='', style: str='', sizes: str='150px') -> dict:
+    """
+    Renders a profile's or product's image with its thumbnails, WebP first, so browsers download the smallest that fits.
+
+    Falls back to the original image until the thumbnails have been made.
+
+    :param instance - a model with `image` and `thumbnails` fields
+    :param alt - (optional) the image's alt text
+    :param css_class - (optional) the img's class attribute
+    :param style - (optional) the img's style attribute
+    :param sizes - (optional) the size the image is shown at, for the `sizes` attribute
+    """
+    image = instance.image
+    context = {'src': '', 'srcset': '', 'webp_srcset': '', 'alt': alt, 'css_class': css_class, 'style': style, 'sizes': sizes}
+    if not image:
+        return context
+
+    context['srcset'] = srcset(instance.thumbnails, image.storage)
+    context['webp_srcset'] = srcset(instance.thumbnails, image.storage, 'webp')
+
+    # Browsers without srcset support get the smallest thumbnail, not the original
+    context['src'] = context['srcset'].split(' ', 1)[0] if context['srcset'] else image.url
+    return context
@@ -1,12 +1,51 @@
-from datetime import timedelta
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from collections import Counter
+from datetime import date, timedelta
+from django.apps import apps
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import F
+from django.template import Context, Template
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from freezegun import freeze_time
-
+from io import BytesIO, StringIO
+from PIL import Image
+import asyncio
+import importlib
+import shutil
+import tempfile
+import time
+from unittest import skipUnless
+from unittest.mock import patch
+
+from .checks import check_shared_cache
+from .management.commands.generate_dataset import _explicit_timestamps
 from .forms import ProfileCreateForm, ProfileUpdateForm
-from .models import Conversation, Message, Profile, UserGroup
+from .jobs import claim_jobs, enqueue, requeue_stale_jobs, run_job, run_pending, task
+from .leaderboard import LOCK_CACHE_KEY, TOP_CACHE_KEY, record_points
+from .ledger import ledger_balances, take_snapshots
+from .models import DAILY_POINTS, Conversation, DailyPoints, EmojiWeight, Job, LedgerEntry, Message, Profile, ReadMarker, UserGroup, get_member_key
+from .realtime import broadcast_message, conversation_group, serialize_message
+from .reminders import build_reminder, inactive_users, send_reminders
+from .rendering import render_message
+from .routing import websocket_urlpatterns
+from .scoring import invalidate_scanner
+from .views import get_points, post_message, send_points
+from hackoverflow.instrumentation import RequestStats, fingerprint
+from hackoverflow.testing import QueryBudgetMixin, check_query_budget
+from store.models import Product, Purchase
 
 # Helper Functions
 def create_convo(convo_name: str, profiles: list[Profile]) -> Conversation:
@@ -17,7 +56,7 @@ def create_convo(convo_name: str, profiles: list[Profile]) -> Conversation:
     :param profiles - a list of profiles to extract user data from
     :return a new Conversation object
     """
-    user_group = UserGroup.objects.create(name=convo_name)
+    user_group = UserGroup.objects.create(name=convo_name, memberKey=get_member_key(profile.user.id for profile in profiles))
     for profile in profiles:
         user = User.objects.get(id=profile.user.id)
         user_group.members.add(user)
@@ -53,6 +92,22 @@ def create_profile(username: str, first_name: str, last_name: str, display_point
     user = User.objects.create_user(username=username, password=password, email=email, first_name=first_name, last_name=last_name)
     return Profile.objects.create(user=user, displayPoints=display_points, points=points, allTimePoints=all_time_points, displayPurchases=display_purchases) 
 
+def explain_preferring_indexes(queryset) -> str:
+    """
+    Helper function that gets the query plan for a queryset.
+
+    The test tables are tiny, so PostgreSQL would always pick a sequential scan - they're turned off
+    for the rest of the test's transaction to see which index the query would use on real data.
+
+    :param queryset - the query to explain
+    :return the query plan as a str
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    return queryset.explain()
+
 def get_user_full_name(profile: Profile) -> str:
     """
     Helper function that gets a user's full name from a Profile Model.
@@ -62,6 +117,24 @@ def get_user_full_name(profile: Profile) -> str:
     """
     return User.objects.get(id=profile.user.id).get_full_name()
 
+# Background job tasks used by the tests
+ran_job_payloads = []
+
+@task('tests.record')
+def record_task(value: int) -> None:
+    """Test task that remembers it was run."""
+    ran_job_payloads.append(value)
+
+@task('tests.fail')
+def fail_task() -> None:
+    """Test task that always fails."""
+    raise RuntimeError("This job always fails.")
+
+@task('tests.slow')
+def slow_task(seconds: float) -> None:
+    """Test task that takes a while."""
+    time.sleep(seconds)
+
 # Form Tests
 class ProfileCreateFormTests(TestCase):
     def test_profile_create_form_all_valid_fields(self):
@@ -191,8 +264,765 @@ class ProfileModelTests(TestCase):
         actual_response = sender.remind_user_to_send_message()
         self.assertEquals(0, actual_response, f"Expected no email to be sent to a user with a recent message, but {actual_response} was/were sent.")
 
+    def test_profile_sendable_points_stale_allowance(self):
+        """Tests that an allowance from a previous day shows as fully reset."""
+        prof = create_profile('jgeng', 'Jerry', 'Gengert', False, 0)
+
+        with freeze_time(timezone.now() + timedelta(days=1)):
+            actual_points = prof.sendable_points
+
+        self.assertEquals(actual_points, DAILY_POINTS, f"Expected a stale allowance to show {DAILY_POINTS} points, but it showed {actual_points}.")
+
+    def test_reset_points_command_single_update(self):
+        """Tests that resetting everyone's points takes a single query."""
+        for i in range(3):
+            _ = create_profile(f"user{i}", "User", f"{i}", False, points=i)
+
+        with CaptureQueriesContext(connection) as queries:
+            call_command('reset_points', points=50, stdout=StringIO())
+
+        self.assertEquals(len(queries.captured_queries), 1, msg=f"Expected one query to reset points, but {len(queries.captured_queries)} were run.")
+        self.assertEquals(Profile.objects.filter(points=50).count(), 3, msg="Expected every profile to be reset to 50 points, but failed.")
+
+class ConversationModelTests(TestCase):
+    def test_conversation_new_message_updates_last_message(self):
+        """Tests that writing a message makes it the conversation's last message."""
+        profile1 = create_profile("mscott", "Michael", "Scott", True)
+        profile2 = create_profile("dschrute", "Dwight", "Schrute", False)
+        convo = create_convo("mscott-dschrute", [profile1, profile2])
+        _ = create_message(profile1, convo, "Hi Dwight!")
+        expected_msg = create_message(profile2, convo, "Hello Michael.")
+        convo.refresh_from_db()
+
+        self.assertEquals(convo.last_message, expected_msg, msg=f"Expected the newest message to be the conversation's last message, but got {convo.last_message}.")
+
+    def test_conversation_new_message_updates_count(self):
+        """Tests that writing messages keeps the conversation's message count up to date."""
+        profile1 = create_profile("mscott", "Michael", "Scott", True)
+        profile2 = create_profile("dschrute", "Dwight", "Schrute", False)
+        convo = create_convo("mscott-dschrute", [profile1, profile2])
+        for i in range(3):
+            _ = create_message(profile1, convo, f"Message {i}")
+        convo.refresh_from_db()
+
+        self.assertEquals(convo.message_count, 3, msg=f"Expected the conversation to count 3 messages, but it counted {convo.message_count}.")
+
+class MessageRenderingTests(TestCase):
+    def test_render_message_sanitizes(self):
+        """Tests that scripts, event handlers and unsafe links are stripped while formatting is kept."""
+        rendered = render_message('<p onclick="steal()">Hi <strong>Dwight</strong><script>alert(1)</script> <a href="javascript:x">link</a></p>')
+
+        self.assertEquals(
+            rendered.html,
+            '<p>Hi <strong>Dwight</strong> <a>link</a></p>',
+            msg=f"Expected the body to be sanitized, but got {rendered.html}."
+        )
+
+    def test_render_message_escapes_and_closes_tags(self):
+        """Tests that text is escaped and tags left open are closed."""
+        rendered = render_message('<p><em>1 &lt; 2 &amp; &nbsp;3')
+
+        self.assertEquals(rendered.html, '<p><em>1 &lt; 2 &amp; \xa03</em></p>', msg=f"Expected escaped, balanced HTML, but got {rendered.html}.")
+        self.assertEquals(rendered.text, '1 < 2 & 3', msg=f"Expected the plain text to be unescaped, but got {rendered.text}.")
+
+    def test_render_message_preview(self):
+        """Tests that the preview is the start of the plain text, with words either side of tags kept apart."""
+        rendered = render_message('<p>Hi Dwight!</p><p>' + 'a' * 60 + '</p>')
+
+        self.assertEquals(rendered.preview, 'Hi Dwight! ' + 'a' * 39 + '...', msg=f"Expected a 50 character preview, but got {rendered.preview}.")
+
+    def test_message_rendered_on_save(self):
+        """Tests that a message gets its display HTML and preview when it's saved."""
+        profile1 = create_profile("mscott", "Michael", "Scott", True)
+        profile2 = create_profile("dschrute", "Dwight", "Schrute", False)
+        convo = create_convo("mscott-dschrute", [profile1, profile2])
+        message = create_message(profile1, convo, "<p>Hi <b>Dwight</b>!</p>")
+
+        self.assertEquals(message.body_html, "<p>Hi <b>Dwight</b>!</p>", msg=f"Expected the message to be rendered, but got {message.body_html}.")
+        self.assertEquals(message.preview, "Hi Dwight!", msg=f"Expected a plain text preview, but got {message.preview}.")
+
+    def test_render_messages_command_backfills(self):
+        """Tests that the backfill renders messages saved before rendering existed."""
+        profile1 = create_profile("mscott", "Michael", "Scott", True)
+        profile2 = create_profile("dschrute", "Dwight", "Schrute", False)
+        convo = create_convo("mscott-dschrute", [profile1, profile2])
+        message = create_message(profile1, convo, "<p>Hi <b>Dwight</b>!</p>")
+        Message.objects.filter(id=message.id).update(body_html='', preview='')
+
+        call_command('render_messages', chunk_size=1, stdout=StringIO())
+        message.refresh_from_db()
+
+        self.assertEquals(message.body_html, "<p>Hi <b>Dwight</b>!</p>", msg=f"Expected the message to be backfilled, but got {message.body_html}.")
+
+    def test_render_existing_messages_migration(self):
+        """Tests that the migration renders messages saved before rendering existed, so they aren't shown blank."""
+        migration = importlib.import_module('messaging.migrations.0014_render_existing_messages')
+        profile1 = create_profile("mscott", "Michael", "Scott", True)
+        profile2 = create_profile("dschrute", "Dwight", "Schrute", False)
+        convo = create_convo("mscott-dschrute", [profile1, profile2])
+        message = create_message(profile1, convo, "<p>Hi <b>Dwight</b>!</p>")
+        Message.objects.filter(id=message.id).update(body_html='', preview='')
+
+        migration.render_existing_messages(apps, None)
+        message.refresh_from_db()
+
+        self.assertEquals(message.body_html, "<p>Hi <b>Dwight</b>!</p>", msg=f"Expected the message to be rendered, but got {message.body_html}.")
+        self.assertEquals(message.preview, "Hi Dwight!", msg=f"Expected the message's preview to be filled in, but got {message.preview}.")
+
+class QueryPlanTests(TestCase):
+    def test_conversation_page_uses_index(self):
+        """Tests that getting a page of a conversation's messages uses the (conversation, created, id) index."""
+        profile1 = create_profile("mscott", "Michael", "Scott", True)
+        profile2 = create_profile("dschrute", "Dwight", "Schrute", False)
+        convo = create_convo("mscott-dschrute", [profile1, profile2])
+
+        plan = explain_preferring_indexes(Message.objects.filter(conversation=convo).order_by('-created', '-id')[:51])
+        self.assertIn('message_convo_created_idx', plan, msg=f"Expected the conversation page query to use its index, but the plan was: {plan}")
+
+    def test_latest_sent_message_uses_index(self):
+        """Tests that getting a user's most recently sent message uses the (sender, updated) index."""
+        profile = create_profile("mscott", "Michael", "Scott", True)
+
+        plan = explain_preferring_indexes(Message.objects.filter(sender=profile.user).order_by('-updated')[:1])
+        self.assertIn('message_sender_updated_idx', plan, msg=f"Expected the latest sent message query to use its index, but the plan was: {plan}")
+
+    @skipUnless(connection.vendor == 'postgresql', "SQLite filters booleans on the bare column, which can't use the index")
+    def test_leaderboard_uses_index(self):
+        """Tests that getting the public profiles with the most points uses the (displayPoints, allTimePoints) index."""
+        _ = create_profile("mscott", "Michael", "Scott", True)
+
+        plan = explain_preferring_indexes(Profile.objects.filter(displayPoints=True).order_by('-allTimePoints')[:10])
+        self.assertIn('profile_public_points_idx', plan, msg=f"Expected the leaderboard query to use its index, but the plan was: {plan}")
+
+class LedgerTests(TestCase):
+    def test_ledger_records_transfer(self):
+        """Tests that sending points records one entry for the sender and one per recipient."""
+        sender = create_profile("mscott", "Michael", "Scott", True, points=30)
+        receiver1 = create_profile("dschrute", "Dwight", "Schrute", False)
+        receiver2 = create_profile("jhalpert", "Jim", "Halpert", False)
+        convo = create_convo("mscott-dschrute-jhalpert", [sender, receiver1, receiver2])
+        message = Message.objects.create(sender=sender.user, conversation=convo, body="🐶", points=10)
+
+        send_points(message, [sender.user, receiver1.user, receiver2.user], sender.user)
+
+        sent = LedgerEntry.objects.get(profile=sender)
+        received = LedgerEntry.objects.filter(kind=LedgerEntry.RECEIVE, wallet=10, allTimePoints=10)
+        self.assertEquals(sent.points, -20, msg=f"Expected the sender's entry to record -20 points, but it recorded {sent.points}.")
+        self.assertEquals(received.count(), 2, msg=f"Expected an entry for each of the 2 recipients, but found {received.count()}.")
+
+    def test_ledger_entries_append_only(self):
+        """Tests that a ledger entry can't be changed once written."""
+        profile = create_profile("mscott", "Michael", "Scott", True)
+        entry = LedgerEntry.objects.create(profile=profile, kind=LedgerEntry.RECEIVE, wallet=10)
+
+        entry.wallet = 1000
+        with self.assertRaises(ValueError, msg="Expected editing a ledger entry to fail, but it didn't."):
+            entry.save()
+
+    def test_ledger_balance_from_snapshot_and_tail(self):
+        """Tests that a balance is the latest snapshot plus the entries written after it."""
+        profile = create_profile("mscott", "Michael", "Scott", True)
+        first = LedgerEntry.objects.create(profile=profile, kind=LedgerEntry.RECEIVE, wallet=10, allTimePoints=10)
+        take_snapshots([profile.user.id], first.id)
+        _ = LedgerEntry.objects.create(profile=profile, kind=LedgerEntry.RECEIVE, wallet=5, allTimePoints=5)
+
+        balances = ledger_balances([profile.user.id])[profile.user.id]
+        self.assertEquals(balances, {'wallet': 15, 'allTimePoints': 15}, msg=f"Expected a balance of 15, but got {balances}.")
+
+    def test_check_balances_all_match(self):
+        """Tests that the balance check passes when profiles only change through ledgered transfers."""
+        sender = create_profile("mscott", "Michael", "Scott", True, points=30)
+        receiver = create_profile("dschrute", "Dwight", "Schrute", False)
+        convo = create_convo("mscott-dschrute", [sender, receiver])
+        message = Message.objects.create(sender=sender.user, conversation=convo, body="🐶", points=10)
+        send_points(message, [sender.user, receiver.user], sender.user)
+
+        out = StringIO()
+        call_command('check_balances', chunk_size=1, stdout=out)
+        self.assertIn("All 2 profiles match", out.getvalue(), msg=f"Expected every profile to match the ledger, but got: {out.getvalue()}")
+
+    def test_check_balances_finds_mismatch(self):
+        """Tests that the balance check fails when a balance was changed outside of the ledger."""
+        profile = create_profile("mscott", "Michael", "Scott", True)
+        Profile.objects.filter(user=profile.user).update(wallet=1000)
+
+        with self.assertRaises(CommandError, msg="Expected the balance check to fail for a tampered wallet, but it passed."):
+            call_command('check_balances', stdout=StringIO(), stderr=StringIO())
+
+class ReminderCommandTests(TestCase):
+    def test_send_reminders_only_inactive(self):
+        """Tests that only users who haven't sent a message recently get reminded."""
+        active = create_profile('rswanson', 'Ron', 'Swanson', False, email='ron@pawnee.com')
+        _ = create_profile('aperkins', 'Anne', 'Perkins', False, email='anne@pawnee.com')
+        _ = create_profile('tomh', 'Tom', 'Haverford', False, email='tom@pawnee.com')
+        convo = create_convo("rswanson-aperkins", [active])
+        _ = create_message(active, convo, "This is a positive message. Hello.")
+
+        call_command('send_reminders', stdout=StringIO())
+
+        recipients = sorted(email.to[0] for email in mail.outbox)
+        self.assertEquals(recipients, ['anne@pawnee.com', 'tom@pawnee.com'], msg=f"Expected only the inactive users to be reminded, but {recipients} were.")
+
+    def test_send_reminders_parallel_chunks(self):
+        """Tests that every inactive user gets exactly one reminder when sending in small chunks over several connections."""
+        for i in range(5):
+            _ = create_profile(f"user{i}", "User", f"{i}", False, email=f"user{i}@pawnee.com")
+
+        call_command('send_reminders', chunk_size=1, workers=3, stdout=StringIO())
+
+        recipients = sorted(email.to[0] for email in mail.outbox)
+        self.assertEquals(recipients, [f"user{i}@pawnee.com" for i in range(5)], msg=f"Expected each user to get one reminder, but got {recipients}.")
+
+    def test_send_reminders_connection_fails(self):
+        """Tests that sending fails, rather than hanging, when the mail server can't be connected to."""
+        recipients = [("User", f"user{i}@pawnee.com") for i in range(10)]
+
+        with patch('messaging.reminders.get_connection', side_effect=OSError("Connection refused")):
+            with self.assertRaises(OSError, msg="Expected the connection error to be raised"):
+                send_reminders(recipients, chunk_size=1, workers=2)
+
+    def test_send_reminders_recipients_fail(self):
+        """Tests that an error finding the recipients stops the workers and is raised, rather than hanging."""
+        def recipients():
+            for i in range(10):
+                yield ("User", f"user{i}@pawnee.com")
+            raise ValueError("Lost the database")
+
+        with self.assertRaises(ValueError, msg="Expected the recipients' error to be raised"):
+            send_reminders(recipients(), chunk_size=1, workers=2)
+
+        self.assertEquals(len(mail.outbox), 10, msg=f"Expected the reminders queued before the error to be sent, but {len(mail.outbox)} were.")
+
+    def test_send_reminders_dry_run(self):
+        """Tests that a dry run reports who would be reminded without sending anything."""
+        _ = create_profile('jgeng', 'Jerry', 'Gengert', False, email='jerry@pawnee.com')
+
+        out = StringIO()
+        call_command('send_reminders', dry_run=True, stdout=out)
+
+        self.assertEquals(len(mail.outbox), 0, msg=f"Expected a dry run to send no emails, but {len(mail.outbox)} were sent.")
+        self.assertIn('jgeng', out.getvalue(), msg=f"Expected the dry run to report the inactive user, but got: {out.getvalue()}")
+
+    def test_inactive_users_single_query(self):
+        """Tests that finding inactive users takes one query however many users there are."""
+        for i in range(5):
+            _ = create_profile(f"user{i}", "User", f"{i}", False)
+
+        with CaptureQueriesContext(connection) as queries:
+            users = list(inactive_users())
+
+        self.assertEquals(len(users), 5)
+        self.assertEquals(len(queries.captured_queries), 1, msg=f"Expected one query to find inactive users, but {len(queries.captured_queries)} were run.")
+
+class GenerateDatasetTests(TestCase):
+    def generate(self, **options):
+        """Runs the dataset command with small defaults, and returns its output."""
+        out = StringIO()
+        options = dict({'users': 30, 'messages': 300, 'products': 5, 'chunk_size': 50, 'seed': 1}, **options)
+        call_command('generate_dataset', stdout=out, **options)
+        return out.getvalue()
+
+    def test_generate_dataset_counts(self):
+        """Tests that the requested numbers of users and messages are made, with a profile for every user."""
+        self.generate()
+
+        self.assertEqual(User.objects.count(), 30, msg="Expected 30 users to be generated, but failed.")
+        self.assertEqual(Profile.objects.count(), 30, msg="Expected every generated user to have a profile, but failed.")
+        self.assertEqual(Message.objects.count(), 300, msg="Expected 300 messages to be generated, but failed.")
+        self.assertTrue(Purchase.objects.exists(), msg="Expected some purchases to be generated, but there weren't any.")
+
+    def test_generate_dataset_denormalized_fields(self):
+        """Tests that the fields save() would normally maintain are filled in by the bulk load."""
+        self.generate()
+
+        for convo in Conversation.objects.select_related('userGroup'):
+            messages = Message.objects.filter(conversation=convo)
+            member_ids = convo.userGroup.members.values_list('id', flat=True)
+            self.assertEqual(convo.message_count, messages.count(), msg=f"Expected conversation {convo.id}'s message count to match its messages.")
+            self.assertEqual(convo.last_message_id, messages.order_by('-created', '-id').values_list('id', flat=True).first(),
+                msg=f"Expected conversation {convo.id}'s last message to be its newest.")
+            self.assertEqual(convo.userGroup.memberKey, get_member_key(member_ids), msg=f"Expected conversation {convo.id}'s member key to match its members.")
+
+        message = Message.objects.first()
+        self.assertEqual(message.body_html, render_message(message.body).html, msg="Expected the generated messages to be rendered.")
+
+    def test_generate_dataset_balances_match_ledger(self):
+        """Tests that the generated balances agree with the generated points ledger."""
+        self.generate()
+
+        out = StringIO()
+        call_command('check_balances', stdout=out)
+        self.assertIn("All 30 profiles match the ledger.", out.getvalue(), msg="Expected the generated balances to match the ledger, but failed.")
+        self.assertTrue(Profile.objects.filter(allTimePoints__gt=0).exists(), msg="Expected some users to have received points, but none did.")
+
+    def test_generate_dataset_reproducible(self):
+        """Tests that the same seed and end date make the same messages, at the same times."""
+        self.generate(prefix='first', end=date(2026, 1, 31))
+        first = list(Message.objects.order_by('id').values_list('body', 'points', 'created'))
+        self.generate(prefix='second', products=0, end=date(2026, 1, 31))
+        second = list(Message.objects.order_by('id').values_list('body', 'points', 'created'))[len(first):]
+
+        self.assertEqual(first, second, msg="Expected the same seed to generate the same messages, but failed.")
+        self.assertEqual(
+            timezone.localdate(first[-1][2]), date(2026, 1, 31),
+            msg=f"Expected the messages to run up to the end date, but the last was sent {first[-1][2]}."
+        )
+
+    def test_generate_dataset_timestamps_scoped(self):
+        """Tests that only the generated rows keep their own timestamps - anything else saved meanwhile is stamped as usual."""
+        profile1 = create_profile("mscott", "Michael", "Scott", True)
+        profile2 = create_profile("dschrute", "Dwight", "Schrute", False)
+        convo = create_convo("mscott-dschrute", [profile1, profile2])
+        long_ago = timezone.now() - timedelta(days=100)
+
+        with _explicit_timestamps(Message):
+            message = Message.objects.create(sender=profile1.user, conversation=convo, body="Hi Dwight!", created=long_ago)
+
+        self.assertGreater(message.created, long_ago, msg="Expected a message saved outside the generator to be stamped with the current time, but it wasn't.")
+
+    def test_generate_dataset_existing_prefix(self):
+        """Tests that the command won't add to users it already generated."""
+        self.generate()
+
+        with self.assertRaises(CommandError, msg="Expected an error for a prefix that's already used"):
+            self.generate()
+
+    def test_generate_dataset_group_exponent(self):
+        """Tests that a group size exponent the power law can't use is refused."""
+        with self.assertRaises(CommandError, msg="Expected an error for a group exponent of 1"):
+            self.generate(group_exponent=1.0)
+
+    def test_generate_dataset_daily_allowance(self):
+        """Tests that no generated user sends more than their daily allowance in a day."""
+        self.generate(users=5, messages=500)
+
+        spent = Counter()
+        for profile_id, points, created in LedgerEntry.objects.filter(kind=LedgerEntry.SEND).values_list('profile', 'points', 'created'):
+            spent[profile_id, timezone.localdate(created)] -= points
+
+        self.assertTrue(spent, msg="Expected some points to be sent, but none were.")
+        self.assertLessEqual(max(spent.values()), DAILY_POINTS, msg=f"Expected no one to send over {DAILY_POINTS} points in a day, but got {max(spent.values())}.")
+
+    def test_generate_dataset_rollups(self):
+        """Tests that the new users' daily rollups match the ledger, without touching anyone else's."""
+        existing = create_profile("mscott", "Michael", "Scott", True)
+        _ = DailyPoints.objects.create(profile=existing, day=timezone.localdate() - timedelta(days=3), received=7)
+
+        self.generate()
+
+        expected = Counter()
+        for profile_id, kind, points, all_time_points, created in LedgerEntry.objects.values_list('profile', 'kind', 'points', 'allTimePoints', 'created'):
+            if kind == LedgerEntry.SEND:
+                expected[profile_id, timezone.localdate(created), 'sent'] -= points
+            elif kind == LedgerEntry.RECEIVE:
+                expected[profile_id, timezone.localdate(created), 'received'] += all_time_points
+
+        rollups = Counter()
+        for profile_id, day, received, sent in DailyPoints.objects.exclude(profile=existing).values_list('profile', 'day', 'received', 'sent'):
+            rollups[profile_id, day, 'received'] += received
+            rollups[profile_id, day, 'sent'] += sent
+
+        self.assertEqual(+rollups, +expected, msg="Expected the generated rollups to match the generated ledger, but failed.")
+        self.assertTrue(
+            DailyPoints.objects.filter(profile=existing, received=7).exists(),
+            msg="Expected an existing user's rollups to be left alone, but they weren't."
+        )
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        ran_job_payloads.clear()
+
+    def test_job_runs_and_completes(self):
+        """Tests that a queued job is run with its payload and marked as done."""
+        job = enqueue('tests.record', value=42)
+
+        ran = run_pending()
+        job.refresh_from_db()
+
+        self.assertEquals(ran, 1, msg=f"Expected one job to run, but {ran} did.")
+        self.assertEquals(ran_job_payloads, [42], msg=f"Expected the task to get its payload, but it got {ran_job_payloads}.")
+        self.assertEquals(job.status, Job.DONE, msg=f"Expected the job to be done, but it's {job.status}.")
+
+    def test_job_not_run_before_due(self):
+        """Tests that a job scheduled for later isn't claimed yet."""
+        _ = enqueue('tests.record', run_at=timezone.now() + timedelta(hours=1), value=1)
+
+        ran = run_pending()
+        self.assertEquals(ran, 0, msg=f"Expected no jobs to run before they're due, but {ran} did.")
+
+    def test_failed_job_retried_with_backoff(self):
+        """Tests that a failed job goes back in the queue for later, with the error saved."""
+        job = enqueue('tests.fail')
+
+        _ = run_pending()
+        job.refresh_from_db()
+
+        self.assertEquals(job.status, Job.PENDING, msg=f"Expected the failed job to be retried, but it's {job.status}.")
+        self.assertGreater(job.run_at, timezone.now(), msg="Expected the retry to be scheduled in the future, but it wasn't.")
+        self.assertIn("This job always fails.", job.last_error, msg="Expected the job's error to be saved, but it wasn't.")
+        self.assertEquals(run_pending(), 0, msg="Expected the retry to wait for its backoff, but it ran straight away.")
+
+    def test_failed_job_gives_up(self):
+        """Tests that a job is marked as failed once it runs out of attempts."""
+        job = enqueue('tests.fail', max_attempts=1)
+
+        _ = run_pending()
+        job.refresh_from_db()
+
+        self.assertEquals(job.status, Job.FAILED, msg=f"Expected the job to fail for good, but it's {job.status}.")
+
+    def test_worker_command_burst(self):
+        """Tests that the worker command runs every due job and then exits in burst mode."""
+        for i in range(3):
+            _ = enqueue('tests.record', value=i)
+
+        call_command('run_worker', burst=True, stdout=StringIO())
+
+        self.assertEquals(sorted(ran_job_payloads), [0, 1, 2], msg=f"Expected all 3 jobs to run, but got {ran_job_payloads}.")
+
+    def test_send_reminders_in_background(self):
+        """Tests that reminders can be queued as jobs and sent by a worker."""
+        for i in range(3):
+            _ = create_profile(f"user{i}", "User", f"{i}", False, email=f"user{i}@pawnee.com")
+
+        call_command('send_reminders', background=True, chunk_size=2, stdout=StringIO())
+        self.assertEquals(len(mail.outbox), 0, msg="Expected no emails to be sent before the jobs run, but some were.")
+
+        _ = run_pending()
+        self.assertEquals(len(mail.outbox), 3, msg=f"Expected 3 reminders once the jobs ran, but {len(mail.outbox)} were sent.")
+
+    def test_send_reminders_retry_skips_reminded(self):
+        """Tests that a reminder job retried after failing partway doesn't email the users it already reached again."""
+        for i in range(3):
+            _ = create_profile(f"user{i}", "User", f"{i}", False, email=f"user{i}@pawnee.com")
+
+        call_command('send_reminders', background=True, chunk_size=3, stdout=StringIO())
+        calls = []
+
+        def build_then_fail(first_name, email):
+            # The second email of the first try fails
+            calls.append(email)
+            if len(calls) == 2:
+                raise ConnectionError("Mail server went away.")
+            return build_reminder(first_name, email)
+
+        with patch('messaging.reminders.build_reminder', side_effect=build_then_fail):
+            _ = run_pending()
+            Job.objects.update(run_at=timezone.now())
+            _ = run_pending()
+
+        recipients = sorted(email.to[0] for email in mail.outbox)
+        self.assertEquals(
+            recipients,
+            ["user0@pawnee.com", "user1@pawnee.com", "user2@pawnee.com"],
+            msg=f"Expected each user to be reminded exactly once across both tries, but got {recipients}."
+        )
+
+    def test_requeue_stale_jobs(self):
+        """Tests that only running jobs without a recent heartbeat are put back in the queue."""
+        abandoned = enqueue('tests.record', value=1)
+        busy = enqueue('tests.record', value=2)
+        Job.objects.filter(id=abandoned.id).update(status=Job.RUNNING, attempts=1, locked_at=timezone.now() - timedelta(minutes=11))
+        Job.objects.filter(id=busy.id).update(status=Job.RUNNING, attempts=1, locked_at=timezone.now() - timedelta(seconds=30))
+
+        requeued = requeue_stale_jobs()
+        abandoned.refresh_from_db()
+        busy.refresh_from_db()
+
+        self.assertEquals(requeued, 1, msg=f"Expected one job to be requeued, but {requeued} were.")
+        self.assertEquals(abandoned.status, Job.PENDING, msg=f"Expected the abandoned job to be requeued, but it's {abandoned.status}.")
+        self.assertEquals(busy.status, Job.RUNNING, msg=f"Expected the job with a recent heartbeat to be left running, but it's {busy.status}.")
+        self.assertGreater(abandoned.run_at, timezone.now(), msg="Expected the abandoned job to wait for its backoff, but it was due straight away.")
+
+    def test_requeue_poison_job_fails(self):
+        """Tests that a job whose worker keeps dying is marked as failed once it runs out of attempts, instead of retried forever."""
+        job = enqueue('tests.record', max_attempts=3, value=1)
+
+        for _ in range(3):
+            # Due again, then claimed by a worker that dies while running it
+            Job.objects.filter(id=job.id).update(run_at=timezone.now())
+            _ = claim_jobs()
+            Job.objects.filter(id=job.id).update(locked_at=timezone.now() - timedelta(minutes=11))
+            _ = requeue_stale_jobs()
+
+        job.refresh_from_db()
+        self.assertEquals(job.status, Job.FAILED, msg=f"Expected the job to fail after 3 abandoned attempts, but it's {job.status}.")
+        self.assertIn("stopped", job.last_error, msg=f"Expected the abandoned runs to be recorded as the error, but got {job.last_error!r}.")
+
+class JobHeartbeatTests(TransactionTestCase):
+    # The heartbeat writes from its own thread, so the job has to be committed - and the seeded emoji
+    # weights put back after each test
+    serialized_rollback = True
+
+    def test_running_job_heartbeats(self):
+        """Tests that a running job's lock is refreshed while it runs, so it isn't mistaken for an abandoned one."""
+        job = enqueue('tests.slow', seconds=0.5)
+
+        with patch('messaging.jobs.HEARTBEAT_INTERVAL', timedelta(seconds=0.1)):
+            claimed = claim_jobs()[0]
+            run_job(claimed)
+        job.refresh_from_db()
+
+        self.assertEquals(job.status, Job.DONE, msg=f"Expected the slow job to finish, but it's {job.status}.")
+        self.assertGreater(job.locked_at, claimed.locked_at, msg="Expected the running job's lock to be refreshed, but it wasn't.")
+
 # View Tests
-class ConversationViewTests(TestCase):
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def upload_image(self, profile: Profile, width: int=600, height: int=400) -> None:
+        """Helper function that uploads a JPEG as a profile's image, running the jobs it queues."""
+        buffer = BytesIO()
+        Image.new('RGB', (width, height), 'teal').save(buffer, 'JPEG')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.image = SimpleUploadedFile("photo.jpg", buffer.getvalue(), content_type='image/jpeg')
+            profile.save()
+        run_pending()
+        profile.refresh_from_db()
+
+    def test_upload_generates_thumbnails(self):
+        """Tests that uploading an image queues a job that saves every size as a JPEG and a WebP."""
+        profile = create_profile("mscott", "Michael", "Scott", True)
+        self.upload_image(profile)
+
+        sizes = profile.thumbnails['sizes']
+        widths = sorted(size['width'] for size in sizes.values())
+        self.assertEquals(widths, [150, 300], msg=f"Expected 150px and 300px thumbnails, but got {widths}.")
+        for size in sizes.values():
+            with Image.open(profile.image.storage.path(size['webp'])) as webp:
+                self.assertEquals(webp.format, 'WEBP', msg=f"Expected a WebP variant, but got {webp.format}.")
+
+    def test_thumbnail_picture_srcset(self):
+        """Tests that the picture tag offers every thumbnail size, WebP first."""
+        profile = create_profile("mscott", "Michael", "Scott", True)
+        self.upload_image(profile)
+
+        html = Template("{% load thumbnail_tags %}{% thumbnail_picture profile alt='me' %}").render(Context({'profile': profile}))
+        webp_srcset = f"/media/profile_images/{profile.user.id}/thumbnails/photo_150.webp 150w, /media/profile_images/{profile.user.id}/thumbnails/photo_300.webp 300w"
+        self.assertIn(f'srcset="{webp_srcset}"', html, msg=f"Expected the WebP srcset, but got {html}")
+        self.assertIn(f'src="/media/profile_images/{profile.user.id}/thumbnails/photo_150.jpg"', html, msg=f"Expected the smallest thumbnail as the fallback, but got {html}")
+
+    def test_generate_thumbnails_command_backfills(self):
+        """Tests that the backfill makes thumbnails for images uploaded before they existed."""
+        profile = create_profile("mscott", "Michael", "Scott", True)
+        self.upload_image(profile, width=100, height=100)
+        Profile.objects.filter(user=profile.user).update(thumbnails={})
+
+        call_command('generate_thumbnails', stdout=StringIO())
+        profile.refresh_from_db()
+
+        widths = {size['width'] for size in profile.thumbnails['sizes'].values()}
+        self.assertEquals(widths, {100}, msg=f"Expected a small image to not be scaled up, but got widths {widths}.")
+
+class MediaViewTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, MEDIA_SENDFILE=None)
+        self.settings_override.enable()
+
+        with open(f"{self.media_root}/photo.jpg", 'wb') as file:
+            file.write(b"0123456789")
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_media_logged_in_within_budget(self):
+        """Tests that serving media to a signed in user stays within its query budget."""
+        profile = create_profile("mscott", "Michael", "Scott", True)
+        self.client.force_login(profile.user)
+
+        response = self.client.get("/media/photo.jpg")
+        self.assertWithinQueryBudget(response)
+
+    def test_media_served_with_validators(self):
+        """Tests that a media file is sent with an ETag, Last-Modified and long cache headers."""
+        response = self.client.get("/media/photo.jpg")
+
+        self.assertEquals(b"".join(response.streaming_content), b"0123456789", msg="Expected the file's bytes to be sent, but they weren't.")
+        self.assertIn('max-age=86400', response['Cache-Control'], msg=f"Expected a long cache lifetime, but got {response['Cache-Control']}.")
+        self.assertTrue(response.has_header('Last-Modified'), msg="Expected a Last-Modified header, but there wasn't one.")
+
+    def test_media_not_modified(self):
+        """Tests that a client with the current version of a file gets a 304 and no body."""
+        etag = self.client.get("/media/photo.jpg")['ETag']
+
+        response = self.client.get("/media/photo.jpg", HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 304, msg=f"Expected an unchanged file to be a 304, but got {response.status_code}.")
+
+    def test_media_byte_range(self):
+        """Tests that a byte range of a file is sent as a 206."""
+        response = self.client.get("/media/photo.jpg", HTTP_RANGE="bytes=2-5")
+
+        self.assertEquals(response.status_code, 206, msg=f"Expected a partial response, but got {response.status_code}.")
+        self.assertEquals(response['Content-Range'], "bytes 2-5/10", msg=f"Expected bytes 2-5 of 10, but got {response['Content-Range']}.")
+        self.assertEquals(b"".join(response.streaming_content), b"2345", msg="Expected only the requested bytes to be sent, but they weren't.")
+
+    def test_media_invalid_byte_range_ignored(self):
+        """Tests that a range ending before it starts is ignored and the whole file sent."""
+        response = self.client.get("/media/photo.jpg", HTTP_RANGE="bytes=5-3")
+
+        self.assertEquals(response.status_code, 200, msg=f"Expected an invalid range to be ignored, but got {response.status_code}.")
+        self.assertEquals(b"".join(response.streaming_content), b"0123456789", msg="Expected the whole file to be sent, but it wasn't.")
+
+    def test_media_unsatisfiable_byte_range(self):
+        """Tests that a range starting past the end of the file is a 416."""
+        response = self.client.get("/media/photo.jpg", HTTP_RANGE="bytes=10-")
+
+        self.assertEquals(response.status_code, 416, msg=f"Expected a range past the end of the file to be a 416, but got {response.status_code}.")
+        self.assertEquals(response['Content-Range'], "bytes */10", msg=f"Expected the file's size in Content-Range, but got {response.get('Content-Range')}.")
+
+    def test_media_outside_root(self):
+        """Tests that paths can't escape MEDIA_ROOT."""
+        response = self.client.get("/media/../settings.py")
+        self.assertEquals(response.status_code, 404, msg=f"Expected a path outside of MEDIA_ROOT to 404, but got {response.status_code}.")
+
+    def test_media_x_accel_redirect(self):
+        """Tests that with nginx offload the file is named in a header instead of sent."""
+        with override_settings(MEDIA_SENDFILE='x-accel-redirect'):
+            response = self.client.get("/media/photo.jpg")
+
+        self.assertEquals(response['X-Accel-Redirect'], "/protected-media/photo.jpg", msg=f"Expected the file to be handed to nginx, but got {response.get('X-Accel-Redirect')}.")
+        self.assertEquals(response.content, b"", msg="Expected no body when nginx sends the file, but got one.")
+
+class CacheCheckTests(TestCase):
+    def test_per_process_cache_warned(self):
+        """Tests that deploying with a per-process cache is warned about."""
+        warnings = check_shared_cache(None)
+        self.assertEqual([warning.id for warning in warnings], ['messaging.W001'], msg=f"Expected a warning about the per-process cache, but got {warnings}.")
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost:6379'}})
+    def test_shared_cache_not_warned(self):
+        """Tests that a shared cache isn't warned about."""
+        self.assertEqual(check_shared_cache(None), [], msg="Expected no warnings for a shared cache.")
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_fingerprint_ignores_in_list_length(self):
+        """Tests that queries differing only in the length of an IN list get the same fingerprint."""
+        short = 'SELECT * FROM "auth_user" WHERE "id" IN (%s, %s)'
+        long = 'SELECT *  FROM "auth_user"\nWHERE "id" IN (%s, %s, %s, %s)'
+        self.assertEqual(fingerprint(short), fingerprint(long), msg="Expected both queries to have the same fingerprint, but failed.")
+
+    def test_repeated_queries_found(self):
+        """Tests that the same query run with different parameters is reported as repeated."""
+        users = [create_profile(f"user{i}", "Test", "User", True).user for i in range(3)]
+
+        stats = RequestStats()
+        with connection.execute_wrapper(stats):
+            for user in users:
+                User.objects.get(id=user.id)
+            _ = Profile.objects.count()
+
+        self.assertEqual(stats.query_count, 4, msg=f"Expected 4 queries to be counted, but got {stats.query_count}.")
+        self.assertEqual(stats.duplicate_count, 2, msg=f"Expected 2 repeated queries, but got {stats.duplicate_count}.")
+        self.assertEqual(list(stats.duplicates.values()), [3], msg=f"Expected one query repeated 3 times, but got {stats.duplicates}.")
+
+    @override_settings(INSTRUMENTATION_HEADERS=True)
+    def test_stats_sent_as_headers(self):
+        """Tests that a request's query count and render time are added to the response."""
+        profile = create_profile("mscott", "Michael", "Scott", True)
+        self.client.force_login(profile.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('inbox'))
+
+        self.assertEqual(response['X-Query-Count'], str(len(queries)), msg="Expected every query to be counted, but failed.")
+        self.assertGreater(response.request_stats.template_time, 0, msg="Expected the inbox's render time to be recorded, but failed.")
+        self.assertIn('X-Duplicate-Queries', response, msg="Expected the repeated queries to be reported, but failed.")
+
+    @override_settings(QUERY_BUDGETS={'inbox': 1})
+    def test_over_budget_request_fails_check(self):
+        """Tests that a view running more queries than its budget is logged and fails the budget check."""
+        profile = create_profile("mscott", "Michael", "Scott", True)
+        self.client.force_login(profile.user)
+
+        with self.assertLogs('hackoverflow.instrumentation', 'WARNING'):
+            response = self.client.get(reverse('inbox'))
+
+        with self.assertRaises(AssertionError, msg="Expected the budget check to fail for a view over budget"):
+            check_query_budget(response)
+
+class ProfileViewTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        # Summaries and the catalog are cached by id, which get reused between tests
+        cache.clear()
+
+    def test_profile_shows_purchases(self):
+        """Tests that a profile shows every product the user bought."""
+        profile = create_profile("mscott", "Michael", "Scott", True, display_purchases=True)
+        for name in ["Stapler", "Mug", "Jello"]:
+            Purchase.objects.create(buyer=profile, product=Product.objects.create(name=name, point_cost=10, amount_sold=1))
+
+        self.client.force_login(profile.user)
+        response = self.client.get(reverse('profile', args=[profile.user.id]))
+
+        self.assertEqual(
+            [product.name for product in response.context['products']],
+            ["Stapler", "Mug", "Jello"],
+            msg="Expected every purchased product to be shown, oldest purchase first, but failed."
+        )
+        self.assertContains(response, "Image of purchase: Jello", msg_prefix="Expected the purchased product to be shown")
+
+    def test_profile_purchases_not_queried_per_product(self):
+        """Tests that a profile's purchases take a fixed number of queries, and none once they're cached."""
+        profile = create_profile("mscott", "Michael", "Scott", True, display_purchases=True)
+        for name in ["Stapler", "Mug", "Jello"]:
+            Purchase.objects.create(buyer=profile, product=Product.objects.create(name=name, point_cost=10, amount_sold=1))
+
+        self.client.force_login(profile.user)
+        with CaptureQueriesContext(connection) as cold:
+            _ = self.client.get(reverse('profile', args=[profile.user.id]))
+        with CaptureQueriesContext(connection) as warm:
+            _ = self.client.get(reverse('profile', args=[profile.user.id]))
+
+        store_queries = lambda queries: [query['sql'] for query in queries if '"store_' in query['sql']]
+        self.assertEqual(len(store_queries(cold)), 2, msg=f"Expected one purchases query and one catalog query, but got {store_queries(cold)}")
+        self.assertEqual(store_queries(warm), [], msg=f"Expected the cached summary to be used, but got {store_queries(warm)}")
+
+    def test_profile_summary_updated_after_purchase(self):
+        """Tests that buying a product shows up on a profile that was already cached."""
+        profile = create_profile("mscott", "Michael", "Scott", True, display_purchases=True)
+        Profile.objects.filter(user=profile.user).update(wallet=30)
+        product = Product.objects.create(name="Stapler", point_cost=10, amount_sold=0)
+
+        self.client.force_login(profile.user)
+        _ = self.client.get(reverse('profile', args=[profile.user.id]))
+        with self.captureOnCommitCallbacks(execute=True):
+            _ = self.client.post(reverse('buy_page', args=[product.id]))
+        response = self.client.get(reverse('profile', args=[profile.user.id]))
+
+        self.assertEqual(response.context['summary']['purchase_count'], 1, msg="Expected the new purchase to be counted, but failed.")
+        self.assertEqual(response.context['summary']['wallet'], 20, msg="Expected the wallet to show the product's cost spent, but failed.")
+
+    def test_profile_summary_updated_after_points_received(self):
+        """Tests that points sent to a user show up on their profile after it was cached."""
+        profile1 = create_profile("mscott", "Michael", "Scott", True, points=30)
+        profile2 = create_profile("dschrute", "Dwight", "Schrute", True)
+        convo = create_convo("mscott-dschrute", [profile1, profile2])
+
+        self.client.force_login(profile1.user)
+        _ = self.client.get(reverse('profile', args=[profile2.user.id]))
+        _ = self.client.post(reverse('conversation', args=[convo.id]), {'body': "Hi Dwight! 🐶"})
+        response = self.client.get(reverse('profile', args=[profile2.user.id]))
+
+        self.assertEqual(response.context['summary']['allTimePoints'], 10, msg="Expected the received points to be shown, but failed.")
+
+class ConversationViewTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        # Rendered message lists are cached by conversation id, which get reused between tests
+        cache.clear()
+
     def test_convo_one_message_convo_returned(self):
         """Tests that a conversation is returned when it has one message."""
         profile1 = create_profile("mscott", "Michael", "Scott", True, 0)
@@ -293,6 +1123,25 @@ class ConversationViewTests(TestCase):
         self.assertEqual(profile2.allTimePoints, expected_points,
         f"Expected sending a token in a message to give {expected_points} points, but the recipient has {profile2.allTimePoints} instead.")
 
+    def test_convo_post_stores_sanitized_html(self):
+        """Tests that a posted message keeps the editor's whole body, and is shown sanitized."""
+        profile1 = create_profile("mscott", "Michael", "Scott", True, points=30)
+        profile2 = create_profile("dschrute", "Dwight", "Schrute", False)
+        convo = create_convo("mscott-dschrute", [profile1, profile2])
+
+        data = {
+            'body': "<p>Hi Dwight! 🐶<script>alert(1)</script></p>"
+        }
+
+        self.client.force_login(profile1.user)
+        _ = self.client.post(reverse('conversation', args=[convo.id]), data)
+        message = Message.objects.get(conversation=convo)
+        response = self.client.get(reverse('conversation', args=[convo.id]))
+
+        self.assertEquals(message.points, 10, msg=f"Expected the message to be worth 10 points, but it's worth {message.points}.")
+        self.assertContains(response, "<p>Hi Dwight! 🐶</p>", msg_prefix="Expected the sanitized message to be shown")
+        self.assertNotContains(response, "alert(1)", msg_prefix="Expected the script to be stripped")
+
     def test_convo_two_users_send_points_updates_wallet(self):
         """Tests that a user can send points to another user and update the other's wallet."""
         profile1 = create_profile("mscott", "Michael", "Scott", True, points=30)
@@ -372,7 +1221,567 @@ class ConversationViewTests(TestCase):
         self.assertTrue(correct_points_received,
         f"Expected sending a token in a group message to give {expected_points} points per user, but the receivers have {profile2.allTimePoints} and {profile3.allTimePoints} instead.")
 
-class InboxViewTests(TestCase):
+    def test_convo_long_convo_newest_page_returned(self):
+        """Tests that only the newest page of messages is returned for a long conversation, oldest first."""
+        MESSAGE_PAGE_SIZE = 50
+        profile1 = create_profile("mscott", "Michael", "Scott", True)
+        profile2 = create_profile("dschrute", "Dwight", "Schrute", False)
+        convo = create_convo("mscott-dschrute", [profile1, profile2])
+        all_messages = [create_message(profile1, convo, f"Message {i}") for i in range(MESSAGE_PAGE_SIZE + 5)]
+
+        self.client.force_login(profile1.user)
+
+        response = self.client.get(reverse('conversation', args=[convo.id]))
+        self.assertEquals(
+            response.context['messages'],
+            all_messages[5:],
+            msg=f"Expected the newest {MESSAGE_PAGE_SIZE} messages to be returned in a conversation with name {convo.name}, but failed."
+        )
+        self.assertIsNotNone(response.context['older_cursor'], msg="Expected a cursor for the older messages, but there wasn't one.")
+
+    def test_convo_older_messages_returned(self):
+        """Tests that the older messages endpoint returns the page before the given cursor."""
+        MESSAGE_PAGE_SIZE = 50
+        profile1 = create_profile("mscott", "Michael", "Scott", True)
+        profile2 = create_profile("dschrute", "Dwight", "Schrute", False)
+        convo = create_convo("mscott-dschrute", [profile1, profile2])
+        all_messages = [create_message(profile1, convo, f"Message {i}") for i in range(MESSAGE_PAGE_SIZE + 5)]
+
+        self.client.force_login(profile1.user)
+
+        newest = self.client.get(reverse('conversation', args=[convo.id]))
+        response = self.client.get(reverse('olderMessages', args=[convo.id]), {'before': newest.context['older_cursor']})
+        self.assertEquals(
+            response.context['messages'],
+            all_messages[:5],
+            msg=f"Expected the 5 oldest messages to be returned as the older page, but failed."
+        )
+        self.assertIsNone(response.context['older_cursor'], msg="Expected no cursor after the oldest page, but there was one.")
+
+    def test_convo_repeat_view_doesnt_write_marker(self):
+        """Tests that viewing a conversation with nothing new in it doesn't write the read marker again."""
+        profile1 = create_profile("mscott", "Michael", "Scott", True)
+        profile2 = create_profile("dschrute", "Dwight", "Schrute", False)
+        convo = create_convo("mscott-dschrute", [profile1, profile2])
+        _ = create_message(profile2, convo, "Hello Michael.")
+
+        self.client.force_login(profile1.user)
+        _ = self.client.get(reverse('conversation', args=[convo.id]))
+        first_read = ReadMarker.objects.get(user=profile1.user, conversation=convo).updated
+
+        with CaptureQueriesContext(connection) as queries:
+            _ = self.client.get(reverse('conversation', args=[convo.id]))
+
+        inserts = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('INSERT INTO "messaging_readmarker"')]
+        marker = ReadMarker.objects.get(user=profile1.user, conversation=convo)
+        self.assertEquals(inserts, [], msg=f"Expected the existing read marker not to be created again, but got {inserts}.")
+        self.assertEquals(marker.updated, first_read, msg="Expected the up to date read marker not to be written, but it was.")
+        self.assertEquals(marker.read_count, 1, msg=f"Expected the marker to stay at 1 message read, but it's at {marker.read_count}.")
+
+    def test_convo_non_member(self):
+        """Tests that a user can't read a conversation they aren't in."""
+        profile1 = create_profile("mscott", "Michael", "Scott", True)
+        profile2 = create_profile("dschrute", "Dwight", "Schrute", False)
+        outsider = create_profile("jhalpert", "Jim", "Halpert", False)
+        convo = create_convo("mscott-dschrute", [profile1, profile2])
+        _ = create_message(profile1, convo, "Secret")
+
+        self.client.force_login(outsider.user)
+
+        response = self.client.get(reverse('conversation', args=[convo.id]))
+        self.assertEquals(response.status_code, 404, msg=f"Expected a non-member to get a 404, but got {response.status_code}.")
+        self.assertFalse(ReadMarker.objects.filter(user=outsider.user).exists(), msg="Expected no read marker for a non-member, but there was one.")
+
+    def test_convo_non_member_post(self):
+        """Tests that a user can't post in a conversation they aren't in."""
+        profile1 = create_profile("mscott", "Michael", "Scott", True)
+        profile2 = create_profile("dschrute", "Dwight", "Schrute", False)
+        outsider = create_profile("jhalpert", "Jim", "Halpert", False)
+        convo = create_convo("mscott-dschrute", [profile1, profile2])
+
+        self.client.force_login(outsider.user)
+
+        response = self.client.post(reverse('conversation', args=[convo.id]), {'body': "<p>Bears. Beets.</p>"})
+        self.assertEquals(response.status_code, 404, msg=f"Expected a non-member's post to get a 404, but got {response.status_code}.")
+        self.assertFalse(Message.objects.filter(conversation=convo).exists(), msg="Expected a non-member's message not to be saved, but it was.")
+
+    def test_convo_missing(self):
+        """Tests that a conversation that doesn't exist is a 404, not an error."""
+        profile = create_profile("mscott", "Michael", "Scott", True)
+        self.client.force_login(profile.user)
+
+        response = self.client.get(reverse('conversation', args=[12345]))
+        self.assertEquals(response.status_code, 404, msg=f"Expected a missing conversation to 404, but got {response.status_code}.")
+
+    def test_convo_older_messages_non_member(self):
+        """Tests that a user can't page through the messages of a conversation they aren't in."""
+        profile1 = create_profile("mscott", "Michael", "Scott", True)
+        profile2 = create_profile("dschrute", "Dwight", "Schrute", False)
+        outsider = create_profile("jhalpert", "Jim", "Halpert", False)
+        convo = create_convo("mscott-dschrute", [profile1, profile2])
+        _ = create_message(profile1, convo, "Secret")
+
+        self.client.force_login(outsider.user)
+
+        response = self.client.get(reverse('olderMessages', args=[convo.id]))
+        self.assertEquals(response.status_code, 404, msg=f"Expected a non-member to get a 404, but got {response.status_code}.")
+
+    def test_convo_repeat_view_uses_cached_messages(self):
+        """Tests that viewing a conversation again doesn't fetch its messages, but still shows them."""
+        profile1 = create_profile("mscott", "Michael", "Scott", True)
+        profile2 = create_profile("dschrute", "Dwight", "Schrute", False)
+        convo = create_convo("mscott-dschrute", [profile1, profile2])
+        _ = create_message(profile1, convo, "Hi Dwight!")
+
+        self.client.force_login(profile1.user)
+        _ = self.client.get(reverse('conversation', args=[convo.id]))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('conversation', args=[convo.id]))
+
+        message_queries = [query['sql'] for query in queries if 'FROM "messaging_message"' in query['sql']]
+        self.assertEqual(message_queries, [], msg=f"Expected the cached message list to be used, but the messages were queried: {message_queries}")
+        self.assertContains(response, "Hi Dwight!", msg_prefix="Expected the cached message to be shown")
+
+    def test_convo_new_message_shown_after_cached_view(self):
+        """Tests that a message sent after the list was cached is shown on the next view."""
+        profile1 = create_profile("mscott", "Michael", "Scott", True, points=30)
+        profile2 = create_profile("dschrute", "Dwight", "Schrute", False)
+        convo = create_convo("mscott-dschrute", [profile1, profile2])
+        _ = create_message(profile2, convo, "Hello Michael.")
+
+        self.client.force_login(profile1.user)
+        _ = self.client.get(reverse('conversation', args=[convo.id]))
+        response = self.client.post(reverse('conversation', args=[convo.id]), {'body': "Hi Dwight!"}, follow=True)
+
+        self.assertContains(response, "Hello Michael.", msg_prefix="Expected the older message to still be shown")
+        self.assertContains(response, "You: Hi Dwight!", msg_prefix="Expected the new message to be shown after sending it")
+
+    def test_convo_edited_message_shown_after_cached_view(self):
+        """Tests that editing a message that's already in the cached list shows the edit on the next view."""
+        profile1 = create_profile("mscott", "Michael", "Scott", True)
+        profile2 = create_profile("dschrute", "Dwight", "Schrute", False)
+        convo = create_convo("mscott-dschrute", [profile1, profile2])
+        message = create_message(profile2, convo, "Hello Michael.")
+
+        self.client.force_login(profile1.user)
+        _ = self.client.get(reverse('conversation', args=[convo.id]))
+        message.body = "<p>Hello Michael!</p>"
+        message.render()
+        with self.captureOnCommitCallbacks(execute=True):
+            message.save()
+
+        response = self.client.get(reverse('conversation', args=[convo.id]))
+        self.assertContains(response, "Hello Michael!", msg_prefix="Expected the edited message to be shown")
+        self.assertNotContains(response, "Hello Michael.", msg_prefix="Expected the cached copy of the message to be dropped")
+
+    def test_convo_renamed_sender_shown_after_cached_view(self):
+        """Tests that a sender's new username shows on their messages, even with the list already cached."""
+        profile1 = create_profile("mscott", "Michael", "Scott", True)
+        profile2 = create_profile("dschrute", "Dwight", "Schrute", False)
+        convo = create_convo("mscott-dschrute", [profile1, profile2])
+        _ = create_message(profile2, convo, "Hello Michael.")
+
+        self.client.force_login(profile1.user)
+        _ = self.client.get(reverse('conversation', args=[convo.id]))
+        profile2.user.username = "assistanttorm"
+        with self.captureOnCommitCallbacks(execute=True):
+            profile2.user.save()
+
+        response = self.client.get(reverse('conversation', args=[convo.id]))
+        self.assertContains(response, "@assistanttorm", msg_prefix="Expected the sender's new username to be shown")
+
+    def test_convo_cached_list_per_viewer(self):
+        """Tests that each member sees their own messages as theirs, even with the list cached for the other member."""
+        profile1 = create_profile("mscott", "Michael", "Scott", True)
+        profile2 = create_profile("dschrute", "Dwight", "Schrute", False)
+        convo = create_convo("mscott-dschrute", [profile1, profile2])
+        _ = create_message(profile1, convo, "Hi Dwight!")
+
+        self.client.force_login(profile1.user)
+        _ = self.client.get(reverse('conversation', args=[convo.id]))
+        self.client.force_login(profile2.user)
+        response = self.client.get(reverse('conversation', args=[convo.id]))
+
+        self.assertNotContains(response, "You: Hi Dwight!", msg_prefix="Expected the other member's message not to be shown as the viewer's")
+        self.assertContains(response, "@mscott</a>: Hi Dwight!", msg_prefix="Expected the message to be shown as the sender's")
+
+    def test_convo_group_send_points_not_enough_for_everyone(self):
+        """Tests that no one gets points if the sender can't afford to send them to every member."""
+        profile1 = create_profile("mscott", "Michael", "Scott", True, points=15)
+        profile2 = create_profile("dschrute", "Dwight", "Schrute", False)
+        profile3 = create_profile("jhalpert", "Jim", "Halpert", False)
+        convo = create_convo("mscott-dschrute-jhalpert", [profile1, profile2, profile3])
+
+        data = {
+            'body': "Hi Dwight and Jim! 🐶 xoxoxo"
+        }
+
+        # Post the message, which would cost 20 points in total
+        self.client.force_login(profile1.user)
+        _ = self.client.post(reverse('conversation', args=[convo.id]), data)
+        profile1.refresh_from_db()
+        profile2.refresh_from_db()
+
+        self.assertEqual(profile1.points, 15, f"Expected the sender to keep their 15 points, but they have {profile1.points} instead.")
+        self.assertEqual(profile2.wallet, 0, f"Expected the receiver to get no points, but they have {profile2.wallet} instead.")
+
+    def test_convo_stale_allowance_refreshed_on_send(self):
+        """Tests that a user's allowance from a previous day is reset when they next send points."""
+        profile1 = create_profile("mscott", "Michael", "Scott", True, points=5)
+        profile2 = create_profile("dschrute", "Dwight", "Schrute", False)
+        convo = create_convo("mscott-dschrute", [profile1, profile2])
+        Profile.objects.filter(user=profile1.user).update(allowanceDay=timezone.localdate() - timedelta(days=1))
+
+        data = {
+            'body': "Hi Dwight! 🐶 xoxoxo"
+        }
+
+        # Post the message, which sends the points from a fresh allowance
+        self.client.force_login(profile1.user)
+        _ = self.client.post(reverse('conversation', args=[convo.id]), data)
+        profile1.refresh_from_db()
+        profile2.refresh_from_db()
+
+        self.assertEqual(profile1.points, 90, f"Expected the sender's allowance to reset to 100 and leave 90 points, but they have {profile1.points} instead.")
+        self.assertEqual(profile2.wallet, 10, f"Expected the receiver to get 10 points, but they have {profile2.wallet} instead.")
+
+class ScoringTests(TestCase):
+    def tearDown(self):
+        # The scanner is cached per process, and test rollbacks don't send the signals that drop it
+        invalidate_scanner()
+
+    def test_get_points_default_weights(self):
+        """Tests that every default emoji is worth 10 points, however many times it's used."""
+        points = get_points("🐶🐶 hi 🦖🐾!")
+        self.assertEquals(points, 40, msg=f"Expected 4 emojis to be worth 40 points, but got {points}.")
+
+    def test_get_points_uses_changed_weight(self):
+        """Tests that changing an emoji's weight is used for the next message scored."""
+        _ = get_points("🐶")
+        EmojiWeight.objects.filter(emoji="🐶").update(points=25)
+        EmojiWeight.objects.create(emoji="🍕", points=3)
+
+        points = get_points("🐶🍕🐱")
+        self.assertEquals(points, 38, msg=f"Expected the new weights to add up to 38 points, but got {points}.")
+
+    def test_emoji_tips_follow_weights(self):
+        """Tests that the tips next to the editor list the current weights, grouped by points, instead of a fixed list."""
+        profile1 = create_profile("mscott", "Michael", "Scott", True)
+        profile2 = create_profile("dschrute", "Dwight", "Schrute", False)
+        convo = create_convo("mscott-dschrute", [profile1, profile2])
+        dog = EmojiWeight.objects.get(emoji="🐶")
+        dog.points = 25
+        dog.save()
+
+        self.client.force_login(profile1.user)
+        response = self.client.get(reverse('conversation', args=[convo.id]))
+
+        self.assertContains(response, "Emojis worth 25 points: 🐶<br>", msg_prefix="Expected the changed weight to be listed on its own")
+        self.assertContains(response, "Emojis worth 10 points: 🐱 |", msg_prefix="Expected the other emojis to still be worth 10 points")
+
+    def test_rescore_messages_command(self):
+        """Tests that re-scoring updates the points of old messages to match the current weights."""
+        sender = create_profile("mscott", "Michael", "Scott", True)
+        receiver = create_profile("dschrute", "Dwight", "Schrute", False)
+        convo = create_convo("mscott-dschrute", [sender, receiver])
+        message = Message.objects.create(sender=sender.user, conversation=convo, body="🐶🐱", points=20)
+        unchanged = Message.objects.create(sender=sender.user, conversation=convo, body="🐱", points=10)
+
+        EmojiWeight.objects.filter(emoji="🐶").update(points=50)
+        out = StringIO()
+        call_command('rescore_messages', chunk_size=1, stdout=out)
+
+        message.refresh_from_db()
+        unchanged.refresh_from_db()
+        self.assertEquals(message.points, 60, msg=f"Expected the message to be re-scored to 60 points, but it has {message.points}.")
+        self.assertEquals(unchanged.points, 10, msg=f"Expected the other message to keep 10 points, but it has {unchanged.points}.")
+        self.assertIn("Re-scored 1 of 2", out.getvalue(), msg=f"Expected 1 of 2 messages to change, but got: {out.getvalue()}")
+
+class DailyPointsTests(TestCase):
+    def test_send_points_rolls_up_today(self):
+        """Tests that sending points adds them to today's rollups for the sender and every recipient."""
+        sender = create_profile("mscott", "Michael", "Scott", True, points=100)
+        receiver1 = create_profile("dschrute", "Dwight", "Schrute", False)
+        receiver2 = create_profile("jhalpert", "Jim", "Halpert", False)
+        convo = create_convo("mscott-dschrute-jhalpert", [sender, receiver1, receiver2])
+        members = [sender.user, receiver1.user, receiver2.user]
+
+        for _ in range(2):
+            message = Message.objects.create(sender=sender.user, conversation=convo, body="🐶", points=10)
+            send_points(message, members, sender.user)
+
+        today = timezone.localdate()
+        sent = DailyPoints.objects.get(profile=sender, day=today)
+        received = DailyPoints.objects.filter(profile__in=[receiver1, receiver2], day=today, received=20, sent=0)
+        self.assertEquals(sent.sent, 40, msg=f"Expected the sender's rollup to have 40 points sent, but it has {sent.sent}.")
+        self.assertEquals(received.count(), 2, msg=f"Expected both recipients to have 20 points received today, but {received.count()} did.")
+
+    def test_rebuild_daily_points_matches_incremental(self):
+        """Tests that the catch-up command rebuilds the same rollups from the ledger as sending points wrote."""
+        sender = create_profile("mscott", "Michael", "Scott", True, points=100)
+        receiver = create_profile("dschrute", "Dwight", "Schrute", False)
+        convo = create_convo("mscott-dschrute", [sender, receiver])
+        with freeze_time(timezone.now() - timedelta(days=1)):
+            message = Message.objects.create(sender=sender.user, conversation=convo, body="🐶", points=10)
+            send_points(message, [sender.user, receiver.user], sender.user)
+
+        expected = list(DailyPoints.objects.order_by('profile').values_list('profile', 'day', 'received', 'sent'))
+        DailyPoints.objects.all().delete()
+        call_command('rebuild_daily_points', days=1, stdout=StringIO())
+
+        rebuilt = list(DailyPoints.objects.order_by('profile').values_list('profile', 'day', 'received', 'sent'))
+        self.assertEquals(rebuilt, expected, msg=f"Expected the rebuilt rollups to be {expected}, but got {rebuilt}.")
+
+    def test_rebuild_daily_points_leaves_today(self):
+        """Tests that rebuilding doesn't touch today's rollups, which transfers are still adding to."""
+        sender = create_profile("mscott", "Michael", "Scott", True, points=100)
+        receiver = create_profile("dschrute", "Dwight", "Schrute", False)
+        convo = create_convo("mscott-dschrute", [sender, receiver])
+        message = Message.objects.create(sender=sender.user, conversation=convo, body="🐶", points=10)
+        send_points(message, [sender.user, receiver.user], sender.user)
+
+        # Stands in for a transfer added to today's rollup after the rebuild read the ledger
+        DailyPoints.objects.filter(profile=receiver).update(received=F('received') + 10)
+        expected = list(DailyPoints.objects.order_by('profile').values_list('profile', 'day', 'received', 'sent'))
+
+        call_command('rebuild_daily_points', days=3, stdout=StringIO())
+
+        rollups = list(DailyPoints.objects.order_by('profile').values_list('profile', 'day', 'received', 'sent'))
+        self.assertEquals(rollups, expected, msg=f"Expected today's rollups to be left as {expected}, but got {rollups}.")
+
+class ConversationConsumerTests(TransactionTestCase):
+    # The consumer reads the database from another thread, so the data has to be committed - and the
+    # seeded emoji weights put back after each test
+    serialized_rollback = True
+
+    def connect(self, profile: Profile, convo: Conversation) -> WebsocketCommunicator:
+        """Helper function that opens a conversation's socket as a user."""
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/conversation/{convo.id}/")
+        communicator.scope['user'] = profile.user
+        return communicator
+
+    async def test_consumer_pushes_new_message_and_points(self):
+        """Tests that a member with the conversation open gets new messages and the points sent to them."""
+        sender = await database_sync_to_async(create_profile)("mscott", "Michael", "Scott", True, points=30)
+        receiver = await database_sync_to_async(create_profile)("dschrute", "Dwight", "Schrute", False)
+        convo = await database_sync_to_async(create_convo)("mscott-dschrute", [sender, receiver])
+
+        communicator = self.connect(receiver, convo)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected, msg="Expected a member to be able to open the conversation's socket, but they couldn't.")
+
+        def send():
+            message = post_message(sender.user, convo, "<p>Hi Dwight! 🐶</p>")
+            members = [sender.user, receiver.user]
+            sent = send_points(message, members, sender.user)
+            broadcast_message(message, [receiver.user.id] if sent else [])
+        await database_sync_to_async(send)()
+
+        pushed_message = await communicator.receive_json_from()
+        pushed_points = await communicator.receive_json_from()
+        await communicator.disconnect()
+        read_count = await database_sync_to_async(
+            lambda: ReadMarker.objects.filter(user=receiver.user, conversation=convo).values_list('read_count', flat=True).first()
+        )()
+
+        self.assertIn("@mscott", pushed_message['html'], msg=f"Expected the message to be pushed from the sender, but got {pushed_message}.")
+        self.assertIn("<p>Hi Dwight! 🐶</p>", pushed_message['html'], msg=f"Expected the rendered message to be pushed, but got {pushed_message}.")
+        self.assertEquals(
+            pushed_points,
+            {'type': 'points', 'sender': 'mscott', 'points': 10},
+            msg=f"Expected the recipient to be told about their 10 points, but got {pushed_points}."
+        )
+        self.assertEquals(read_count, 1, msg=f"Expected the pushed message to be marked as read, but the marker's count was {read_count}.")
+
+    async def test_consumer_rejects_non_member(self):
+        """Tests that a user who isn't in a conversation can't open its socket."""
+        profile1 = await database_sync_to_async(create_profile)("mscott", "Michael", "Scott", True)
+        profile2 = await database_sync_to_async(create_profile)("dschrute", "Dwight", "Schrute", False)
+        outsider = await database_sync_to_async(create_profile)("jhalpert", "Jim", "Halpert", False)
+        convo = await database_sync_to_async(create_convo)("mscott-dschrute", [profile1, profile2])
+
+        communicator = self.connect(outsider, convo)
+        connected, _ = await communicator.connect()
+
+        self.assertFalse(connected, msg="Expected a non-member to be refused the conversation's socket, but they weren't.")
+
+class CreateConvoViewTests(QueryBudgetMixin, TestCase):
+    def test_create_convo_new_group(self):
+        """Tests that messaging a new set of users makes one group with all of them in it."""
+        profile1 = create_profile("mscott", "Michael", "Scott", True, points=30)
+        profile2 = create_profile("dschrute", "Dwight", "Schrute", False)
+        profile3 = create_profile("jhalpert", "Jim", "Halpert", False)
+
+        self.client.force_login(profile1.user)
+        _ = self.client.post(reverse('createConvo'), {'send_to': "dschrute, jhalpert", 'body': "Hi all! 🐶"})
+
+        convo = Conversation.objects.get()
+        members = set(convo.userGroup.members.values_list('username', flat=True))
+        self.assertEquals(members, {"mscott", "dschrute", "jhalpert"}, msg=f"Expected the group to have all 3 users, but it has {members}.")
+        self.assertEquals(
+            convo.userGroup.memberKey,
+            get_member_key([profile1.user.id, profile2.user.id, profile3.user.id]),
+            msg="Expected the group to be keyed by its members, but it wasn't."
+        )
+
+    def test_create_convo_reuses_group(self):
+        """Tests that messaging the same users again, in any order, uses their existing conversation."""
+        profile1 = create_profile("mscott", "Michael", "Scott", True, points=30)
+        profile2 = create_profile("dschrute", "Dwight", "Schrute", False)
+        profile3 = create_profile("jhalpert", "Jim", "Halpert", False)
+        convo = create_convo("dschrute-jhalpert-mscott", [profile2, profile3, profile1])
+
+        self.client.force_login(profile1.user)
+        response = self.client.post(reverse('createConvo'), {'send_to': "jhalpert,dschrute", 'body': "Hi again!"})
+
+        self.assertRedirects(response, reverse('conversation', args=[convo.id]), msg_prefix="Expected the existing conversation to be used")
+        self.assertEquals(Conversation.objects.count(), 1, msg="Expected no new conversation to be made, but one was.")
+
+    def test_create_convo_username_substring(self):
+        """Tests that a group isn't matched just because a username contains another one."""
+        profile1 = create_profile("mscott", "Michael", "Scott", True, points=30)
+        profile2 = create_profile("jim", "Jim", "Halpert", False)
+        profile3 = create_profile("jimbo", "Jimbo", "Halpert", False)
+        _ = create_convo("jimbo-mscott", [profile3, profile1])
+
+        self.client.force_login(profile1.user)
+        _ = self.client.post(reverse('createConvo'), {'send_to': "jim", 'body': "Hi Jim!"})
+
+        convo = Conversation.objects.get(userGroup__members=profile2.user)
+        members = set(convo.userGroup.members.values_list('username', flat=True))
+        self.assertEquals(members, {"mscott", "jim"}, msg=f"Expected a new group with just jim, but got {members}.")
+
+    def test_create_convo_unknown_user(self):
+        """Tests that messaging a user who doesn't exist shows an error, and makes no conversation."""
+        profile1 = create_profile("mscott", "Michael", "Scott", True, points=30)
+
+        self.client.force_login(profile1.user)
+        response = self.client.post(reverse('createConvo'), {'send_to': "nobody", 'body': "Hello?"})
+
+        self.assertContains(response, "No users named nobody", msg_prefix="Expected an error for the unknown user")
+        self.assertEquals(Conversation.objects.count(), 0, msg="Expected no conversation to be made, but one was.")
+
+class MessagesSinceViewTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.profile1 = create_profile("mscott", "Michael", "Scott", True)
+        self.profile2 = create_profile("dschrute", "Dwight", "Schrute", False)
+        self.convo = create_convo("mscott-dschrute", [self.profile1, self.profile2])
+        self.client.force_login(self.profile1.user)
+        self.async_client.force_login(self.profile1.user)
+
+    def test_messages_since_after_id(self):
+        """Tests that only the messages after the given id are returned, with their senders."""
+        old_message = create_message(self.profile1, self.convo, "Hi Dwight!")
+        _ = ReadMarker.objects.create(user=self.profile1.user, conversation=self.convo, last_read_message=old_message, read_count=1)
+        new_message = create_message(self.profile2, self.convo, "Hello Michael.")
+
+        # 4 to get the messages, and 2 to move the read marker past them
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('messagesSince', args=[self.convo.id]), {'after': old_message.id})
+        data = response.json()
+
+        self.assertEquals([message['id'] for message in data['messages']], [new_message.id], msg=f"Expected only the newer message, but got {data['messages']}.")
+        self.assertEquals(data['messages'][0]['sender']['username'], "dschrute", msg=f"Expected the sender to be included, but got {data['messages'][0]}.")
+        self.assertEquals(data['last_id'], new_message.id, msg=f"Expected the cursor to be the newest message, but got {data['last_id']}.")
+
+    def test_messages_since_timestamp(self):
+        """Tests that only the messages after the given timestamp are returned."""
+        with freeze_time("2026-01-01 12:00:00"):
+            _ = create_message(self.profile1, self.convo, "Hi Dwight!")
+        with freeze_time("2026-01-01 12:05:00"):
+            new_message = create_message(self.profile2, self.convo, "Hello Michael.")
+
+        response = self.client.get(reverse('messagesSince', args=[self.convo.id]), {'since': "2026-01-01T12:01:00+00:00"})
+
+        ids = [message['id'] for message in response.json()['messages']]
+        self.assertEquals(ids, [new_message.id], msg=f"Expected only the message sent after 12:01, but got {ids}.")
+
+    async def test_messages_since_long_poll(self):
+        """Tests that long-polling is woken by a new message's broadcast, without checking the database every second."""
+        old_message = await sync_to_async(create_message)(self.profile1, self.convo, "Hi Dwight!")
+
+        async def reply():
+            # Dwight replies while the request is waiting
+            await asyncio.sleep(0.2)
+            message = await sync_to_async(create_message)(self.profile2, self.convo, "Hello Michael.")
+            event = {'type': 'message.new', 'message': await sync_to_async(serialize_message)(message)}
+            await get_channel_layer().group_send(conversation_group(self.convo.id), event)
+
+        start = time.monotonic()
+        response, _ = await asyncio.gather(
+            self.async_client.get(reverse('messagesSince', args=[self.convo.id]), {'after': old_message.id, 'timeout': 10}),
+            reply(),
+        )
+
+        bodies = [message['body_html'] for message in response.json()['messages']]
+        self.assertEquals(bodies, ["Hello Michael."], msg=f"Expected the reply sent while waiting, but got {bodies}.")
+        self.assertLess(time.monotonic() - start, 2, msg="Expected the broadcast to wake the request straight away.")
+
+    def test_messages_since_long_poll_timeout(self):
+        """Tests that long-polling returns nothing new once its timeout passes without a message."""
+        old_message = create_message(self.profile1, self.convo, "Hi Dwight!")
+
+        response = self.client.get(reverse('messagesSince', args=[self.convo.id]), {'after': old_message.id, 'timeout': 0.3})
+
+        data = response.json()
+        self.assertEquals(data['messages'], [], msg=f"Expected no messages after the timeout, but got {data['messages']}.")
+        self.assertEquals(data['last_id'], old_message.id, msg=f"Expected the cursor to stay put, but got {data['last_id']}.")
+
+    def test_messages_since_marks_read(self):
+        """Tests that messages a member was shown by polling no longer count as unread."""
+        _ = create_message(self.profile2, self.convo, "Hello Michael.")
+        _ = create_message(self.profile2, self.convo, "Are you there?")
+
+        _ = self.client.get(reverse('messagesSince', args=[self.convo.id]))
+
+        marker = ReadMarker.objects.get(user=self.profile1.user, conversation=self.convo)
+        self.assertEquals(marker.read_count, 2, msg=f"Expected both messages to be marked as read, but the marker's count was {marker.read_count}.")
+
+    def test_messages_since_non_member(self):
+        """Tests that a user can't read the messages of a conversation they aren't in."""
+        outsider = create_profile("jhalpert", "Jim", "Halpert", False)
+        self.client.force_login(outsider.user)
+
+        response = self.client.get(reverse('messagesSince', args=[self.convo.id]))
+        self.assertEquals(response.status_code, 404, msg=f"Expected a non-member to get a 404, but got {response.status_code}.")
+
+class SendPointsTests(TestCase):
+    def test_send_points_query_count_constant(self):
+        """Tests that sending points to a big group takes as many queries as sending to one user."""
+        sender = create_profile("mscott", "Michael", "Scott", True, points=1000)
+        small_group = [sender] + [create_profile(f"small{i}", "Small", f"{i}", False) for i in range(1)]
+        big_group = [sender] + [create_profile(f"big{i}", "Big", f"{i}", False) for i in range(20)]
+
+        query_counts = []
+        for group in [small_group, big_group]:
+            convo = create_convo(f"group-{len(group)}", group)
+            message = Message.objects.create(sender=sender.user, conversation=convo, body="🐶", points=10)
+            with CaptureQueriesContext(connection) as queries:
+                send_points(message, [profile.user for profile in group], sender.user)
+            query_counts.append(len(queries.captured_queries))
+
+        self.assertEquals(query_counts[0], query_counts[1], msg=f"Expected sending points to use a fixed number of queries, but it used {query_counts}.")
+
+    def test_send_points_big_group_credits_everyone(self):
+        """Tests that every member of a big group gets the points, and the sender pays for all of them."""
+        sender = create_profile("mscott", "Michael", "Scott", True, points=1000)
+        group = [sender] + [create_profile(f"user{i}", "User", f"{i}", False) for i in range(20)]
+        convo = create_convo("big-group", group)
+        message = Message.objects.create(sender=sender.user, conversation=convo, body="🐶", points=10)
+
+        sent = send_points(message, [profile.user for profile in group], sender.user)
+        sender.refresh_from_db()
+
+        self.assertTrue(sent, msg="Expected the points to be sent, but they weren't.")
+        self.assertEquals(sender.points, 800, msg=f"Expected the sender to have 800 points left, but they have {sender.points}.")
+        self.assertEquals(
+            Profile.objects.filter(wallet=10, allTimePoints=10).count(),
+            20,
+            msg="Expected all 20 recipients to get 10 points, but failed."
+        )
+
+class InboxViewTests(QueryBudgetMixin, TestCase):
     def test_inbox_no_display_no_convos(self):
         """Tests that no conversations are rendered when none exist for a user."""
         prof = create_profile("mscott", "Michael", "Scott", True, 0)
@@ -448,12 +1857,136 @@ class InboxViewTests(TestCase):
             msg=f"Expected three conversations to be returned when {profile1.user.username} is logged in, but failed."
         )
 
-class LeaderboardViewTests(TestCase):
+    def test_inbox_query_count_constant(self):
+        """Tests that the number of queries to render the inbox doesn't grow with the number of conversations."""
+        user = create_profile("mscott", "Michael", "Scott", True, 0)
+        other = create_profile("dschrute", "Dwight", "Schrute", False, 0)
+        convo = create_convo("mscott-dschrute", [user, other])
+        _ = create_message(other, convo, "Hi Michael.")
+
+        self.client.force_login(user.user)
+        with CaptureQueriesContext(connection) as one_convo:
+            self.client.get(reverse('inbox'))
+
+        for i in range(5):
+            new_profile = create_profile(f"user{i}", "User", f"{i}", False, 0)
+            new_convo = create_convo(f"mscott-user{i}", [user, new_profile])
+            _ = create_message(new_profile, new_convo, f"Hello from user {i}.")
+
+        with CaptureQueriesContext(connection) as six_convos:
+            response = self.client.get(reverse('inbox'))
+
+        self.assertEquals(len(response.context['names']), 6)
+        self.assertEquals(
+            len(one_convo.captured_queries),
+            len(six_convos.captured_queries),
+            msg=f"Expected the inbox to use a fixed number of queries, but it used {len(one_convo.captured_queries)} for one conversation and {len(six_convos.captured_queries)} for six."
+        )
+
+    def test_inbox_shows_latest_message_and_names(self):
+        """Tests that each conversation is previewed with its latest message and the other members' full names."""
+        profile1 = create_profile("mscott", "Michael", "Scott", True, 0)
+        profile2 = create_profile("dschrute", "Dwight", "Schrute", False, 0)
+        profile3 = create_profile("jhalpert", "Jim", "Halpert", False, 0)
+        convo = create_convo("dschrute-jhalpert-mscott", [profile1, profile2, profile3])
+        _ = create_message(profile2, convo, "First!")
+        expected_msg = create_message(profile3, convo, "Second.")
+
+        self.client.force_login(profile1.user)
+
+        response = self.client.get(reverse('inbox'))
+        _, name, first = response.context['names'][0]
+        self.assertEquals(name, "Dwight Schrute, Jim Halpert", msg=f"Expected the other members' full names, but got {name}.")
+        self.assertEquals(first, expected_msg, msg=f"Expected the latest message to be previewed, but got {first}.")
+
+    def test_inbox_paginates_large_inbox(self):
+        """Tests that a large inbox is split into pages that can be walked with the returned cursor."""
+        INBOX_PAGE_SIZE = 20
+        user = create_profile("mscott", "Michael", "Scott", True, 0)
+        for i in range(INBOX_PAGE_SIZE + 5):
+            new_profile = create_profile(f"user{i}", "User", f"{i}", False, 0)
+            _ = create_convo(f"mscott-user{i}", [user, new_profile])
+
+        self.client.force_login(user.user)
+
+        first_page = self.client.get(reverse('inbox'))
+        second_page = self.client.get(reverse('inbox'), {'after': first_page.context['next_cursor']})
+
+        seen = [convo.id for convo, _, _ in first_page.context['names'] + second_page.context['names']]
+        self.assertEquals(len(first_page.context['names']), INBOX_PAGE_SIZE)
+        self.assertIsNone(second_page.context['next_cursor'], msg="Expected the second page to be the last one, but it had a cursor.")
+        self.assertEquals(len(set(seen)), INBOX_PAGE_SIZE + 5, msg="Expected every conversation to show up exactly once across the pages, but failed.")
+
+    def test_inbox_unread_count(self):
+        """Tests that the inbox counts the messages a user hasn't seen since they last opened a conversation."""
+        profile1 = create_profile("mscott", "Michael", "Scott", True, 0)
+        profile2 = create_profile("dschrute", "Dwight", "Schrute", False, 0)
+        convo = create_convo("mscott-dschrute", [profile1, profile2])
+        _ = create_message(profile2, convo, "Hello Michael.")
+
+        # Opening the conversation marks the first message as read
+        self.client.force_login(profile1.user)
+        _ = self.client.get(reverse('conversation', args=[convo.id]))
+        for i in range(3):
+            _ = create_message(profile2, convo, f"Are you there? {i}")
+
+        response = self.client.get(reverse('inbox'))
+        actual_unread = response.context['names'][0][0].unread
+        self.assertEquals(actual_unread, 3, msg=f"Expected 3 unread messages, but the inbox showed {actual_unread}.")
+
+    def test_inbox_unread_count_never_opened(self):
+        """Tests that every message counts as unread in a conversation the user never opened."""
+        profile1 = create_profile("mscott", "Michael", "Scott", True, 0)
+        profile2 = create_profile("dschrute", "Dwight", "Schrute", False, 0)
+        convo = create_convo("mscott-dschrute", [profile1, profile2])
+        _ = create_message(profile2, convo, "Hello Michael.")
+        _ = create_message(profile2, convo, "Hello again.")
+
+        self.client.force_login(profile1.user)
+
+        response = self.client.get(reverse('inbox'))
+        actual_unread = response.context['names'][0][0].unread
+        self.assertEquals(actual_unread, 2, msg=f"Expected 2 unread messages, but the inbox showed {actual_unread}.")
+
+    def test_inbox_doesnt_write_profile(self):
+        """Tests that loading the inbox doesn't save the user's profile."""
+        prof = create_profile("mscott", "Michael", "Scott", True, 0)
+
+        self.client.force_login(prof.user)
+        with CaptureQueriesContext(connection) as queries:
+            _ = self.client.get(reverse('inbox'))
+
+        profile_writes = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE "messaging_profile"')]
+        self.assertEquals(profile_writes, [], msg=f"Expected the inbox to not write to the profile, but it ran: {profile_writes}")
+
+class LeaderboardViewTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        # The leaderboard is cached, and the cache outlives each test's database
+        cache.clear()
+
     def test_leaderboard_no_users(self):
         """Tests that the leaderboard displays no profiles when none exist."""
         response = self.client.get(reverse('leaderboard'))
         self.assertQuerysetEqual(response.context['user_data'], [], msg="Leaderboard displays profiles when none were expected.")
 
+    def test_leaderboard_logged_in_within_budget(self):
+        """Tests that a signed in user's leaderboard, all time and windowed, stays within its query budget with a cold cache."""
+        profile = create_profile("jsmith", "John", "Smith", True)
+        self.client.force_login(profile.user)
+
+        for window in [None, 'week']:
+            cache.clear()
+            response = self.client.get(reverse('leaderboard'), {'window': window} if window else {})
+            self.assertWithinQueryBudget(response)
+
+    def test_leaderboard_cache_kept_on_login(self):
+        """Tests that signing in doesn't drop the cached leaderboard."""
+        _ = create_profile("jsmith", "John", "Smith", True, password='YuR46aeZR')
+        _ = self.client.get(reverse('leaderboard'))
+
+        self.client.login(username="jsmith", password='YuR46aeZR')
+        self.assertIsNotNone(cache.get(TOP_CACHE_KEY), msg="Expected the cached leaderboard to survive a login, but it was dropped.")
+
     def test_leaderboard_one_user_private(self):
         """Tests that the leaderboard displays no profiles when one has private data."""
         _ = create_profile("jsmith", "John", "Smith", display_points=False)
@@ -509,3 +2042,120 @@ class LeaderboardViewTests(TestCase):
             expected_user_data,
             msg=f"Leaderboard did not display the 10 expected users."
         )
+
+    def test_leaderboard_cached_no_queries(self):
+        """Tests that the leaderboard is served from the cache without any queries once it's warm."""
+        _ = create_profile("public1", "Public", "One", display_points=True, all_time_points=10)
+        _ = self.client.get(reverse('leaderboard'))
+
+        with self.assertNumQueries(0):
+            _ = self.client.get(reverse('leaderboard'))
+
+    def test_leaderboard_updated_by_sent_points(self):
+        """Tests that sending points updates the cached leaderboard in place, without rebuilding it."""
+        public1 = create_profile("public1", "Public", "One", display_points=True, points=100, all_time_points=10)
+        public2 = create_profile("public2", "Public", "Two", display_points=True, all_time_points=30)
+        convo = create_convo("public1-public2", [public1, public2])
+        message = Message.objects.create(sender=public2.user, conversation=convo, body="🐶🐶🐶", points=30)
+        _ = self.client.get(reverse('leaderboard'))
+
+        # Public Two sends Public One enough points to take the lead
+        Profile.objects.filter(user=public2.user).update(points=100)
+        send_points(message, [public1.user, public2.user], public2.user)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('leaderboard'))
+
+        expected_user_data = [(public1.user, 40), (public2.user, 30)]
+        self.assertEquals(
+            response.context['user_data'],
+            expected_user_data,
+            msg=f"Leaderboard displayed {response.context['user_data']}, when {expected_user_data} was expected after sending points."
+        )
+
+    def test_leaderboard_concurrent_points_ranked(self):
+        """Tests that ranks stay right when another transfer to the same user lands before the first updates the cache."""
+        me = create_profile("public1", "Public", "One", display_points=True, all_time_points=0)
+        other = create_profile("public2", "Public", "Two", display_points=True, all_time_points=15)
+        self.client.force_login(me.user)
+        _ = self.client.get(reverse('leaderboardAroundMe'))
+
+        # Two transfers of 10 points are committed, then each updates the cache
+        Profile.objects.filter(user=me.user).update(allTimePoints=F('allTimePoints') + 20)
+        record_points([me.user.id], 10)
+        record_points([me.user.id], 10)
+
+        self.client.force_login(other.user)
+        response = self.client.get(reverse('leaderboardAroundMe'))
+        self.assertEquals(response.context['rank'], 2, msg=f"Expected the user with 15 points to be ranked 2nd, but they were ranked {response.context['rank']}.")
+
+    def test_leaderboard_update_waiting_for_lock_drops_cache(self):
+        """Tests that points recorded while another update holds the lock drop the cached board, instead of overwriting it."""
+        public1 = create_profile("public1", "Public", "One", display_points=True, all_time_points=10)
+        _ = self.client.get(reverse('leaderboard'))
+        cache.add(LOCK_CACHE_KEY, 'another-worker', 5)
+
+        Profile.objects.filter(user=public1.user).update(allTimePoints=F('allTimePoints') + 10)
+        with patch('messaging.leaderboard.LOCK_WAIT', 0):
+            record_points([public1.user.id], 10)
+
+        self.assertIsNone(cache.get(TOP_CACHE_KEY), msg="Expected the cached leaderboard to be dropped, but it was kept.")
+
+    def test_leaderboard_around_me(self):
+        """Tests that a user's rank and the 5 users on either side of them are shown."""
+        public_profiles = []
+        for i in range(15):
+            new_profile = create_profile(f"public{i}", "Public", f"{i}", display_points=True, all_time_points=(i*10))
+            public_profiles.append(new_profile)
+
+        # public7 is 8th from the top
+        me = public_profiles[7]
+        self.client.force_login(me.user)
+        response = self.client.get(reverse('leaderboardAroundMe'))
+
+        expected_nearby = [(rank, public_profiles[14 - (rank - 1)].user, (14 - (rank - 1)) * 10) for rank in range(3, 14)]
+        self.assertEquals(response.context['rank'], 8, msg=f"Expected the user to be ranked 8th, but they were ranked {response.context['rank']}.")
+        self.assertEquals(
+            response.context['nearby'],
+            expected_nearby,
+            msg=f"Expected the 5 users on either side of the user, but got {response.context['nearby']}."
+        )
+
+    def test_leaderboard_around_me_private(self):
+        """Tests that a user with private points isn't ranked."""
+        me = create_profile("private1", "Private", "One", display_points=False, all_time_points=20)
+
+        self.client.force_login(me.user)
+        response = self.client.get(reverse('leaderboardAroundMe'))
+
+        self.assertIsNone(response.context['rank'], msg=f"Expected a private user to not be ranked, but they were ranked {response.context['rank']}.")
+
+    def test_leaderboard_weekly_window(self):
+        """Tests that the weekly leaderboard only sums the points public users received in the last 7 days."""
+        public1 = create_profile("public1", "Public", "One", display_points=True, all_time_points=500)
+        public2 = create_profile("public2", "Public", "Two", display_points=True)
+        private1 = create_profile("private1", "Private", "One", display_points=False)
+
+        today = timezone.localdate()
+        DailyPoints.objects.bulk_create([
+            DailyPoints(profile=public1, day=today - timedelta(days=10), received=500),
+            DailyPoints(profile=public1, day=today, received=5),
+            DailyPoints(profile=public2, day=today - timedelta(days=6), received=10),
+            DailyPoints(profile=public2, day=today, received=10),
+            DailyPoints(profile=private1, day=today, received=100),
+        ])
+
+        # Summing the rollups never touches the messages table
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('leaderboard'), {'window': 'week'})
+
+        expected_user_data = [(public2.user, 20), (public1.user, 5)]
+        self.assertEquals(
+            response.context['user_data'],
+            expected_user_data,
+            msg=f"Weekly leaderboard displayed {response.context['user_data']}, when {expected_user_data} was expected."
+        )
+        self.assertFalse(
+            any('messaging_message' in query['sql'] for query in queries.captured_queries),
+            msg="Expected the weekly leaderboard to not query messages, but it did."
+        )
@@ -0,0 +1,87 @@
+from django.core.files.base import ContentFile
+from django.db import transaction
+from io import BytesIO
+from PIL import Image, ImageOps
+import os
+
+from .jobs import enqueue
+
+# Longest side of each variant, in pixels - images are shown at up to ~150px, so 2x covers high-DPI screens
+THUMBNAIL_SIZES = [150, 300]
+THUMBNAIL_QUALITY = 80
+
+def variant_name(name: str, size: int, extension: str) -> str:
+    """
+    Gets the storage path of one variant of an image, next to the original.
+
+    :param name - the original image's storage path (e.g. from `get_image_path`)
+    :param size - the variant's longest side
+    :param extension - the variant's file extension
+    :return the variant's storage path
+    """
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, 'thumbnails', f'{stem}_{size}.{extension}')
+
+def generate_thumbnails(image) -> dict:
+    """
+    Saves resized copies of an uploaded image, each as WebP and as a JPEG (or PNG, if it's transparent).
+
+    :param image - the model's ImageField file
+    :return the thumbnails info to store on the model: the source image's path and, by size, each variant's path and width
+    """
+    with image.open('rb'):
+        source = Image.open(image)
+        source.load()
+
+    # Phone photos are often stored sideways with a rotation tag
+    source = ImageOps.exif_transpose(source)
+    transparent = source.mode in ('RGBA', 'LA', 'P')
+    source = source.convert('RGBA' if transparent else 'RGB')
+    fallback_format, fallback_extension = ('PNG', 'png') if transparent else ('JPEG', 'jpg')
+
+    sizes = {}
+    for size in THUMBNAIL_SIZES:
+        thumbnail = source.copy()
+        thumbnail.thumbnail((size, size), Image.LANCZOS)
+
+        paths = {}
+        for key, image_format, extension in [('fallback', fallback_format, fallback_extension), ('webp', 'WEBP', 'webp')]:
+            buffer = BytesIO()
+            thumbnail.save(buffer, image_format, quality=THUMBNAIL_QUALITY)
+
+            # Replace any old variant rather than saving next to it under a new name
+            path = variant_name(image.name, size, extension)
+            image.storage.delete(path)
+            paths[key] = image.storage.save(path, ContentFile(buffer.getvalue()))
+
+        sizes[str(size)] = dict(paths, width=thumbnail.width)
+
+    return {'source': image.name, 'sizes': sizes}
+
+def needs_thumbnails(instance) -> bool:
+    """Checks if a model's image has been uploaded (or changed) since its thumbnails were made."""
+    return bool(instance.image) and instance.thumbnails.get('source') != instance.image.name
+
+def schedule_thumbnails(instance) -> None:
+    """
+    Queues a background job to make a model's thumbnails, if its image needs them.
+
+    :param instance - a model with `image` and `thumbnails` fields
+    """
+    if needs_thumbnails(instance):
+        model_label = instance._meta.label
+        transaction.on_commit(lambda: enqueue('generate_thumbnails', model=model_label, pk=instance.pk))
+
+def srcset(thumbnails: dict, storage, variant: str='fallback') -> str:
+    """
+    Gets an `srcset` attribute value for an image's thumbnails.
+
+    :param thumbnails - the model's thumbnails info, from `generate_thumbnails`
+    :param storage - the storage the image is in
+    :param variant - (optional) 'fallback' or 'webp'
+    :return the URL and width of each size, smallest first (empty if there aren't any thumbnails yet)
+    """
+    # Images smaller than a size aren't scaled up, so sizes can come out the same width
+    by_width = {size['width']: size for size in thumbnails.get('sizes', {}).values()}
+    return ', '.join(f"{storage.url(by_width[width][variant])} {width}w" for width in sorted(by_width))
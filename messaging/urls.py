@@ -1,5 +1,3 @@
-from django.conf import settings
-from django.conf.urls.static import static
 from django.urls import path
 
 from . import views
@@ -12,8 +10,11 @@ urlpatterns = [
     path('changePassword/<str:pk>', views.change_password, name='changePassword'),
 
     path('leaderboard/', views.leaderboard, name='leaderboard'),
+    path('leaderboard/me/', views.leaderboard_around_me, name='leaderboardAroundMe'),
 
     path('conversation/<str:pk>', views.conversation, name='conversation'),
+    path('conversation/<str:pk>/older', views.older_messages, name='olderMessages'),
+    path('conversation/<str:pk>/since', views.messages_since, name='messagesSince'),
     path('createConvo', views.create_convo, name='createConvo'),
 
     path('profile/<str:pk>', views.profile, name='profile'),
@@ -21,6 +22,3 @@ urlpatterns = [
     
     path('', views.inbox, name='inbox'),
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,18 +1,33 @@
-from datetime import datetime
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout, update_session_auth_hash
-from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
 from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth.models import User
-from django.db.models import Q
-from django.shortcuts import render, redirect
-from functools import reduce
-import operator
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404, render, redirect
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import SimpleLazyObject
+import asyncio
+import time
 
 from .forms import CustomUserChangeForm, ProfileCreateForm, ProfileUpdateForm, MessageSend
-from .models import Profile, Conversation, Message, UserGroup
-from store.models import Purchase
+from .fragments import conversation_version
+from .leaderboard import rank_around, record_points, top_users
+from .ledger import record_transfer
+from .models import DAILY_POINTS, Profile, Conversation, Message, ReadMarker, UserGroup, get_member_key
+from .pagination import keyset_page
+from .profiles import invalidate_profile_summaries, owned_products, profile_summary
+from .read_markers import mark_read, mark_read_through
+from .realtime import broadcast_message, conversation_group, serialize_message
+from .rollups import LEADERBOARD_WINDOWS, record_daily_points, windowed_top_users
+from .scoring import score
 
 def get_points(body: str) -> int:
     """
@@ -21,37 +36,93 @@ def get_points(body: str) -> int:
     :param body - the body of the message
     :return the total number of points in the message
     """
-    POINT_VALUE = 10
+    # Every emoji's weight is in the database, and the body is scanned for all of them at once
+    return score(body)
 
-    emoji_list = ["🐶", "🐱", "🦋", "🐢", "🦄", "🐰", "🐾", "🦩", "🦈", "🦖"]
-    points = 0
-    for em in emoji_list:
-        points += body.count(em) * POINT_VALUE
+def _recipient_ids(members: list[User], sender: User) -> list[int]:
+    """Gets the ids of the members of a conversation other than the sender."""
+    return [member.id for member in members if member.id != sender.id]
 
-    return points
-
-def send_points(new_message: Message, members: list[User], sender: User) -> None:
+def send_points(new_message: Message, members: list[User], sender: User) -> bool:
     """
     Helper function to send points from the sender user to all the other members of a conversation.
 
-    :param newMessage - the new message being sent
+    Runs as one transaction with a fixed number of statements, however big the group is: a conditional
+    UPDATE that only debits the sender if they can afford the whole transfer, one UPDATE crediting
+    every recipient, one INSERT recording the transfer in the ledger and a few statements adding it to
+    today's rollups. The math happens in the database, so concurrent senders can't overwrite each other.
+
+    :param new_message - the new message being sent
     :param members - all of the users in the conversation
     :param sender - the user sending the message
+    :return True if the points were sent, False if the sender couldn't afford them (or there were none to send)
     """
     points_to_send = new_message.points
-    if sender.profile.points < points_to_send:
-        # Will send 0 points
-        return
-
-    sender.profile.points -= (points_to_send * (len(members) - 1))
-    sender.profile.save(update_fields=['points'])
-    for member in members:
-        if member.username != sender.username:
-            # Distribute points across users - update users' wallets and point totals
-            member.profile.wallet += points_to_send
-            member.profile.allTimePoints += points_to_send
-            member.profile.save(update_fields=['wallet', 'allTimePoints'])
-    
+    recipient_ids = _recipient_ids(members, sender)
+    total_cost = points_to_send * len(recipient_ids)
+    if total_cost <= 0:
+        return False
+
+    # A daily allowance from before today counts as fully reset, so it's only refreshed when it's spent
+    today = timezone.localdate()
+    fresh_allowance = Q(allowanceDay=today)
+    can_afford = fresh_allowance & Q(points__gte=total_cost)
+    if DAILY_POINTS >= total_cost:
+        can_afford |= ~fresh_allowance
+
+    with transaction.atomic():
+        debited = Profile.objects.filter(can_afford, user=sender).update(
+            points=Case(When(fresh_allowance, then=F('points') - total_cost), default=Value(DAILY_POINTS - total_cost)),
+            allowanceDay=today,
+        )
+        if not debited:
+            # Will send 0 points
+            return False
+
+        # Distribute points across users - update users' wallets and point totals
+        Profile.objects.filter(user__in=recipient_ids).update(
+            wallet=F('wallet') + points_to_send,
+            allTimePoints=F('allTimePoints') + points_to_send,
+        )
+        record_transfer(new_message, sender, recipient_ids, points_to_send)
+        record_daily_points(sender.id, recipient_ids, points_to_send)
+
+    record_points(recipient_ids, points_to_send)
+    invalidate_profile_summaries(recipient_ids)
+    return True
+
+def post_message(sender: User, convo: Conversation, body: str) -> Message:
+    """
+    Helper function that saves a new message from the editor, rendered and scored once at write time.
+
+    :param sender - the user sending the message
+    :param convo - the conversation it's sent in
+    :param body - the message's HTML, as sent by the editor
+    :return the new message
+    """
+    new_message = Message(sender=sender, conversation=convo, body=body)
+
+    # Emojis are only scored in the text people see, not in the markup around it
+    new_message.points = get_points(new_message.render())
+    new_message.save()
+    return new_message
+
+def get_message_page(convo: Conversation, before: str | None=None) -> tuple[list[Message], str | None]:
+    """
+    Helper function that gets one page of a conversation's messages, newest page first.
+
+    :param convo - the conversation to get messages from
+    :param before - (optional) the cursor of an already shown page, to get the messages before it
+    :return a tuple with the page's messages (oldest to newest) and the cursor for the page before it (None if there isn't one)
+    """
+    MESSAGE_PAGE_SIZE = 50
+    messages = Message.objects.filter(conversation=convo).select_related('sender')
+    page, older_cursor = keyset_page(messages, 'created', before, MESSAGE_PAGE_SIZE, descending=True)
+
+    # The page is fetched newest first, but is shown oldest first
+    page.reverse()
+    return page, older_cursor
+
 def login_page(request):
     """View for the site's login page."""
     page = 'login'
@@ -111,30 +182,28 @@ def register_user_page(request):
 @login_required(login_url='login')
 def inbox(request):
     """View for the user's inbox."""
-    USER_DEFAULT_POINTS = 100
-    profile = request.user.profile
-    
-    # Reset user's points if needed
-    if profile.lastInboxVisit != datetime.today:
-        profile.lastInboxVisit = datetime.now()
-        profile.points = USER_DEFAULT_POINTS
-        profile.save()
-
-    # Get the user's conversations
-    convos = Conversation.objects.filter(userGroup__members__in=[request.user.id]).reverse()
-    
+    # Get one page of the user's conversations, with their latest message and the user's unread count
+    INBOX_PAGE_SIZE = 20
+    read_count = ReadMarker.objects.filter(conversation=OuterRef('pk'), user=request.user).values('read_count')[:1]
+    convos = Conversation.objects.filter(userGroup__members=request.user) \
+        .select_related('userGroup', 'last_message__sender') \
+        .prefetch_related('userGroup__members') \
+        .annotate(unread=F('message_count') - Coalesce(Subquery(read_count), 0))
+    convos, next_cursor = keyset_page(convos, 'updated', request.GET.get('after'), INBOX_PAGE_SIZE, descending=True)
+
     # Prep the convos to display
     names = []
     for convo in convos:
         # Preview the most recent message
-        first_message = Message.objects.filter(conversation=convo).last()
+        first_message = convo.last_message
 
-        # Get the users' full names
+        # Get the users' full names, in the order they appear in the conversation name
+        members = {member.username: member for member in convo.userGroup.members.all()}
         username_list = convo.name.split('-')
-        username_list.remove(request.user.username)
-        name_list = []
-        for username in username_list:
-            name_list.append(User.objects.get(username=username).get_full_name())
+        name_list = [
+            members[username].get_full_name() for username in username_list
+            if username != request.user.username and username in members
+        ]
 
         # Name the conversation based on users' full names
         name = ', '.join(name_list)
@@ -142,41 +211,170 @@ def inbox(request):
 
     user_name = request.user.get_full_name()
     
-    context = {'names': names, 'user_name': user_name}
+    context = {'names': names, 'user_name': user_name, 'next_cursor': next_cursor}
     return render(request, 'messaging/inbox.html', context)
 
+@login_required(login_url='login')
 def conversation(request, pk):
     """View for an individual conversation."""
-    convo = Conversation.objects.get(id=pk)
-    messages = Message.objects.filter(conversation=convo)
-    members = []
-    for member in convo.userGroup.members.all():
-        members.append(member)
+    convo = get_object_or_404(Conversation, id=pk, userGroup__members=request.user)
+    members = list(convo.userGroup.members.order_by('username'))
 
     if request.method == 'POST':
-        new_message = Message.objects.create(
-            sender=request.user,
-            conversation=convo,
-            body=request.POST.get('body')[3:-4],
-            points=get_points(request.POST.get('body')[3:-4].replace("&nbsp;", "")),
-        )
-        
-        send_points(new_message, members, new_message.sender)
+        new_message = post_message(request.user, convo, request.POST.get('body', ''))
+        sent = send_points(new_message, members, new_message.sender)
+
+        # Push the message to the other members' open pages, instead of them having to reload
+        broadcast_message(new_message, _recipient_ids(members, request.user) if sent else [])
         return redirect('conversation', pk=convo.id)
 
+    # Everything up to the latest message has now been seen by this user
+    mark_read(request.user.id, convo)
+
+    # Only render the newest messages - older ones are loaded on demand. The rendered list is cached
+    # until the next message, so the page is only fetched when the template misses the cache
+    page = SimpleLazyObject(lambda: get_message_page(convo))
+    messages = SimpleLazyObject(lambda: page[0])
+    older_cursor = SimpleLazyObject(lambda: page[1])
+
     first_name = request.user.first_name
-    context = {'convo': convo, 'messages': messages, 'first_name': first_name, 'members': members}
+    context = {
+        'convo': convo,
+        'messages': messages,
+        'older_cursor': older_cursor,
+        'first_name': first_name,
+        'viewer_id': request.user.id,
+        'render_version': conversation_version(convo.id),
+        'members': members,
+    }
     return render(request, 'messaging/conversation.html', context)
 
+@login_required(login_url='login')
+def older_messages(request, pk):
+    """View that renders the page of messages before a cursor, for a conversation's "load older" button."""
+    convo = get_object_or_404(Conversation, id=pk, userGroup__members=request.user)
+    messages, older_cursor = get_message_page(convo, request.GET.get('before'))
+
+    context = {
+        'convo': convo,
+        'messages': messages,
+        'older_cursor': older_cursor,
+        'viewer_id': request.user.id,
+        'render_version': conversation_version(convo.id),
+    }
+    return render(request, 'messaging/message_list.html', context)
+
+def _member_conversation(user: User, pk) -> Conversation | None:
+    """Gets a conversation by id, if the user is one of its members."""
+    return Conversation.objects.filter(id=pk, userGroup__members=user).first()
+
+def _messages_after(convo: Conversation, after: int, since, limit: int) -> tuple[list[Message], int]:
+    """
+    Gets a conversation's messages after a message id (and, if given, a timestamp).
+
+    :param convo - the conversation
+    :param after - the id of the last message the client has
+    :param since - (optional) the time of the last message the client has
+    :param limit - the most messages to get
+    :return the messages, oldest first, and the id to wait for messages after if there weren't any
+    """
+    messages = Message.objects.filter(conversation=convo).select_related('sender').order_by('id')
+    if since:
+        page = list(messages.filter(created__gt=since, id__gt=after)[:limit])
+        # If nothing's been sent since then, only messages after the latest one are new
+        return page, after if page else max(after, convo.last_message_id or 0)
+
+    # The conversation already knows its latest message, so there's no need to look if it's not newer
+    if (convo.last_message_id or 0) <= after:
+        return [], after
+
+    return list(messages.filter(id__gt=after)[:limit]), after
+
+def _latest_message_id(convo_id: int) -> int:
+    """Gets the id of a conversation's latest message (0 if there isn't one)."""
+    return Conversation.objects.filter(id=convo_id).values_list('last_message_id', flat=True).first() or 0
+
+async def messages_since(request, pk):
+    """
+    View that returns a conversation's messages after a message id (`?after=`) or timestamp (`?since=`) as JSON.
+
+    With `?timeout=` (in seconds) it long-polls: if there's nothing new yet, it waits for a message
+    instead of returning straight away. It's async so a waiting poll doesn't hold a worker thread, and
+    it's woken by the channel layer broadcast of the new message rather than polling the database.
+    """
+    MAX_MESSAGES = 100
+    MAX_TIMEOUT = 25
+
+    # Messages that weren't broadcast to this process (e.g. sent from the admin, or from another process
+    # with the in-memory channel layer) are still picked up by checking the database this often
+    RECHECK_INTERVAL = 5
+
+    # `login_required` only wraps sync views in this version of Django
+    user = await sync_to_async(lambda: request.user if request.user.is_authenticated else None)()
+    if user is None:
+        return redirect_to_login(request.get_full_path(), 'login')
+
+    convo = await sync_to_async(_member_conversation)(user, pk)
+    if convo is None:
+        return JsonResponse({'error': "Conversation not found"}, status=404)
+
+    try:
+        after = int(request.GET.get('after', 0))
+        timeout = min(max(float(request.GET.get('timeout', 0)), 0), MAX_TIMEOUT)
+    except ValueError:
+        return JsonResponse({'error': "after and timeout must be numbers"}, status=400)
+
+    since = request.GET.get('since')
+    if since:
+        since = parse_datetime(since)
+        if since is None:
+            return JsonResponse({'error': "since must be an ISO 8601 timestamp"}, status=400)
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+
+    page, after = await sync_to_async(_messages_after)(convo, after, since, MAX_MESSAGES)
+
+    channel_layer = get_channel_layer()
+    if not page and timeout and channel_layer is not None:
+        group = conversation_group(convo.id)
+        channel = await channel_layer.new_channel()
+        await channel_layer.group_add(group, channel)
+        try:
+            # Checked again after joining the group, so a message sent in between isn't missed
+            deadline = time.monotonic() + timeout
+            latest_id = await sync_to_async(_latest_message_id)(convo.id)
+            while latest_id <= after and (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    await asyncio.wait_for(channel_layer.receive(channel), min(remaining, RECHECK_INTERVAL))
+                except asyncio.TimeoutError:
+                    pass
+
+                latest_id = await sync_to_async(_latest_message_id)(convo.id)
+        finally:
+            await channel_layer.group_discard(group, channel)
+
+        if latest_id > after:
+            convo.last_message_id = latest_id
+            page, after = await sync_to_async(_messages_after)(convo, after, None, MAX_MESSAGES)
+
+    if page:
+        # The page is showing these live, so they've been read
+        await sync_to_async(mark_read_through)(user.id, convo.id, page[-1].id)
+
+    return JsonResponse({'messages': [serialize_message(message) for message in page], 'last_id': page[-1].id if page else after})
+
 @login_required(login_url='login')
 def profile(request, pk):
     """View for a user's own profile."""
     current_user = request.user
-    user = User.objects.get(id=pk)
+    user = User.objects.select_related('profile').get(id=pk)
     profile = user.profile
-    purchases = Purchase.objects.filter(buyer=profile)
 
-    context = {'current_user': current_user, 'user': user, 'profile': profile, 'purchases': purchases}
+    # Purchases and points come from the cached summary, and the products from the cached catalog
+    summary = profile_summary(profile)
+    products = owned_products(summary)
+
+    context = {'current_user': current_user, 'user': user, 'profile': profile, 'summary': summary, 'products': products}
     return render(request, 'messaging/profile.html', context)
 
 @login_required(login_url='login')
@@ -240,21 +438,17 @@ def update_profile(request, pk):
     return render(request, 'messaging/login_register.html', context)
 
 def leaderboard(request):
-    """View for the global leaderboard."""
-    # Get only the top users that have their points public
-    NUM_USERS_TO_SHOW = 10
-    user_points = Profile.objects.filter(displayPoints=True).values('allTimePoints', 'user').order_by('-allTimePoints', 'user__username')[:NUM_USERS_TO_SHOW]
-    # Prepare data for each user on the leaderboard
-    users = []
-    points = []
-    for obj in user_points:
-        user = obj['user']
-        point = obj['allTimePoints']
-        points.append(point)
-        users.append(User.objects.get(id=user))
-
-    user_data = list(zip(users, points))
-    context = {'user_data': user_data, 'num_entries': len(user_data)}
+    """View for the global leaderboard, all time or over the last week/month."""
+    window = request.GET.get('window')
+    if window in LEADERBOARD_WINDOWS:
+        # Sum the daily rollups in the window, never the messages themselves
+        user_data = windowed_top_users(LEADERBOARD_WINDOWS[window])
+    else:
+        # Get only the top users that have their points public - kept up to date in the cache
+        window = None
+        user_data = top_users()
+
+    context = {'user_data': user_data, 'num_entries': len(user_data), 'window': window}
 
     if len(user_data) > 3:
         context['subset1'] = user_data[:3]
@@ -262,73 +456,63 @@ def leaderboard(request):
 
     return render(request, 'messaging/leaderboard.html', context)
 
+@login_required(login_url='login')
+def leaderboard_around_me(request):
+    """View for the user's own leaderboard rank, and the users ranked around them."""
+    profile = request.user.profile
+    rank, nearby = rank_around(profile)
+
+    context = {'rank': rank, 'nearby': nearby}
+    return render(request, 'messaging/leaderboard_around.html', context)
+
 @login_required(login_url='login')
 def create_convo(request):
     """View to create a conversation for a user."""
-    def _make_group_convo(group_name: str, send_to_list: list[str]) -> tuple[UserGroup, Conversation]:
+    def _get_group_convo(group_name: str, users: list[User]) -> Conversation:
         """
-        Make a group conversation.
-        
-        :param group_name - the name of the UserGroup
-        :param send_to_list - a list of usernames to add to the conversation
-        :return a tuple with the new UserGroup and Conversation
-        """
-        user_group = UserGroup.objects.create(name=group_name)
-        user_group.save()
+        Get the conversation between exactly a set of users, making it if needed.
 
-        for username in send_to_list:
-            user_group.members.add(User.objects.get(username=username))
+        :param group_name - the name to give the UserGroup if it's new
+        :param users - every user in the conversation
+        :return the group's Conversation
+        """
+        member_key = get_member_key(user.id for user in users)
+        convo = Conversation.objects.filter(userGroup__memberKey=member_key).first()
+        if convo is not None:
+            return convo
 
-        convo = Conversation.objects.create(name=group_name, userGroup=user_group)
-        convo.save()
-        
-        return user_group, convo
+        try:
+            with transaction.atomic():
+                user_group = UserGroup.objects.create(name=group_name, memberKey=member_key)
+                user_group.members.add(*users)
+                return Conversation.objects.create(name=group_name, userGroup=user_group)
+        except IntegrityError:
+            # Someone else made the same group at the same time
+            return Conversation.objects.get(userGroup__memberKey=member_key)
 
     # Create a message if the user wants to
     form = MessageSend()
     if request.method == 'POST':
-        send_to = request.POST.get('send_to')
-        send_to = send_to.replace(" ", "")
-        send_to_list = send_to.split(",")
+        send_to = request.POST.get('send_to', '')
+        send_to = send_to.replace(" ", "").lower()
+        send_to_list = [username for username in send_to.split(",") if username]
         send_to_list.append(request.user.username)
         group_name = "-".join(send_to_list)
-        body = request.POST.get('body')
-
-        # Create the user group and the conversation from it
-        convo = None
-        user_group = None
+        body = request.POST.get('body', '')
 
-        # Query for if the user group exists
-        user_group_Qset = UserGroup.objects.filter(reduce(operator.and_, (Q(name__icontains=x) for x in send_to_list)))
-        try:
-            # Make new convo if needed, or get existing
-            if not user_group_Qset.exists():
-                user_group, convo = _make_group_convo(group_name, send_to_list)
-            else:
-                user_group = UserGroup.objects.get(id=user_group_Qset[0].id)
-                if user_group.members.all().count() > len(send_to_list):
-                    user_group, convo = _make_group_convo(group_name, send_to_list)
-                else:
-                    convo = user_group.conversation
+        # Look every recipient up at once
+        users = list(User.objects.filter(username__in=send_to_list))
+        unknown = set(send_to_list) - {user.username for user in users}
+        if unknown:
+            messages.error(request, f"No users named {', '.join(sorted(unknown))}")
+        else:
+            convo = _get_group_convo(group_name, users)
 
             # Create new message
-            new_message = Message.objects.create(
-                sender=request.user,
-                conversation=convo,
-                body=body[3:-4],
-                points=get_points(body[3:-4].replace("&nbsp;", "")),
-            )
-
-            members = []
-            for member in convo.userGroup.members.all():
-                members.append(member)
-
-            send_points(new_message, members, new_message.sender)
+            new_message = post_message(request.user, convo, body)
+            sent = send_points(new_message, users, new_message.sender)
+            broadcast_message(new_message, _recipient_ids(users, request.user) if sent else [])
             return redirect('conversation', pk=convo.id)
 
-        except ObjectDoesNotExist:
-            # There can be issues with ObjectDoesNotExist throwing when it shouldn't - not bug-causing
-            pass
-
     context = {'form': form}
     return render(request, 'messaging/new_convo.html', context)
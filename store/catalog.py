@@ -0,0 +1,101 @@
+from django.core.cache import cache
+import time
+
+from .models import Product, Purchase
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+# The catalog is invalidated whenever it changes, so this only bounds how long unused versions linger
+CATALOG_TIMEOUT = 60 * 60
+
+NUM_RECENT_PURCHASERS = 3
+
+def catalog_version() -> int:
+    """
+    Gets the catalog's current version, which is part of every cache key for it.
+
+    :return the version number
+    """
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = _start_version()
+
+    return version
+
+def _start_version() -> int:
+    """
+    Starts the version counter if it's missing (e.g. evicted), from the time rather than 1 so it never
+    goes back to a version that may still have stale entries cached under it.
+    """
+    cache.add(CATALOG_VERSION_KEY, time.time_ns(), None)
+    return cache.get(CATALOG_VERSION_KEY)
+
+def invalidate_catalog() -> None:
+    """Moves the catalog on to a new version, so the cached product list and rendered catalog are rebuilt."""
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        _start_version()
+
+def catalog_products() -> list[Product]:
+    """
+    Gets every product, most popular first, from the cache when it's warm or one query when it's not.
+
+    :return a list of products
+    """
+    key = f'catalog:products:{catalog_version()}'
+    products = cache.get(key)
+    if products is None:
+        products = list(Product.objects.order_by('-amount_sold', 'name'))
+        cache.set(key, products, CATALOG_TIMEOUT)
+
+    return products
+
+def catalog_etag(request, *args, **kwargs) -> str:
+    """Gets the ETag of the catalog's current version, for conditional requests."""
+    return f'catalog-{catalog_version()}'
+
+def serialize_product(product: Product) -> dict:
+    """
+    Gets a product's catalog fields for the JSON catalog.
+
+    :param product - the product
+    :return a dict of the product's fields
+    """
+    return {
+        'id': product.id,
+        'name': product.name,
+        'point_cost': product.point_cost,
+        'amount_sold': product.amount_sold,
+        'image': product.image.url if product.image else None,
+    }
+
+def _recent_purchasers_key(product_id: int) -> str:
+    """Gets the cache key of a product's recent purchasers."""
+    return f'catalog:purchasers:{product_id}'
+
+def recent_purchasers(product_id: int) -> list[str]:
+    """
+    Gets the full names of a product's most recent purchasers, from the cache when it's warm or one query when it's not.
+
+    :param product_id - the id of the product
+    :return a list of full names, most recent first
+    """
+    key = _recent_purchasers_key(product_id)
+    names = cache.get(key)
+    if names is None:
+        buyers = Purchase.objects.filter(product_id=product_id).order_by('-timestamp') \
+            .values_list('buyer__user__first_name', 'buyer__user__last_name')[:NUM_RECENT_PURCHASERS]
+        names = [f'{first_name} {last_name}'.strip() for first_name, last_name in buyers]
+        cache.set(key, names, CATALOG_TIMEOUT)
+
+    return names
+
+def invalidate_recent_purchasers(product_id: int) -> None:
+    """
+    Drops a product's cached recent purchasers when one of its purchases is added or removed.
+
+    The list isn't patched in place: concurrent purchases (e.g. during a drop) would each read it and
+    overwrite the other's name. The next page view reloads it in one indexed query instead.
+    """
+    cache.delete(_recent_purchasers_key(product_id))
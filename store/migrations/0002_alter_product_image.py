@@ -0,0 +1,19 @@
+# Generated by Django 4.0.2 on 2026-10-18 10:25
+
+from django.db import migrations, models
+import store.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='image',
+            field=models.ImageField(null=True, upload_to=store.models.get_image_path),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.0.2 on 2026-10-18 10:25
+
+from django.db import migrations, models
+
+from messaging.migration_operations import AddIndexConcurrentlyIfSupported
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('store', '0002_alter_product_image'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyIfSupported(
+            model_name='purchase',
+            index=models.Index(fields=['product', 'timestamp'], name='purchase_product_time_idx'),
+        ),
+        AddIndexConcurrentlyIfSupported(
+            model_name='purchase',
+            index=models.Index(fields=['buyer', 'product'], name='purchase_buyer_product_idx'),
+        ),
+    ]
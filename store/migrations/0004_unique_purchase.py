@@ -0,0 +1,32 @@
+# Generated by Django 4.0.2 on 2026-10-18 10:50
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicate_purchases(apps, schema_editor):
+    """Keeps only the first purchase of each product by each user, so they can be made unique."""
+    Purchase = apps.get_model('store', 'Purchase')
+
+    first_ids = Purchase.objects.values('buyer', 'product').annotate(first=Min('id')).values('first')
+    Purchase.objects.exclude(id__in=first_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0003_purchase_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_purchases, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='purchase',
+            constraint=models.UniqueConstraint(fields=('buyer', 'product'), name='unique_purchase'),
+        ),
+        # The constraint's index replaces this one
+        migrations.RemoveIndex(
+            model_name='purchase',
+            name='purchase_buyer_product_idx',
+        ),
+    ]
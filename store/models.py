@@ -19,6 +19,7 @@ class Product(models.Model):
     point_cost = models.IntegerField()
     amount_sold = models.IntegerField()
     image = models.ImageField(upload_to=get_image_path, null=True)
+    thumbnails = models.JSONField(default=dict, blank=True) # Resized copies of `image` - see messaging.thumbnails
     
     class Meta:
         # Order items alphabetically by default
@@ -33,5 +34,15 @@ class Purchase(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     timestamp = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            # A user can only own a product once - also the index for whether they already own it
+            models.UniqueConstraint(fields=['buyer', 'product'], name='unique_purchase'),
+        ]
+        indexes = [
+            # A product's most recent purchasers
+            models.Index(fields=['product', 'timestamp'], name='purchase_product_time_idx'),
+        ]
+
     def __str__(self):
         return f"{self.buyer}: {self.product}"
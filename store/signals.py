@@ -0,0 +1,28 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalog import invalidate_catalog, invalidate_recent_purchasers
+from .models import Product, Purchase
+from messaging.profiles import invalidate_profile_summaries
+from messaging.thumbnails import schedule_thumbnails
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_catalog_on_product_change(sender, **kwargs):
+    """Drops the cached catalog when a product is edited, added, removed or sold."""
+    invalidate_catalog()
+
+@receiver([post_save, post_delete], sender=Purchase)
+def invalidate_purchasers_on_purchase_change(sender, instance, **kwargs):
+    """Drops a product's cached recent purchasers when it's bought (or a purchase is removed), once that's committed."""
+    transaction.on_commit(lambda: invalidate_recent_purchasers(instance.product_id))
+
+@receiver([post_save, post_delete], sender=Purchase)
+def invalidate_buyer_summary(sender, instance, **kwargs):
+    """Drops the buyer's cached profile summary when they buy (or lose) a product, once the purchase is committed."""
+    transaction.on_commit(lambda: invalidate_profile_summaries([instance.buyer_id]))
+
+@receiver(post_save, sender=Product)
+def schedule_product_thumbnails(sender, instance, **kwargs):
+    """Queues thumbnails for a newly uploaded product image."""
+    schedule_thumbnails(instance)
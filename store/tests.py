@@ -1,10 +1,16 @@
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from numpy import exp
+from unittest.mock import patch
 
 from .models import Product, Purchase
-from messaging.models import Profile
+from hackoverflow.testing import QueryBudgetMixin
+from messaging.models import LedgerEntry, Profile
 
 # Helper Functions
 def create_product(name: str, cost: int, amt_sold: int=0) -> Product:
@@ -33,8 +39,46 @@ def create_profile(username: str, first_name: str, last_name: str, wallet: int=0
     user = User.objects.create_user(username=username, password=password, email=email, first_name=first_name, last_name=last_name)
     return Profile.objects.create(user=user, wallet=wallet) 
 
+def explain_preferring_indexes(queryset) -> str:
+    """
+    Helper function that gets the query plan for a queryset.
+
+    The test tables are tiny, so PostgreSQL would always pick a sequential scan - they're turned off
+    for the rest of the test's transaction to see which index the query would use on real data.
+
+    :param queryset - the query to explain
+    :return the query plan as a str
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    return queryset.explain()
+
+# Model Tests
+class PurchaseQueryPlanTests(TestCase):
+    def test_recent_purchasers_uses_index(self):
+        """Tests that getting a product's most recent purchases uses the (product, timestamp) index."""
+        product = create_product('test product', 1)
+
+        plan = explain_preferring_indexes(Purchase.objects.filter(product=product).order_by('-timestamp')[:3])
+        self.assertIn('purchase_product_time_idx', plan, msg=f"Expected the recent purchasers query to use its index, but the plan was: {plan}")
+
+    def test_already_owned_uses_index(self):
+        """Tests that checking if a user owns a product uses the unique (buyer, product) constraint's index."""
+        profile = create_profile("mscott", "Michael", "Scott")
+        product = create_product('test product', 1)
+
+        plan = explain_preferring_indexes(Purchase.objects.filter(buyer=profile, product=product))
+        # SQLite names the index behind a unique constraint itself
+        self.assertRegex(plan, 'unique_purchase|sqlite_autoindex_store_purchase', msg=f"Expected the ownership query to use its index, but the plan was: {plan}")
+
 # View Tests
-class IndexViewTests(TestCase):
+class IndexViewTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        # The catalog is cached, and the cache outlives each test's database
+        cache.clear()
+
     def test_index_view_shows_all_products(self):
         """Tests that the index view shows all the expected products, in order of popularity"""
         expected_products = []
@@ -48,7 +92,72 @@ class IndexViewTests(TestCase):
             msg="Expected products to be displayed in order of popularity, but failed."
         )
 
-class BuyViewTests(TestCase):
+    def test_index_view_cached(self):
+        """Tests that the catalog is served without any queries once it's been rendered."""
+        _ = create_product("Product 1", 1)
+        _ = self.client.get(reverse('index'))
+
+        with self.assertNumQueries(0):
+            _ = self.client.get(reverse('index'))
+
+    def test_index_view_product_edit_invalidates(self):
+        """Tests that editing a product shows up in the catalog straight away."""
+        product = create_product("Product 1", 1)
+        _ = self.client.get(reverse('index'))
+
+        product.point_cost = 25
+        product.save()
+
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, "Cost: 25 points", msg_prefix="Expected the catalog to show the new cost")
+
+    def test_index_view_purchase_invalidates(self):
+        """Tests that buying a product updates its sold count in the catalog."""
+        profile = create_profile("mscott", "Michael", "Scott", wallet=10)
+        product = create_product("Product 1", 1)
+        _ = self.client.get(reverse('index'))
+
+        self.client.force_login(profile.user)
+        _ = self.client.post(reverse('buy_page', args=[product.id]))
+
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, "1 sold", msg_prefix="Expected the catalog to show the purchase")
+
+    def test_index_and_catalog_logged_in_within_budget(self):
+        """Tests that the store pages stay within their query budgets for a signed in user with a cold cache."""
+        profile = create_profile("mscott", "Michael", "Scott")
+        _ = create_product("Product 1", 1)
+        self.client.force_login(profile.user)
+
+        for name in ['index', 'catalog']:
+            cache.clear()
+            response = self.client.get(reverse(name))
+            self.assertWithinQueryBudget(response)
+
+    def test_catalog_json_etag(self):
+        """Tests that the JSON catalog is only sent again once it's changed."""
+        product = create_product("Product 1", 1)
+
+        response = self.client.get(reverse('catalog'))
+        etag = response['ETag']
+        self.assertEquals(
+            response.json()['products'],
+            [{'id': product.id, 'name': "Product 1", 'point_cost': 1, 'amount_sold': 0, 'image': None}],
+            msg=f"Expected the catalog to list the product, but got {response.json()}."
+        )
+
+        response = self.client.get(reverse('catalog'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 304, msg=f"Expected an unchanged catalog to be a 304, but got {response.status_code}.")
+
+        _ = create_product("Product 2", 1)
+        response = self.client.get(reverse('catalog'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 200, msg=f"Expected a changed catalog to be sent again, but got {response.status_code}.")
+
+class BuyViewTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        # Recent purchasers are cached, and the cache outlives each test's database
+        cache.clear()
+
     def test_buy_view_shows_current_product_only(self):
         """Tests that the buy view shows only one product."""
         profile = create_profile("mscott", "Michael", "Scott")
@@ -69,7 +178,7 @@ class BuyViewTests(TestCase):
         product = create_product('test product', 1)
 
         self.client.force_login(profile.user)
-        _ = self.client.get(reverse('buy_page', args=[product.id]))
+        _ = self.client.post(reverse('buy_page', args=[product.id]))
         profile.refresh_from_db()
         self.assertEquals(
             profile.wallet,
@@ -83,7 +192,7 @@ class BuyViewTests(TestCase):
         expected_product = create_product('test product', 1)
 
         self.client.force_login(profile.user)
-        _ = self.client.get(reverse('buy_page', args=[expected_product.id]))
+        _ = self.client.post(reverse('buy_page', args=[expected_product.id]))
         profile.refresh_from_db()
 
         actual_product = Purchase.objects.get(buyer=profile).product
@@ -101,11 +210,11 @@ class BuyViewTests(TestCase):
         product = create_product('test product', 1)
 
         self.client.force_login(profile.user)
-        _ = self.client.get(reverse('buy_page', args=[product.id]))
+        _ = self.client.post(reverse('buy_page', args=[product.id]))
         profile.refresh_from_db()
 
         # Buy again!
-        _ = self.client.get(reverse('buy_page', args=[product.id]))
+        _ = self.client.post(reverse('buy_page', args=[product.id]))
         profile.refresh_from_db()
 
         self.assertEquals(
@@ -120,7 +229,7 @@ class BuyViewTests(TestCase):
         product = create_product('test product', 1)
 
         self.client.force_login(profile.user)
-        _ = self.client.get(reverse('buy_page', args=[product.id]))
+        _ = self.client.post(reverse('buy_page', args=[product.id]))
         product.refresh_from_db()
 
         self.assertEquals(
@@ -129,13 +238,28 @@ class BuyViewTests(TestCase):
             "Expected the product to not be bought if the user doesn't have enough points, but it failed."
         )
 
+    def test_buy_page_view_records_ledger_entry(self):
+        """Tests that buying a product records the points spent in the ledger."""
+        profile = create_profile("mscott", "Michael", "Scott", 10)
+        product = create_product('test product', 4)
+
+        self.client.force_login(profile.user)
+        _ = self.client.post(reverse('buy_page', args=[product.id]))
+
+        entry = LedgerEntry.objects.get(profile=profile)
+        self.assertEquals(
+            (entry.kind, entry.wallet),
+            (LedgerEntry.PURCHASE, -4),
+            "Expected the purchase to be recorded in the ledger as -4 points, but it wasn't."
+        )
+
     def test_buy_page_view_update_product_purchase_count(self):
         """Tests that, once a product is bought, the number bought increases."""
         profile = create_profile("mscott", "Michael", "Scott", 10)
         product = create_product('test product', 1)
 
         self.client.force_login(profile.user)
-        _ = self.client.get(reverse('buy_page', args=[product.id]))
+        _ = self.client.post(reverse('buy_page', args=[product.id]))
         product.refresh_from_db()
 
         self.assertEquals(
@@ -143,3 +267,112 @@ class BuyViewTests(TestCase):
             1,
             "Expected the product to increment its amount sold when sold successfully, but it failed."
         )
+
+    def test_buy_page_view_get_not_allowed(self):
+        """Tests that a product can't be bought with a GET, e.g. by following a link."""
+        profile = create_profile("mscott", "Michael", "Scott", 10)
+        product = create_product('test product', 1)
+
+        self.client.force_login(profile.user)
+        response = self.client.get(reverse('buy_page', args=[product.id]))
+
+        self.assertEquals(response.status_code, 405, msg=f"Expected buying with a GET to be refused, but got {response.status_code}.")
+        self.assertFalse(Purchase.objects.exists(), msg="Expected nothing to be bought with a GET, but it was.")
+
+    def test_buy_page_view_duplicate_rolled_back(self):
+        """Tests that buying an owned product again changes nothing, and says why."""
+        profile = create_profile("mscott", "Michael", "Scott", 10)
+        product = create_product('test product', 1)
+
+        self.client.force_login(profile.user)
+        _ = self.client.post(reverse('buy_page', args=[product.id]))
+        response = self.client.post(reverse('buy_page', args=[product.id]), follow=True)
+        product.refresh_from_db()
+
+        self.assertContains(response, "Already purchased item", msg_prefix="Expected an error for buying an owned product")
+        self.assertEquals(product.amount_sold, 1, msg=f"Expected the product to be sold once, but it was sold {product.amount_sold} times.")
+        self.assertEquals(LedgerEntry.objects.count(), 1, msg=f"Expected one purchase in the ledger, but found {LedgerEntry.objects.count()}.")
+
+    def test_buy_page_view_stale_product_no_lost_sales(self):
+        """Tests that a sale made while a purchase is in progress isn't overwritten by the product as that request read it."""
+        profile = create_profile("mscott", "Michael", "Scott", 10)
+        product = create_product('test product', 1)
+        get_product = Product.objects.get
+
+        def get_then_sell(*args, **kwargs):
+            # Another buyer's sale lands between this request reading the product and saving its own sale
+            stale = get_product(*args, **kwargs)
+            Product.objects.filter(id=stale.id).update(amount_sold=F('amount_sold') + 1)
+            return stale
+
+        # The other sale's query runs inside this request, so it's left out of the budget check
+        client = Client()
+        client.force_login(profile.user)
+        with patch.object(Product.objects, 'get', side_effect=get_then_sell):
+            _ = client.post(reverse('buy_page', args=[product.id]))
+        product.refresh_from_db()
+
+        self.assertEquals(product.amount_sold, 2, msg=f"Expected both sales to be counted, but {product.amount_sold} were.")
+
+    def test_buy_view_recent_purchasers_ring(self):
+        """Tests that the product page shows the last 3 buyers, newest first, kept up to date by each purchase."""
+        product = create_product('test product', 1)
+        buyers = [create_profile(f"user{i}", "User", f"{i}", 10) for i in range(4)]
+        self.client.force_login(buyers[0].user)
+        _ = self.client.get(reverse('buy', args=[product.id]))
+
+        for buyer in buyers:
+            self.client.force_login(buyer.user)
+            with self.captureOnCommitCallbacks(execute=True):
+                _ = self.client.post(reverse('buy_page', args=[product.id]))
+
+        response = self.client.get(reverse('buy', args=[product.id]))
+        self.assertEquals(
+            response.context['recent_purchasers'],
+            ["User 3", "User 2", "User 1"],
+            msg=f"Expected the 3 most recent buyers, but got {response.context['recent_purchasers']}."
+        )
+
+    def test_buy_view_recent_purchasers_concurrent(self):
+        """Tests that a purchase made while another is being recorded still shows up, instead of being overwritten."""
+        product = create_product('test product', 1)
+        buyer1 = create_profile("mscott", "Michael", "Scott", 10)
+        buyer2 = create_profile("dschrute", "Dwight", "Schrute", 10)
+        self.client.force_login(buyer1.user)
+        _ = self.client.get(reverse('buy', args=[product.id]))
+
+        def get_then_buy(*args, **kwargs):
+            # Dwight buys it from another process in between
+            with self.captureOnCommitCallbacks(execute=True):
+                _ = Purchase.objects.create(buyer=buyer2, product=product)
+            return product
+
+        # A plain client, since the purchase in between goes over the view's query budget
+        client = Client()
+        client.force_login(buyer1.user)
+        with patch.object(Product.objects, 'get', side_effect=get_then_buy), self.captureOnCommitCallbacks(execute=True):
+            _ = client.post(reverse('buy_page', args=[product.id]))
+
+        response = self.client.get(reverse('buy', args=[product.id]))
+        self.assertCountEqual(
+            response.context['recent_purchasers'],
+            ["Michael Scott", "Dwight Schrute"],
+            msg=f"Expected both buyers, but got {response.context['recent_purchasers']}."
+        )
+
+    def test_buy_view_recent_purchasers_cached(self):
+        """Tests that the product page doesn't query purchases or users for its recent purchasers once cached."""
+        product = create_product('test product', 1)
+        profile = create_profile("mscott", "Michael", "Scott", 10)
+        Purchase.objects.create(buyer=profile, product=product)
+        self.client.force_login(profile.user)
+        _ = self.client.get(reverse('buy', args=[product.id]))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('buy', args=[product.id]))
+
+        self.assertEquals(response.context['recent_purchasers'], ["Michael Scott"], msg=f"Expected the buyer's name, but got {response.context['recent_purchasers']}.")
+        self.assertFalse(
+            any('store_purchase' in query['sql'] for query in queries.captured_queries),
+            msg="Expected the recent purchasers to come from the cache, but purchases were queried."
+        )
@@ -6,6 +6,7 @@ from . import views
 # All possible url patterns
 urlpatterns = [
     path('', views.index, name='index'),
+    path('catalog.json', views.catalog, name='catalog'),
     path('buy/<str:pk>/', views.buy, name='buy'),
     path('buy_page/<str:pk>/', views.buy_page, name='buy_page'),
 ]
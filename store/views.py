@@ -1,65 +1,76 @@
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import JsonResponse
 from django.shortcuts import redirect, render
+from django.utils.functional import SimpleLazyObject
+from django.views.decorators.http import condition, require_POST
 
+from .catalog import (
+    CATALOG_TIMEOUT, catalog_etag, catalog_products, catalog_version, invalidate_catalog, recent_purchasers,
+    serialize_product,
+)
 from .models import Product, Purchase
+from messaging.ledger import record_purchase
 from messaging.models import Profile
 
 def index(request):
     """View for the main page of products."""
-    # Order by popularity
-    products = Product.objects.all().order_by('-amount_sold', 'name')
+    # Ordered by popularity and cached - only fetched if the rendered catalog isn't cached too
+    products = SimpleLazyObject(catalog_products)
 
-    context = {'products': products}
+    context = {'products': products, 'catalog_version': catalog_version(), 'catalog_timeout': CATALOG_TIMEOUT}
     return render(request, 'store/index.html', context)
 
+@condition(etag_func=catalog_etag)
+def catalog(request):
+    """View for the catalog as JSON, with an ETag so polling clients only download it when it changes."""
+    products = [serialize_product(product) for product in catalog_products()]
+    return JsonResponse({'products': products})
+
 @login_required(login_url='login')
 def buy(request, pk):
     """View for an individual product."""
-    NUM_BUYERS_SHOW = 3
     product = Product.objects.get(id=pk)
-    recent_purchasers = Purchase.objects.filter(product=product).values('buyer').order_by('-timestamp')[:NUM_BUYERS_SHOW]
 
-    user_names = []
-    for obj in recent_purchasers:
-        user = obj['buyer']
-        user_names.append(User.objects.get(id=user).get_full_name())
+    # Cached until the product's next purchase
+    user_names = recent_purchasers(product.id)
 
     context = {'product': product, 'recent_purchasers': user_names}
     return render(request, 'store/buy.html', context)
 
 @login_required(login_url='login')
+@require_POST
 def buy_page(request, pk):
-    """View that actually lets a user buy a product."""
-    NUM_BUYERS_SHOW = 3
+    """
+    View that actually lets a user buy a product.
+
+    Runs as one transaction: a conditional UPDATE that only debits the buyer if they can afford the
+    product, an INSERT that the unique (buyer, product) constraint stops if they already own it, and an
+    in-place UPDATE of the product's sales. Concurrent purchases can't overdraw a wallet, buy twice or
+    lose a sale.
+    """
     product = Product.objects.get(id=pk)
-    buyer = Profile.objects.get(user=request.user)
-    recent_purchasers = Purchase.objects.filter(product=product).values('buyer').order_by('-timestamp')[:NUM_BUYERS_SHOW]
 
-    user_names = []
-    for obj in recent_purchasers:
-        user = obj['buyer']
-        user_names.append(User.objects.get(id=user).get_full_name())
+    try:
+        with transaction.atomic():
+            debited = Profile.objects.filter(user=request.user, wallet__gte=product.point_cost) \
+                .update(wallet=F('wallet') - product.point_cost)
 
-    context = {'product': product, 'recent_purchasers': user_names}
-    if request.method == 'GET':
-        # Check if user already owns product
-        if Purchase.objects.filter(buyer=buyer).filter(product=product):
-            messages.error(request,'Already purchased item')
-        elif (buyer.wallet - product.point_cost) >= 0:
-            product.amount_sold += 1
-            product.save(update_fields=['amount_sold'])
+            if debited:
+                purchase = Purchase.objects.create(buyer_id=request.user.id, product=product)
+                Product.objects.filter(id=product.id).update(amount_sold=F('amount_sold') + 1)
+                record_purchase(purchase)
+    except IntegrityError:
+        # Already owned - the debit was rolled back with the purchase
+        messages.error(request, 'Already purchased item')
+        return redirect('buy', pk=product.id)
 
-            Purchase.objects.create(
-                buyer=buyer,
-                product=product
-            )
-        
-            buyer.wallet -= product.point_cost
-            buyer.save(update_fields=['wallet'])
-            return redirect('index')
-        else:
-            messages.error(request,'Not enough points')
+    if not debited:
+        messages.error(request, 'Not enough points')
+        return redirect('buy', pk=product.id)
 
-    return render(request, 'store/buy.html', context)
+    # The sales count changed without saving the product, so the catalog has to be told
+    invalidate_catalog()
+    return redirect('index')